@@ -0,0 +1,56 @@
+"""
+Synthetic synonym corpora for the benchmarks.
+
+Item sizes follow a heavy-tailed (Pareto) distribution, as in real synonym sources: most items have one to three terms
+and a few have hundreds.  Terms are built from a chemistry-flavoured vocabulary with a serial number, so every term is
+distinct; some items repeat a term in different case.  With cas=True, a share of the items carry a CAS number with a
+valid check digit, written sometimes zero-padded and sometimes not.
+"""
+import random
+
+from synlist.flowables import cas_check_digit, format_cas
+
+
+WORDS = ['acid', 'methyl', 'chloride', 'sodium', 'ethyl', 'benzene', 'oxide', 'sulfate', 'nitrate', 'carbon',
+         'hydroxide', 'phosphate', 'amine', 'propyl', 'zinc', 'copper', 'glycol', 'ester', 'ketone', 'fluoride',
+         'butyl', 'anhydride', 'acetate', 'dioxide']
+
+
+def item_size(rng, alpha=1.6, largest=500):
+    return min(int(rng.paretovariate(alpha)), largest)
+
+
+def make_cas(rng):
+    n = rng.randint(50, 999999) * 1000 + rng.randint(0, 99) * 10
+    n += cas_check_digit(n)
+    return format_cas(n, pad=rng.random() < 0.3)
+
+
+def make_sets(n_terms, seed=0, cas=False, cas_share=0.4):
+    """
+    :param n_terms: stop once the sets hold at least this many terms
+    :param seed:
+    :param cas: [False] give a share of the items a CAS number
+    :param cas_share: [0.4]
+    :return: a list of lists of terms
+    """
+    rng = random.Random(seed)
+    sets = []
+    count = 0
+    used_cas = set()
+    while count < n_terms:
+        i = len(sets)
+        terms = []
+        for j in range(item_size(rng)):
+            term = '%s %s %d-%d' % (rng.choice(WORDS), rng.choice(WORDS), i, j)
+            if rng.random() < 0.2:
+                term = term.title()
+            terms.append(term)
+        if cas and rng.random() < cas_share:
+            c = make_cas(rng)
+            if c.lstrip('0') not in used_cas:
+                used_cas.add(c.lstrip('0'))
+                terms.insert(rng.randint(0, len(terms)), c)
+        sets.append(terms)
+        count += len(terms)
+    return sets
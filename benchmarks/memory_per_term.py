@@ -0,0 +1,82 @@
+"""
+Compare the memory footprint per term of a SynList / Flowables with its packed copy.
+
+usage: python benchmarks/memory_per_term.py [n_items]
+"""
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the repository, for synlist
+
+from synlist import SynList, Flowables
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    Total size of an object and everything it refers to through lists, sets, dicts and tuples.  Each object is
+    counted once.
+    :param obj:
+    :param seen:
+    :return:
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, set, frozenset, tuple)):
+        size += sum(deep_sizeof(i, seen) for i in obj)
+    return size
+
+
+def synlist_sizeof(s):
+    seen = set()
+    size = 0
+    for attr in ('_list', '_dict', '_name', '_entity', '_cas', '_cas_index'):
+        if hasattr(s, attr):
+            size += deep_sizeof(getattr(s, attr), seen)
+    return size
+
+
+def make_corpus(n_items, seed=0):
+    """
+    Synthetic synonym sets: 1-8 mixed-case terms per item, with a CAS number on a third of the items
+    :param n_items:
+    :param seed:
+    :return:
+    """
+    rng = random.Random(seed)
+    words = ['acid', 'methyl', 'chloride', 'Sodium', 'ethyl', 'Benzene', 'oxide', 'sulfate', 'Nitrate', 'carbon',
+             'hydroxide', 'Phosphate', 'amine', 'propyl', 'Zinc', 'copper']
+    for i in range(n_items):
+        terms = []
+        for j in range(rng.randint(1, 8)):
+            terms.append('%s %s %d-%d' % (rng.choice(words), rng.choice(words), i, j))
+        if i % 3 == 0:
+            terms.append('%d-%02d-%d' % (50 + i, i % 100, i % 10))
+        yield terms
+
+
+def measure(cls, n_items):
+    s = cls()
+    for terms in make_corpus(n_items):
+        s.add_set(terms)
+    n_terms = sum(len(t) for t in s._list if t is not None)
+    before = synlist_sizeof(s)
+    after = s.pack().nbytes()
+    return n_terms, before / n_terms, after / n_terms
+
+
+def main(n_items=100000):
+    print('%-10s %10s %14s %14s %8s' % ('class', 'terms', 'bytes/term', 'packed', 'ratio'))
+    for cls in (SynList, Flowables):
+        n_terms, before, after = measure(cls, n_items)
+        print('%-10s %10d %14.1f %14.1f %8.2f' % (cls.__name__, n_terms, before, after, before / after))
+
+
+if __name__ == '__main__':
+    main(*[int(k) for k in sys.argv[1:]])
@@ -0,0 +1,221 @@
+"""
+Time the hot paths of SynList and Flowables on synthetic corpora (see corpus.py) at several scales, and compare results
+between commits.
+
+usage:
+  python benchmarks/suite.py run [--scales 10000,100000] [--repeat 3] [--classes SynList,Flowables] [--output FILE]
+  python benchmarks/suite.py compare OLD.json NEW.json [--threshold 0.1]
+
+run writes JSON: {"meta": {...}, "results": [{"benchmark", "class", "terms", "ops", "seconds", "per_op_us"}, ...]},
+where seconds is the best of --repeat runs.  Memory is reported as the benchmark "memory", whose result holds
+"bytes_per_term" instead of "seconds" and "per_op_us".  compare matches results by (benchmark, class, terms), prints
+the ratio new / old of each and exits with status 1 if any got slower (or bigger) by more than the threshold.
+
+Scales are numbers of terms; the largest (5M) takes a long time and several GB of memory.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import platform
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the repository, for synlist
+
+from synlist import SynList, Flowables
+from synlist.resolve import resolve
+
+from corpus import make_sets
+from memory_per_term import synlist_sizeof
+
+
+CLASSES = {'SynList': SynList, 'Flowables': Flowables}
+SAMPLE = 100000  # queries per lookup benchmark
+EDITS = 1000  # merges or splits per benchmark
+QUERIES = ['chloride', 'Sodium Oxide', '123-4', 'zinc.*acetate 9', '^acid methyl 1[0-9]-0$']
+
+
+def _time(fn, repeat, setup=None):
+    """
+    Best of repeat runs.  setup() is called untimed before each run and its result is passed to fn.
+    """
+    best = None
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn(arg)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _ingest(cls, sets):
+    s = cls()
+    for terms in sets:
+        s.add_set(terms)
+    return s
+
+
+def _copy(cls, j):
+    return cls.from_json(j, bulk=True)
+
+
+def run_scale(cls, n_terms, repeat, seed=0):
+    """
+    :return: a list of (benchmark, ops, seconds), and the number of terms and bytes per term of the SynList built
+    """
+    sets = make_sets(n_terms, seed=seed, cas=issubclass(cls, Flowables))
+    rng = random.Random(seed)
+    results = []
+
+    def bench(name, ops, fn, setup=None):
+        results.append((name, ops, _time(fn, repeat, setup)))
+
+    bench('add_set', len(sets), lambda _: _ingest(cls, sets))
+    s = _ingest(cls, sets)
+    j = s.serialize()
+
+    terms = [t for ts in sets for t in ts]
+    hits = [rng.choice(terms) for _ in range(SAMPLE)]
+    misses = ['missing %s %d' % (t, k) for k, t in enumerate(hits)]
+    bench('lookup_hit', len(hits), lambda _: [s.index(t) for t in hits])
+    bench('lookup_miss', len(misses), lambda _: [s.index(t) for t in misses])
+    bench('index_many', len(hits), lambda _: s.index_many(hits))
+    rows = [{'term': t} for t in hits]
+    bench('resolve', len(rows), lambda _: sum(1 for _ in resolve(rows, s, 'term')))
+
+    # merge items into the biggest item, one at a time; items with a CAS number are left alone, since two of them
+    # cannot be merged
+    hub = max(range(len(sets)), key=lambda k: len(sets[k]))
+    plain = [ts[0] for k, ts in enumerate(sets) if k != hub and ts and not any(t[0].isdigit() for t in ts)]
+    others = rng.sample(plain, min(EDITS, len(plain)))
+
+    def merge(c):
+        for t in others:
+            c.merge(sets[hub][0], t)
+    bench('merge_hub', len(others), merge, lambda: _copy(cls, j))
+
+    def split(c):
+        for t in movable:
+            c.split_term(t)
+    movable = rng.sample([t for t in terms if not t[0].isdigit() and s.name(t) != t], EDITS)
+    bench('split_term', len(movable), split, lambda: _copy(cls, j))
+
+    bench('search', len(QUERIES), lambda _: [s.search(q) for q in QUERIES])
+    bench('serialize', len(s), lambda _: s.serialize())
+    bench('from_json', len(s), lambda _: cls.from_json(j))
+    bench('from_json_bulk', len(s), lambda _: cls.from_json(j, bulk=True))
+
+    if issubclass(cls, Flowables):
+        numbers = [t for ts in sets for t in ts if t[0].isdigit()]
+        queries = [rng.choice(numbers) for _ in range(SAMPLE)]
+        names = [rng.choice(terms) for _ in range(SAMPLE)]
+        bench('by_cas', len(queries), lambda _: [s.by_cas(q) for q in queries])
+        bench('cas', len(names), lambda _: [s.cas(t) for t in names])
+        bench('cas_many', len(names), lambda _: s.cas_many(names))
+
+    n = len(terms)
+    return results, n, synlist_sizeof(s) / n
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def run(args):
+    meta = {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'commit': _git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': args.repeat}
+    results = []
+    for name in args.classes.split(','):
+        cls = CLASSES[name]
+        for scale in [int(k) for k in args.scales.split(',')]:
+            timings, n, size = run_scale(cls, scale, args.repeat, seed=args.seed)
+            for benchmark, ops, seconds in timings:
+                r = {'benchmark': benchmark, 'class': name, 'terms': scale, 'ops': ops, 'seconds': seconds,
+                     'per_op_us': seconds / ops * 1e6}
+                results.append(r)
+                print('%-10s %9d %-16s %10d ops %12.3f us/op' % (name, scale, benchmark, ops, r['per_op_us']),
+                      file=sys.stderr)
+            results.append({'benchmark': 'memory', 'class': name, 'terms': scale, 'ops': n, 'bytes_per_term': size})
+            print('%-10s %9d %-16s %10d terms %10.1f bytes/term' % (name, scale, 'memory', n, size), file=sys.stderr)
+    doc = {'meta': meta, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(doc, fp, indent=1)
+    else:
+        json.dump(doc, sys.stdout, indent=1)
+    return 0
+
+
+def compare(args):
+    with open(args.old) as fp:
+        old = json.load(fp)
+    with open(args.new) as fp:
+        new = json.load(fp)
+
+    def key(r):
+        return r['benchmark'], r['class'], r['terms']
+
+    def measure(r):
+        """
+        microseconds per operation, or bytes per term for the memory benchmark
+        """
+        return r['per_op_us'] if 'per_op_us' in r else r.get('bytes_per_term')
+    before = {key(r): r for r in old['results']}
+    regressions = 0
+    print('%-10s %9s %-16s %12s %12s %7s' % ('class', 'terms', 'benchmark', 'old', 'new', 'ratio'))
+    for r in new['results']:
+        o = before.get(key(r))
+        if o is None or measure(o) is None or measure(r) is None:
+            continue
+        ratio = measure(r) / measure(o) if measure(o) else float('inf')
+        flag = ''
+        if ratio > 1 + args.threshold:
+            flag = '  SLOWER'
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = '  faster'
+        print('%-10s %9d %-16s %12.3f %12.3f %7.2f%s' % (r['class'], r['terms'], r['benchmark'], measure(o),
+                                                          measure(r), ratio, flag))
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SynList benchmark suite')
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('run')
+    p.add_argument('--scales', default='10000,100000', help='comma-separated numbers of terms (10000 to 5000000)')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--classes', default='SynList,Flowables')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--output', help='write JSON here instead of stdout')
+    p.set_defaults(fn=run)
+    p = commands.add_parser('compare')
+    p.add_argument('old')
+    p.add_argument('new')
+    p.add_argument('--threshold', type=float, default=0.1, help='relative change to report [0.1]')
+    p.set_defaults(fn=compare)
+    args = parser.parse_args(argv)
+    return args.fn(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,2 +1,3 @@
-from .synlist import SynList, InconsistentIndices, EntityFound
+from .synlist import SynList, InconsistentIndices, EntityFound, LoadConflicts
 from .flowables import Flowables, ConflictingCas
+from .frozen import FrozenSynListError
@@ -0,0 +1,64 @@
+"""
+Batched lookups over a column of terms.  Each distinct term is resolved once, however often it repeats, and the
+results are returned aligned with the input.
+"""
+from array import array
+
+
+MISSING = -1
+
+
+def _distinct(terms):
+    """
+    :param terms: an iterable of terms
+    :return: the terms as a sequence, and a dict whose keys are the distinct terms in order of first appearance
+    """
+    if not isinstance(terms, (list, tuple)):
+        terms = list(terms)
+    return terms, dict.fromkeys(terms)
+
+
+class BatchLookup(object):
+    """
+    Mixin providing batched lookups to any class with the _known(term) and name(index) methods of a SynList.
+    """
+    def _resolve_distinct(self, distinct):
+        """
+        Replace each value of a dict of distinct terms with the term's index, or MISSING
+        :param distinct:
+        :return:
+        """
+        for t in distinct:
+            i = self._known(t)
+            distinct[t] = MISSING if i is None else i
+
+    def index_many(self, terms):
+        """
+        Look up many terms at once.
+        :param terms: a sequence (or iterable) of terms
+        :return: array('q') of indices aligned with the input, with -1 for unknown terms.  numpy.frombuffer(result,
+         dtype='int64') views it as a NumPy array without copying.
+        """
+        terms, distinct = _distinct(terms)
+        self._resolve_distinct(distinct)
+        return array('q', map(distinct.__getitem__, terms))
+
+    def _many(self, terms, get):
+        """
+        :param terms:
+        :param get: a function of an index
+        :return: a list of get(index) aligned with the input, with None for unknown terms
+        """
+        terms, distinct = _distinct(terms)
+        self._resolve_distinct(distinct)
+        for t, i in distinct.items():
+            distinct[t] = None if i == MISSING else get(i)
+        return list(map(distinct.__getitem__, terms))
+
+    def names_many(self, terms):
+        """
+        Canonical names for many terms at once
+        :param terms: a sequence (or iterable) of terms
+        :return: a list of names aligned with the input, with None for unknown terms
+        """
+        return self._many(terms, self.name)
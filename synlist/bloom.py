@@ -0,0 +1,88 @@
+"""
+A Bloom filter over the keys of a SynList, for screening out unknown terms before they reach a lookup that is
+expensive to miss: a query to an SQLite file (synlist.sqlite), or a routing-table check of a lazily opened directory.
+
+A Bloom filter answers "definitely not present" or "possibly present".  Keys are only ever added; a key that stops
+being present (removed with remove_term, or undone by an SQLite rollback) stays in the filter as a false positive, which
+costs no more than the lookup would have without a filter, until SynList.compact() fills a new filter from the keys.
+
+The filter grows as keys are added: when a layer reaches its capacity a new one, twice as large and with half the
+error rate, is started (a 'scalable' Bloom filter), so the overall false-positive rate stays below the one asked for.
+Positions are derived from Python's hash() of the key, so a filter is only meaningful within one process: a pickled
+SynList keeps only the filter's error rate, and fills a new filter from its keys when it is unpickled.
+"""
+import math
+
+
+_MASK = (1 << 64) - 1
+
+
+class _Layer(object):
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.count = 0
+        self.k = max(1, int(round(-math.log(error_rate, 2))))
+        self.m = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def add(self, h):
+        a = h & 0xffffffff
+        b = (h >> 32) | 1
+        bits = self.bits
+        m = self.m
+        for _ in range(self.k):
+            a = (a + b) % m
+            bits[a >> 3] |= 1 << (a & 7)
+        self.count += 1
+
+    def contains(self, h):
+        a = h & 0xffffffff
+        b = (h >> 32) | 1
+        bits = self.bits
+        m = self.m
+        for _ in range(self.k):
+            a = (a + b) % m
+            if not bits[a >> 3] & (1 << (a & 7)):
+                return False
+        return True
+
+
+class BloomFilter(object):
+    def __init__(self, capacity=65536, error_rate=0.01):
+        """
+        :param capacity: [65536] number of keys the first layer is sized for
+        :param error_rate: [0.01] the false-positive rate not to exceed
+        """
+        self.error_rate = error_rate
+        self._layers = [_Layer(capacity, error_rate / 2)]
+
+    def __len__(self):
+        """
+        Number of keys added (a key added twice may be counted twice)
+        """
+        return sum(layer.count for layer in self._layers)
+
+    def nbytes(self):
+        return sum(len(layer.bits) for layer in self._layers)
+
+    def __contains__(self, key):
+        h = hash(key) & _MASK
+        for layer in self._layers:
+            if layer.contains(h):
+                return True
+        return False
+
+    def add(self, key):
+        h = hash(key) & _MASK
+        for layer in self._layers:
+            if layer.contains(h):
+                return
+        layer = self._layers[-1]
+        if layer.count >= layer.capacity:
+            layer = _Layer(layer.capacity * 2, self.error_rate / 2 ** (len(self._layers) + 1))
+            self._layers.append(layer)
+        layer.add(h)
+
+    def update(self, keys):
+        for k in keys:
+            self.add(k)
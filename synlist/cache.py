@@ -0,0 +1,84 @@
+"""
+A bounded LRU cache of query results for a SynList.
+
+Entries are stamped with the SynList's version, a counter that every change to the SynList increments.  An entry
+stamped with an older version is stale and is recomputed when it is next asked for, so a change invalidates the whole
+cache in constant time, without visiting any entry.  Stale entries are evicted in LRU order like any other.
+"""
+from collections import OrderedDict
+from functools import wraps
+
+
+_MISSING = object()
+
+
+class QueryCache(object):
+    def __init__(self, size):
+        """
+        :param size: the most results to hold
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISSING
+        if entry[0] != version:
+            self.stale += 1
+            self.misses += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, version, value):
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        :return: a dict of hits, misses (of which stale: found, but computed for an earlier version), entries held
+         and size
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'stale': self.stale, 'entries': len(self._entries),
+                'size': self.size}
+
+
+def cached_query(method):
+    """
+    Decorator for a SynList query method taking one term (or index, or pattern): when the SynList has a query cache,
+    results are kept under (method name, argument) and reused until the SynList changes.  A string argument is keyed
+    by its sanitized form, except for search patterns.  Calls that raise are not cached.  search() returns a copy of
+    the cached set, since callers may modify it.
+    """
+    op = method.__name__
+    sanitize = op != 'search'
+    copy = op == 'search'
+
+    @wraps(method)
+    def query(self, term):
+        cache = self._cache
+        if cache is None:
+            return method(self, term)
+        key = (op, self._sanitize(term) if sanitize and isinstance(term, str) else term)
+        value = cache.get(key, self._version)
+        if value is _MISSING:
+            value = method(self, term)
+            cache.put(key, self._version, value)
+        if copy:
+            return set(value)
+        return value
+    return query
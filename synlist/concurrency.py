@@ -0,0 +1,78 @@
+"""
+Lock-free concurrent reads of a SynList that is being modified.
+
+A ConcurrentSynList publishes immutable snapshots (see synlist.frozen).  Readers query the current snapshot and never
+wait; writers make their changes to a private mutable SynList, one batch at a time, and publish a new snapshot when the
+batch is done.  Replacing the published snapshot is a single reference assignment, so a reader sees either the old
+version or the new one, never a merge half done.
+"""
+import copy
+import threading
+from contextlib import contextmanager
+
+
+class ConcurrentSynList(object):
+    """
+    Readers use the SynList query API directly on this object, or take snapshot once and make all the queries of one
+    request against it, so that they are consistent with each other even if a new version is published in between.
+    Item indices are only meaningful within one snapshot.
+
+    Writers use batch():
+
+        with c.batch() as s:
+            s.merge('carbon dioxide', 'CO2')
+            s.add_set(('methane', 'marsh gas'))
+
+    Batches are applied one at a time.  Each batch copies the working list before it starts and freezes it when it is
+    done, so it costs time proportional to the size of the list (paid by the writer only); group many changes into one
+    batch.  If a batch raises an exception, none of its changes are published and the working list goes back to the
+    copy taken before the batch.
+    """
+    def __init__(self, synlist):
+        """
+        :param synlist: the SynList to publish.  It is used as the writers' working copy and should not be modified
+         except through batch().
+        """
+        self._writer = synlist
+        self._lock = threading.Lock()
+        self._current = (0, synlist.freeze())
+
+    @property
+    def snapshot(self):
+        return self._current[1]
+
+    @property
+    def version(self):
+        """
+        Number of batches published so far
+        :return:
+        """
+        return self._current[0]
+
+    @contextmanager
+    def batch(self):
+        """
+        Make changes to the working copy and publish them together.  Only one batch runs at a time.
+        :return: yields the mutable SynList
+        """
+        with self._lock:
+            saved = copy.deepcopy(self._writer)
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer = saved
+                raise
+            version = self._current[0] + 1
+            self._current = (version, self._writer.freeze())
+
+    def __getattr__(self, item):
+        # query methods of the current snapshot; a snapshot's mutators raise FrozenSynListError
+        if item == '_current':
+            raise AttributeError(item)
+        return getattr(self._current[1], item)
+
+    def __len__(self):
+        return len(self._current[1])
+
+    def __getitem__(self, term):
+        return self._current[1][term]
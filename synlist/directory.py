@@ -0,0 +1,258 @@
+"""
+Directory serialization for SynLists, with lazy per-shard loading.
+
+Layout of a directory:
+ * 'ignoreCase' -- an empty marker file, present if and only if the SynList ignores case
+ * '<s>/<digest>.json' -- one file per item, holding the same {'name', 'synonyms'} entry as serialize().  Items are
+   grouped into shard subdirectories by the first letter of their canonical name.
+ * 'keys/<s>.json' -- routing tables mapping each sanitized key to the item file that contains it, grouped by the
+   first letter of the key.  These let a lazily-opened SynList find the shard for a term without reading the others.
+
+Shard names are a single lowercase ASCII letter or digit, or '_' for everything else, so they can't collide with
+'keys' or 'ignoreCase'.
+"""
+import os
+import json
+import hashlib
+
+
+IGNORE_CASE = 'ignoreCase'
+KEYS = 'keys'
+
+
+def shard_of(text):
+    c = text[:1].lower()
+    if c.isascii() and c.isalnum():
+        return c
+    return '_'
+
+
+def item_file(name):
+    """
+    Relative path of the file for an item with the given canonical name
+    :param name:
+    :return:
+    """
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:20]
+    return '%s/%s.json' % (shard_of(name), digest)
+
+
+def _write_json(path, obj):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fp:
+        json.dump(obj, fp)
+    os.replace(tmp, path)
+
+
+class LazyKeys(dict):
+    """
+    The key dict of a lazily-opened SynList.  A key that is not present is looked up in the store's routing table, and
+    if it is found there the shard containing it is loaded before answering.  Membership tests, get() and item access
+    all fault in this way; iteration only sees keys that have been loaded.
+    """
+    def __init__(self, synlist, store):
+        super(LazyKeys, self).__init__()
+        self._synlist = synlist
+        self._store = store
+        self._faulting = False
+
+    def _fault(self, key):
+        if self._faulting:
+            return False  # a shard is being loaded; its own keys must not trigger more loading
+        self._faulting = True
+        try:
+            return self._store.fault(self._synlist, key)
+        finally:
+            self._faulting = False
+
+    def __missing__(self, key):
+        if self._fault(key):
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (self._fault(key) and dict.__contains__(self, key))
+
+    def get(self, key, default=None):
+        if key in self:
+            return dict.__getitem__(self, key)
+        return default
+
+
+class DirectoryStore(object):
+    """
+    Tracks the correspondence between a SynList's items and the files of a serialization directory, so that shards
+    can be loaded on demand and save() only writes the items that have changed.  The SynList reports each item it
+    changes through touch().
+    """
+    def __init__(self, path):
+        self.path = path
+        self._routes = dict()  # routing letter -> {key: item file}
+        self._dirty_routes = set()
+        self._loaded = set()  # shards that have been read
+        self._complete = False  # every shard has been read: the SynList in memory is the whole list
+        self._files = dict()  # item index -> item file, as last read or written
+        self._dirty = set()  # indices of items changed since they were last read or written
+        self._paths = set()  # item files that are represented in memory
+        self._dropped = set()  # files of items dropped by a compaction, to delete at the next save
+
+    @property
+    def ignore_case(self):
+        return os.path.exists(os.path.join(self.path, IGNORE_CASE))
+
+    def _shards(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(d for d in os.listdir(self.path) if len(d) == 1 and os.path.isdir(os.path.join(self.path, d)))
+
+    def _route_table(self, letter):
+        if letter not in self._routes:
+            fn = os.path.join(self.path, KEYS, letter + '.json')
+            if os.path.exists(fn):
+                with open(fn) as fp:
+                    self._routes[letter] = json.load(fp)
+            else:
+                self._routes[letter] = dict()
+        return self._routes[letter]
+
+    def routed_keys(self):
+        """
+        Every key in the routing tables, read without loading any shard
+        :return:
+        """
+        d = os.path.join(self.path, KEYS)
+        if os.path.isdir(d):
+            for fn in sorted(os.listdir(d)):
+                if fn.endswith('.json'):
+                    for k in self._route_table(fn[:-len('.json')]):
+                        yield k
+
+    def touch(self, *indices):
+        """
+        Mark items as changed, so that the next save() writes them (or removes their files, if they are gone)
+        :param indices:
+        :return:
+        """
+        self._dirty.update(indices)
+
+    def fault(self, synlist, key):
+        """
+        Load the shard that the routing table assigns the key to, if it hasn't been loaded already.
+        :param synlist:
+        :param key: a sanitized key
+        :return: True if a shard was loaded
+        """
+        rel = self._route_table(shard_of(key)).get(key)
+        if rel is None:
+            return False
+        shard = rel.split('/')[0]
+        if shard in self._loaded:
+            return False
+        self.load_shard(synlist, shard)
+        return True
+
+    def load_shard(self, synlist, shard):
+        d = os.path.join(self.path, shard)
+        if os.path.isdir(d):
+            for fn in sorted(os.listdir(d)):
+                if not fn.endswith('.json'):
+                    continue
+                rel = '%s/%s' % (shard, fn)
+                if rel in self._paths:
+                    continue  # written from memory since this store was opened
+                with open(os.path.join(d, fn)) as fp:
+                    entry = json.load(fp)
+                index = synlist._load_entry(entry)
+                self._files[index] = rel
+                self._dirty.discard(index)
+                self._paths.add(rel)
+        self._loaded.add(shard)
+
+    def load_all(self, synlist):
+        """
+        Load every shard not read yet.  After the first complete pass this returns at once, without listing the
+        directory: from then on, the SynList in memory holds everything and save() is what changes the directory.
+        :param synlist:
+        :return:
+        """
+        if self._complete:
+            return
+        for shard in self._shards():
+            if shard not in self._loaded:
+                self.load_shard(synlist, shard)
+        self._complete = True
+
+    def _set_routes(self, keys, rel):
+        for k in keys:
+            letter = shard_of(k)
+            table = self._route_table(letter)
+            if table.get(k) != rel:
+                table[k] = rel
+                self._dirty_routes.add(letter)
+
+    def renumber(self, remap):
+        """
+        Follow a compaction of the SynList (see SynList.compact)
+        :param remap: a list of new indices, None for dropped items
+        :return:
+        """
+        files = dict()
+        for index, rec in self._files.items():
+            if remap[index] is None:
+                self._dropped.add(rec)
+            else:
+                files[remap[index]] = rec
+        self._files = files
+        self._dirty = set(remap[index] for index in self._dirty if remap[index] is not None)
+
+    def save(self, synlist):
+        """
+        Write every item that was added or changed since the last load or save, remove the files of items that no
+        longer exist, and rewrite the routing tables that changed.
+        :param synlist:
+        :return: the number of item files written
+        """
+        writes = dict()
+        deletes = self._dropped
+        self._dropped = set()
+        for index in sorted(self._dirty):
+            terms = synlist._list[index]
+            rec = self._files.get(index)
+            if not terms:
+                # merged away, emptied by remove_term(), or never given a term: there is nothing to write
+                if rec is not None:
+                    deletes.add(rec)
+                    del self._files[index]
+                continue
+            name = synlist._name[index]
+            rel = item_file(min(terms) if name is None else name)
+            if rec is not None and rec != rel:
+                deletes.add(rec)
+            writes[rel] = index
+            self._files[index] = rel
+        self._dirty = set()
+        deletes.difference_update(writes.keys())
+
+        if self.ignore_case != bool(synlist._ignore_case) or not os.path.isdir(self.path):
+            os.makedirs(self.path, exist_ok=True)
+            marker = os.path.join(self.path, IGNORE_CASE)
+            if synlist._ignore_case:
+                open(marker, 'w').close()
+            elif os.path.exists(marker):
+                os.remove(marker)
+
+        for rel in deletes:
+            os.remove(os.path.join(self.path, rel))
+            self._paths.discard(rel)
+        for rel, index in writes.items():
+            os.makedirs(os.path.join(self.path, rel.split('/')[0]), exist_ok=True)
+            _write_json(os.path.join(self.path, rel), synlist._serialize_set(index))
+            self._paths.add(rel)
+            self._set_routes(synlist._item_keys(index), rel)
+
+        if self._dirty_routes:
+            os.makedirs(os.path.join(self.path, KEYS), exist_ok=True)
+            for letter in sorted(self._dirty_routes):
+                _write_json(os.path.join(self.path, KEYS, letter + '.json'), self._routes[letter])
+            self._dirty_routes = set()
+        return len(writes)
@@ -1,5 +1,11 @@
 import re
-from synlist.synlist import SynList, TermFound, CannotSplitName
+from collections import namedtuple
+
+from synlist.synlist import SynList, TermFound, LoadConflict
+from synlist.packed import PackedFlowables
+from synlist.frozen import FrozenFlowables
+from synlist.mapped import MappedFlowables
+from synlist.cache import cached_query
 
 
 class ConflictingCas(Exception):
@@ -10,28 +16,112 @@ class NotACas(Exception):
     pass
 
 
+IMPORT_KINDS = ('new', 'extends', 'spans', 'cas')
+IMPORT_POLICIES = ('skip', 'merge', 'separate')
+
+# an incoming set that import_sets could not simply add: position is its place in the input, indices are the existing
+# items it matched, and index is the item it was applied to, or None if it was left out
+ImportConflict = namedtuple('ImportConflict', ('position', 'kind', 'terms', 'indices', 'index'))
+
+
+class ImportReport(object):
+    """
+    Outcome of Flowables.import_sets: how many incoming sets there were of each kind, how many were applied, and an
+    ImportConflict for each 'spans' or 'cas' set.
+    """
+    def __init__(self, policy):
+        self.policy = policy
+        self.counts = dict((k, 0) for k in IMPORT_KINDS)
+        self.applied = 0
+        self.conflicts = []
+
+    def add(self, position, kind, terms, indices, index):
+        self.counts[kind] += 1
+        if index is not None:
+            self.applied += 1
+        if kind in ('spans', 'cas'):
+            self.conflicts.append(ImportConflict(position, kind, terms, indices, index))
+
+    def __str__(self):
+        return '%d sets (%s); %d applied, %d conflicts' % (sum(self.counts.values()),
+                                                          ', '.join('%d %s' % (self.counts[k], k) for k in IMPORT_KINDS),
+                                                          self.applied, len(self.conflicts))
+
+
 cas_regex = re.compile('^[0-9]{,6}-[0-9]{2}-[0-9]$')
 cas_strict = re.compile('^[0-9]{6}-[0-9]{2}-[0-9]$')
 
 
-def find_cas(syns):
+def cas_number(cas):
+    """
+    Integer encoding of a CAS number: its digits read as a single integer, so that '124-38-9' and '000124-38-9' are
+    both 124389 and the check digit is the last decimal digit.
+    :param cas: a string
+    :return: the encoded CAS number, or None if the string is not shaped like a CAS number
+    """
+    if cas_regex.match(cas) is None:
+        return None
+    return int(cas.replace('-', ''))
+
+
+def cas_check_digit(number):
+    """
+    The check digit that an encoded CAS number should end with: the sum of the other digits, each multiplied by its
+    position counting from the right, modulo 10.
+    :param number: an encoded CAS number
+    :return:
+    """
+    number //= 10
+    total = 0
+    position = 1
+    while number:
+        number, digit = divmod(number, 10)
+        total += position * digit
+        position += 1
+    return total % 10
+
+
+def is_valid_cas(number):
+    return number % 10 == cas_check_digit(number)
+
+
+def format_cas(number, pad=True):
+    """
+    :param number: an encoded CAS number
+    :param pad: [True] zero-pad the first group of digits to six places; otherwise omit leading zeros
+    :return:
+    """
+    head, tail = divmod(number, 1000)
+    if pad:
+        return '%06d-%02d-%d' % (head, tail // 10, tail % 10)
+    return '%s-%02d-%d' % (head or '', tail // 10, tail % 10)
+
+
+def find_cas_number(syns, parse=cas_number):
     found = set()
     for i in syns:
-        if bool(cas_regex.match(i)):
-            found.add(trim_cas(i))
+        n = parse(i)
+        if n is not None:
+            found.add(n)
     if len(found) > 1:
-        raise ConflictingCas('Multiple CAS numbers found: %s' % found)
+        raise ConflictingCas('Multiple CAS numbers found: %s' % sorted(format_cas(n, pad=False) for n in found))
     if len(found) == 0:
         return None
     return found.pop()
 
 
+def find_cas(syns):
+    n = find_cas_number(syns)
+    if n is None:
+        return None
+    return format_cas(n, pad=False)
+
+
 def pad_cas(cas):
-    if not bool(cas_regex.match(cas)):
+    n = cas_number(cas)
+    if n is None:
         raise NotACas(cas)
-    while not bool(cas_strict.match(cas)):
-        cas = '0' + cas
-    return cas
+    return format_cas(n)
 
 
 def trim_cas(cas):
@@ -43,18 +133,81 @@ class Flowables(SynList):
     A SynList that enforces unique CAS numbers on sets.  Also uses case-insensitive lookup
 
     The CAS thing requires overloading _new_key and _new_group and just about everything else.
+
+    A CAS number is parsed once, when it is added, into its integer encoding (see cas_number).  _cas holds the encoded
+    CAS number of each item, and _cas_index maps every encoded CAS number that has been added to its item.
     """
+    _timed = SynList._timed + ('cas', 'by_cas', 'set_cas', 'import_sets', '_key_cas')
+    _spellings = False  # a second spelling of a key is dropped
 
-    def __init__(self, ignore_case=None):
+    def __init__(self, ignore_case=None, check_digits=False, **kwargs):
         """
         :param ignore_case: this parameter is ignored for flowables
+        :param check_digits: [False] reject CAS numbers whose check digit is wrong, raising NotACas.  By default they
+         are accepted as they are.
+        :param kwargs: passed to SynList
         """
-        super(Flowables, self).__init__(ignore_case=True)
+        super(Flowables, self).__init__(ignore_case=True, **kwargs)
+        self._check_digits = check_digits
         self._cas = []
+        self._cas_index = dict()
+
+    @classmethod
+    def open_binary(cls, path):
+        return MappedFlowables(path)
+
+    def _options(self):
+        options = super(Flowables, self)._options()
+        options['check_digits'] = self._check_digits
+        return options
 
+    def _parse_cas(self, key):
+        """
+        :param key: a sanitized term
+        :return: the encoded CAS number, or None if the key is not a CAS number
+        """
+        n = self._key_cas(key)
+        if n is not None and self._check_digits and not is_valid_cas(n):
+            raise NotACas('%s: check digit should be %d' % (key, cas_check_digit(n)))
+        return n
+
+    def _set_cas(self, index, number):
+        self._cas[index] = number
+        self._cas_index[number] = index
+
+    @cached_query
     def cas(self, term):
-        return self._cas[self._get_index(term)]
+        n = self._cas[self._get_index(term)]
+        if n is None:
+            return None
+        return format_cas(n)
+
+    def by_cas(self, cas):
+        """
+        Find an item directly from its CAS number.
+        :param cas: a CAS number, with or without padding, or its integer encoding
+        :return: the item's index, or None if the CAS number is not known
+        """
+        if not isinstance(cas, int):
+            n = self._key_cas(cas.strip())
+            if n is None:
+                raise NotACas(cas)
+            cas = n
+        index = self._cas_index.get(cas)
+        if index is None or self._forest is None:
+            return index
+        return self._forest.find(index)
+
+    def cas_many(self, terms):
+        """
+        CAS numbers for many terms at once
+        :param terms: a sequence (or iterable) of terms
+        :return: a list of padded CAS numbers aligned with the input, with None for unknown terms and items without a
+         CAS number
+        """
+        return self._many(terms, self.cas)
 
+    @cached_query
     def cas_name(self, term):
         """
         returns the [[trimmed???]] cas number if it exists; otherwise the canonical name
@@ -63,7 +216,7 @@ class Flowables(SynList):
         """
         ind = self._get_index(term)
         if self._cas[ind] is not None:
-            return trim_cas(self._cas[ind])
+            return format_cas(self._cas[ind], pad=False)
         return self._name[ind]
 
     def new_item(self, entity=None):
@@ -71,47 +224,177 @@ class Flowables(SynList):
         self._cas.append(None)
         return k
 
-    def _get_index(self, term):
-        try:
-            return super(Flowables, self)._get_index(term)
-        except KeyError:
-            if len(term.strip()) > 3:
-                return super(Flowables, self)._get_index(term.lower())
-            raise
-
     def _assign_term(self, term, index, force=False):
         lterm = self._sanitize(term)
         if lterm in self._dict:
-            if self._dict[lterm] != index:
+            if self._lookup(lterm) != index:
                 if force is False:
-                    raise TermFound('%s [%s: %d]' % (term, lterm, self._dict[lterm]))
+                    raise TermFound('%s [%s: %d]' % (term, lterm, self._lookup(lterm)))
         self._list[index].add(term)
-        self._dict[lterm] = index
+        if self._keyed:
+            self._keep_term(index, term)
+        self._set_key(lterm, index)
 
     def _new_term(self, term, index):
         if term is None or term == '':
             return
         key = self._sanitize(term)
         if key in self._dict:
-            if self._dict[key] == index:
+            if self._lookup(key) == index:
                 return  # nothing to do
             raise TermFound(term)
-        if cas_regex.match(key):
-            if self._cas[index] is not None and trim_cas(self._cas[index]) != trim_cas(key):
-                raise ConflictingCas('Index %d already has CAS %s' % (index, self._cas[index]))
+        n = self._parse_cas(key)
+        if n is not None:
+            if self._cas[index] is not None and self._cas[index] != n:
+                raise ConflictingCas('Index %d already has CAS %s' % (index, format_cas(self._cas[index])))
             else:
-                key = pad_cas(key)
-                self._cas[index] = key
-                super(Flowables, self)._new_term(trim_cas(key), index)
+                key = format_cas(n)
+                self._set_cas(index, n)
+                super(Flowables, self)._new_term(format_cas(n, pad=False), index)
         self._list[index].add(term)
-        self._dict[key] = index
+        if self._keyed:
+            self._keep_term(index, term)
+        self._set_key(key, index)
         if self._name[index] is None:
             self._name[index] = term
-        elif bool(cas_regex.match(self._name[index])) and not bool(cas_regex.match(term)):
+        elif n is None and bool(cas_regex.match(self._name[index])):
             # override CAS-name with non-CAS name, if one is found
             self._name[index] = term
 
+    def _serialize_set(self, index):
+        return self._serialize_cas(index, super(Flowables, self)._serialize_set(index))
+
+    def _serialize_cas(self, index, entry):
+        """
+        An entry whose CAS numbers would not load back as they are (an item holding several after a merge with
+        multi_cas=True, or one left without a canonical CAS number by set_cas(None)) records its canonical CAS number,
+        or None, under 'cas'.
+        :param index:
+        :param entry:
+        :return: the entry
+        """
+        numbers = set(self._key_cas(self._sanitize(t)) for t in entry['synonyms'] if '-' in t)
+        numbers.discard(None)
+        n = self._cas[index]
+        if len(numbers) > 1 or (numbers and n is None):
+            entry['cas'] = None if n is None else format_cas(n)
+        return entry
+
+    def _add_entries(self, entries, bulk, validate):
+        if bulk:
+            return super(Flowables, self)._add_entries(entries, bulk, validate)
+        for i in entries:
+            if 'cas' not in i:
+                super(Flowables, self)._add_entries([i], bulk, validate)
+                continue
+            # add_set accepts one CAS number per set: the others are merged in afterward, as they were saved
+            kept = None if i['cas'] is None else self._key_cas(i['cas'])
+            terms = []
+            demoted = []
+            for t in i['synonyms'] + [i['name']]:
+                n = self._key_cas(self._sanitize(t)) if '-' in t else None
+                if n is not None and kept is None:
+                    kept = n
+                (terms if n is None or n == kept else demoted).append(t)
+            self.add_set(terms)
+            self.set_name(i['name'])
+            for t in demoted:
+                self.add_set([t])
+                self.merge(i['name'], t, multi_cas=True)
+            self.set_cas(i['name'], i['cas'])
+
+    def _load_entry(self, entry, conflicts=None):
+        if 'cas' not in entry:
+            return self._load_item(entry['name'], entry['synonyms'], conflicts)
+        index = self._load_item(entry['name'], entry['synonyms'], conflicts, multi_cas=True)
+        n = None if entry['cas'] is None else self._key_cas(entry['cas'])
+        if self._list[index] is not None and (n is None or self._cas_index.get(n) == index):
+            self._cas[index] = n
+        return index
+
+    def _load_item(self, name, synonyms, conflicts=None, multi_cas=False):
+        """
+        Bulk version of add_set() + set_name() for serialized flowables.  CAS numbers are recognized with a single regex
+        match per term and registered under both their padded and trimmed forms, as _new_term does.
+        :param name:
+        :param synonyms:
+        :param conflicts: a list to record conflicts in, or None to trust the input
+        :param multi_cas: [False] accept several CAS numbers in the entry, as merge(multi_cas=True) does; the first
+         one is kept canonical
+        :return:
+        """
+        index = self.new_item()
+        terms = self._list[index]
+        for t in synonyms + [name]:
+            if t is None or t == '':
+                continue
+            key = self._sanitize(t)
+            held = self._dict.get(key)
+            if held == index:
+                continue  # duplicate within the entry
+            n = self._parse_cas(key)
+            if held is not None and conflicts is not None:
+                conflicts.append(LoadConflict('term' if n is None else 'cas', t, self._lookup(key), index))
+                continue
+            if n is not None:
+                if self._cas[index] is not None and self._cas[index] != n and not multi_cas:
+                    if conflicts is None:
+                        raise ConflictingCas('Entry %s has multiple CAS numbers' % name)
+                    conflicts.append(LoadConflict('cas', t, index, index))
+                    continue
+                if conflicts is not None:
+                    held = self._cas_index.get(n, index)
+                    if held != index:
+                        conflicts.append(LoadConflict('cas', t, held, index))
+                        continue
+                padded = format_cas(n)
+                trimmed = format_cas(n, pad=False)
+                if self._cas[index] is None:
+                    self._cas[index] = n
+                self._cas_index[n] = index
+                terms.add(trimmed)
+                self._set_key(trimmed, index)
+                key = padded
+            terms.add(t)
+            self._set_key(key, index)
+        self._name[index] = name
+        if conflicts is not None:
+            self._settle_loaded_item(index, synonyms)
+        return index
+
+    def _renumber(self, remap, n):
+        # every known CAS number, including those demoted by a multi_cas merge, keeps pointing at its item
+        held = [(number, self.by_cas(number)) for number in self._cas_index]
+        super(Flowables, self)._renumber(remap, n)
+        self._cas = [x for x, i in zip(self._cas, remap) if i is not None]
+        self._cas_index = dict((number, remap[index]) for number, index in held)
+
+    def pack(self):
+        return PackedFlowables.from_synlist(self)
+
+    def freeze(self):
+        return FrozenFlowables.from_synlist(self)
+
+    def _item_keys(self, index):
+        keys = super(Flowables, self)._item_keys(index)
+        if self._cas[index] is not None:
+            keys.add(format_cas(self._cas[index]))
+        return keys
+
     def _merge(self, merge, into):
+        n = self._cas[merge]
+        if n is not None:
+            self._cas_index[n] = into
+        if self._forest is None:
+            # the padded CAS key is not the sanitized form of any synonym, so SynList._merge won't re-point it; the item
+            # may also hold CAS numbers demoted by an earlier multi_cas merge, which must follow it too
+            for t in self._list[merge]:
+                if '-' in t:
+                    m = self._key_cas(self._sanitize(t))
+                    if m is not None:
+                        self._dict[format_cas(m)] = into
+                        if self._cas_index.get(m) == merge:
+                            self._cas_index[m] = into
         super(Flowables, self)._merge(merge, into)
         self._cas[merge] = None
 
@@ -135,15 +418,176 @@ class Flowables(SynList):
             if multi_cas:
                 the_cas = the_cas[:1]
             else:
-                raise ConflictingCas('Indices have conflicting CAS numbers: %s' % the_cas)
+                raise ConflictingCas('Indices have conflicting CAS numbers: %s' % [format_cas(k) for k in the_cas])
         super(Flowables, self).merge(dominant, *terms)
         if len(the_cas) == 1:
-            self._cas[dom] = the_cas[0]
+            self._set_cas(dom, the_cas[0])
 
-    def _matches(self, term):
-        if cas_regex.match(term):
-            raise CannotSplitName('Cannot split CAS number')
-        return super(Flowables, self)._matches(term)
+    def _classify_import(self, terms):
+        """
+        Match an incoming set against the current contents in one pass, resolving each term and parsing it as a CAS
+        number once.
+        :param terms:
+        :return: kind, the matched indices in order of first match, the terms that are not known at all, and the
+         terms that are not keys but spell a known CAS number differently
+        """
+        indices = []
+        unknown = []
+        variants = []
+        numbers = set()
+        bad_cas = False
+        for t in terms:
+            try:
+                n = self._parse_cas(self._sanitize(t))
+            except NotACas:
+                bad_cas = True
+                continue
+            i = self._known(t)
+            if n is not None:
+                numbers.add(n)
+                if i is None:
+                    i = self.by_cas(n)
+                    (unknown if i is None else variants).append(t)
+            elif i is None:
+                unknown.append(t)
+            if i is not None and i not in indices:
+                indices.append(i)
+        held = set(self._cas[i] for i in indices)
+        held.discard(None)
+        if bad_cas or len(numbers | held) > 1:
+            return 'cas', indices, unknown, variants
+        if len(indices) == 0:
+            return 'new', indices, unknown, variants
+        if len(indices) == 1:
+            return 'extends', indices, unknown, variants
+        return 'spans', indices, unknown, variants
+
+    def import_sets(self, sets, policy='skip'):
+        """
+        Reconcile a corpus of incoming synonym sets with the Flowables in a single run, without stopping at the first
+        conflict.  Each set is classified against the current contents, including the sets imported before it, as:
+         'new': none of its terms are known; it becomes a new item
+         'extends': its known terms all belong to one item; its other terms are added to that item
+         'spans': its known terms belong to several items
+         'cas': it holds more than one CAS number, or a CAS number different from that of an item it matches, or it
+          spans items with different CAS numbers, or (with check_digits) a CAS number with a bad check digit
+        'new' and 'extends' sets are always applied and 'cas' sets never are.  'spans' sets depend on the policy:
+         'skip': they are left out
+         'merge': the items are merged into the one matched first, and the set's unknown terms are added to it
+         'separate': the set's unknown terms become a new item, as with add_set(merge=False)
+        :param sets: an iterable of iterables of terms
+        :param policy: ['skip'] 'skip', 'merge' or 'separate'
+        :return: an ImportReport
+        """
+        if policy not in IMPORT_POLICIES:
+            raise ValueError('Unknown import policy %s' % policy)
+        report = ImportReport(policy)
+        for position, it in enumerate(sets):
+            terms = [t for t in it if t is not None and t != '']
+            if len(terms) == 0:
+                continue
+            kind, indices, unknown, variants = self._classify_import(terms)
+            index = None
+            if kind == 'new' or (kind == 'spans' and policy == 'separate' and unknown):
+                index = self.new_item()
+                variants = []
+            elif kind == 'extends':
+                index = indices[0]
+            elif kind == 'spans' and policy == 'merge':
+                index = indices[0]
+                self.merge(index, *indices[1:])
+            if index is not None:
+                for t in unknown + variants:
+                    self._new_term(t, index)
+            report.add(position, kind, terms, indices, index)
+        return report
+
+    def _term_key(self, term):
+        """
+        Every spelling of a CAS number, padded or trimmed, is held under the padded key
+        :param term:
+        :return:
+        """
+        key = self._sanitize(term)
+        n = self._key_cas(key)
+        if n is None:
+            return key
+        return format_cas(n)
+
+    def set_name(self, name):
+        """
+        As SynList.set_name, but a CAS number may be given in any spelling, such as the one it was added in, even where
+        that spelling is not a key
+        :param name:
+        :return: index of named item
+        """
+        index = self._get_index(self._term_key(name))
+        self._version += 1
+        self._touch(index)
+        self._name[index] = name
+        return index
+
+    def set_cas(self, term, cas):
+        """
+        Choose which of the CAS numbers an item holds is its canonical CAS number, after a merge with multi_cas=True
+        :param term: a term of the item
+        :param cas: a CAS number that belongs to the item, or None to leave the item without a canonical CAS number
+        :return: index of the item
+        """
+        index = self._get_index(term)
+        if cas is None:
+            self._version += 1
+            self._touch(index)
+            self._cas[index] = None
+            return index
+        n = self._key_cas(cas.strip()) if isinstance(cas, str) else cas
+        if n is None:
+            raise NotACas(cas)
+        if self._find(format_cas(n)) != index:
+            raise KeyError(cas)
+        self._version += 1
+        self._touch(index)
+        self._set_cas(index, n)
+        return index
+
+    def _key_cas(self, key):
+        """
+        Every CAS number parsed by a Flowables is parsed here, so that instrument() counts them all
+        :param key:
+        :return:
+        """
+        return cas_number(key)
+
+    def _item_cas(self, index):
+        return self._cas[index]
+
+    def _drop_key(self, key, index):
+        super(Flowables, self)._drop_key(key, index)
+        n = self._key_cas(key)
+        if n is not None:
+            # the last spelling of a CAS number is gone: so are its trimmed key and the CAS number itself
+            trimmed = format_cas(n, pad=False)
+            if trimmed != key and trimmed in self._dict:
+                super(Flowables, self)._drop_key(trimmed, index)
+            if self._cas_index.get(n) is not None:
+                del self._cas_index[n]
+            if self._cas[index] == n:
+                self._cas[index] = None
+
+    def _move_terms(self, key, moved, index, into):
+        """
+        Moving a CAS number also moves its trimmed key and makes it the CAS number of the item it is moved to
+        """
+        n = self._key_cas(key)
+        if n is None:
+            return super(Flowables, self)._move_terms(key, moved, index, into)
+        if self._cas[into] is not None and self._cas[into] != n:
+            raise ConflictingCas('Index %d already has CAS %s' % (into, format_cas(self._cas[into])))
+        super(Flowables, self)._move_terms(key, moved, index, into)
+        self._dict[format_cas(n, pad=False)] = into
+        if self._cas[index] == n:
+            self._cas[index] = None
+        self._set_cas(into, n)
 
     def check_cas(self, it):
         """
@@ -155,7 +599,7 @@ class Flowables(SynList):
         :param it:
         :return:
         """
-        incoming_cas = find_cas(it)  # returns a trimmed cas
+        incoming_cas = find_cas_number(it, self._key_cas)
         if incoming_cas is None:
             return None
         conflicts = set()
@@ -163,14 +607,14 @@ class Flowables(SynList):
             inx = self._known(i)
             if inx is not None and inx not in conflicts:
                 contender = self._cas[inx]
-                if contender is not None and trim_cas(contender) != incoming_cas:
+                if contender is not None and contender != incoming_cas:
                     conflicts.add(inx)
         return sorted(list(conflicts))
 
     def _merge_set_with_index(self, it, index):
-        cas = find_cas(it)
+        cas = find_cas_number(it, self._key_cas)
         if cas is not None:
-            if self._cas[index] is not None and trim_cas(self._cas[index]) != trim_cas(cas):
-                print('Conflicting CAS: incoming %s; existing [%s] = %d' % (cas, self._cas[index], index))
-                raise ConflictingCas('Incoming set has conflicting CAS %s' % cas)
+            if self._cas[index] is not None and self._cas[index] != cas:
+                raise ConflictingCas('Incoming set has conflicting CAS %s; existing [%s] = %d' %
+                                     (format_cas(cas, pad=False), format_cas(self._cas[index]), index))
         super(Flowables, self)._merge_set_with_index(it, index)
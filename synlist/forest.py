@@ -0,0 +1,86 @@
+"""
+Disjoint-set forest used by SynList(union_find=True) to merge items without rewriting every key of the merged items.
+"""
+
+
+class DisjointSets(object):
+    """
+    A union-find forest over item indices, with path compression and union by size.  A node is created for every
+    item; keys in the SynList's dict refer to the node of the item they were first added to.
+
+    Because the forest links whichever tree is smaller under the larger one, the root of a tree is not necessarily
+    the index of the item that survived a merge.  Each root therefore carries a label: the item index that currently
+    owns the tree's synonym set.
+    """
+    def __init__(self):
+        self._parent = []
+        self._size = []
+        self._label = []
+        self._links = 0
+
+    def __len__(self):
+        return len(self._parent)
+
+    @property
+    def flat(self):
+        """
+        True if no links have been made since the last reset(), i.e. every node resolves to itself
+        :return:
+        """
+        return self._links == 0
+
+    def add(self):
+        n = len(self._parent)
+        self._parent.append(n)
+        self._size.append(1)
+        self._label.append(n)
+        return n
+
+    def _root(self, node):
+        parent = self._parent
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    def find(self, node):
+        """
+        The item index that a node currently resolves to
+        :param node:
+        :return:
+        """
+        return self._label[self._root(node)]
+
+    def union(self, merge, into):
+        """
+        Join the tree containing item 'merge' to the tree containing item 'into'; the result resolves to 'into'.
+        :param merge: a live item index
+        :param into: a live item index
+        :return:
+        """
+        rm = self._root(merge)
+        ri = self._root(into)
+        if rm == ri:
+            return
+        if self._size[rm] > self._size[ri]:
+            rm, ri = ri, rm
+        self._parent[rm] = ri
+        self._size[ri] += self._size[rm]
+        self._label[ri] = into
+        self._links += 1
+
+    def reset(self, n=None):
+        """
+        Make every node its own root again.  Only valid once every reference to a node has been replaced with
+        find(node).
+        :param n: [None] the number of nodes to keep, after the items have been renumbered; by default all of them
+        :return:
+        """
+        if n is None:
+            n = len(self._parent)
+        self._parent = list(range(n))
+        self._size = [1] * n
+        self._label = list(range(n))
+        self._links = 0
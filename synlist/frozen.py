@@ -0,0 +1,182 @@
+"""
+Immutable snapshots of a SynList, for lists that are built once and then only queried.
+"""
+from array import array
+from collections import defaultdict
+
+from synlist.readonly import ReadOnlySynList, ReadOnlyFlowables
+
+
+SEP = '\x00'  # separates terms in the pickled state
+
+
+class FrozenSynListError(TypeError):
+    """
+    Raised by the mutating methods of a frozen SynList
+    """
+    pass
+
+
+class FrozenSynList(ReadOnlySynList):
+    """
+    A read-only snapshot of a SynList.  Every sanitized key and every synonym exactly as it was added are entered in a
+    single lookup table, so a lookup of a known term is one dict probe, with no sanitizing and no exceptions.  Other
+    inputs (extra whitespace, different case) cost one sanitize and a second probe.
+
+    Synonyms are kept in one flat tuple, item by item, with an array of offsets; synonym_set() returns a frozenset.
+
+    Pickling is cheap: the state is a handful of large strings and arrays (see __getstate__).
+    """
+    @classmethod
+    def from_synlist(cls, synlist):
+        synlist._require_all()
+        f = cls()
+        f._freeze(synlist)
+        return f
+
+    def __init__(self):
+        self._ignore_case = False
+        self._source = None
+        self._terms = ()
+        self._offsets = array('I', [0])
+        self._names = ()
+        self._entity = ()
+        self._count = 0
+        self._table = dict()
+
+    def _freeze(self, synlist):
+        self._ignore_case = synlist._ignore_case
+        self._source = synlist.__class__
+        terms = []
+        offsets = array('I', [0])
+        for syns in synlist._list:
+            if syns is not None:
+                terms.extend(syns)
+            offsets.append(len(terms))
+        self._terms = tuple(terms)
+        self._offsets = offsets
+        self._names = tuple(synlist._name)
+        self._entity = tuple(synlist._entity)
+        self._count = sum(1 for t in synlist._list if t is not None)
+        table = dict((k, synlist._lookup(k)) for k in synlist._dict.keys())
+        # every synonym as entered resolves to the same item as its key
+        for t in terms:
+            if t not in table:
+                i = table.get(self._sanitize(t))
+                if i is not None:
+                    table[t] = i
+        self._table = table
+
+    def __getstate__(self):
+        """
+        The terms and the lookup table are pickled as a few large strings and arrays rather than as many small objects,
+        unless some term contains the separator character.  The packed state is built for each pickle and not kept, so
+        that a snapshot does not hold its contents twice once it has been pickled.
+        :return:
+        """
+        state = dict(self.__dict__)
+        terms = SEP.join(self._terms)
+        keys = SEP.join(self._table.keys())
+        if terms.count(SEP) + 1 == len(self._terms) and keys.count(SEP) + 1 == len(self._table):
+            state['_terms'] = terms
+            state['_table'] = (keys, array('I', self._table.values()))
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self._terms, str):
+            self._terms = tuple(self._terms.split(SEP)) if self._terms else ()
+            keys, values = self._table
+            self._table = dict(zip(keys.split(SEP), values)) if keys else dict()
+
+    def _probe(self, term):
+        """
+        Item index for a term, or None if it is unknown.  The term is only sanitized if it isn't found as given.
+        :param term:
+        :return:
+        """
+        i = self._table.get(term)
+        if i is None and isinstance(term, str):
+            i = self._table.get(self._sanitize(term))
+        return i
+
+    def _get_index(self, term):
+        if isinstance(term, int):
+            if term < len(self._names):
+                return term
+            raise IndexError('Item index out of range')
+        i = self._probe(term)
+        if i is None:
+            raise KeyError(term)
+        return i
+
+    def _known(self, term):
+        if isinstance(term, int):
+            return self._get_index(term)
+        return self._probe(term)
+
+    def __len__(self):
+        return self._count
+
+    def _item_name(self, index):
+        return self._names[index]
+
+    def _synonyms(self, index):
+        return self._terms[self._offsets[index]:self._offsets[index + 1]]
+
+    def entity(self, term):
+        return self._entity[self._get_index(term)]
+
+    def all_terms(self):
+        return self._table.keys()
+
+    def find_indices(self, it):
+        found = defaultdict(set)
+        for i in it:
+            found[self._probe(i)].add(i)
+        return found
+
+    def synonym_set(self, index):
+        start, end = self._offsets[index], self._offsets[index + 1]
+        if start == end:
+            return None
+        return frozenset(self._terms[start:end])
+
+    def thaw(self, **kwargs):
+        """
+        A mutable SynList (of the original class) with the same items and entities.  Item indices are not preserved.
+        :param kwargs: passed to the constructor
+        :return:
+        """
+        s = self._source.from_json(self.serialize(), bulk=True, **kwargs)
+        for i, entity in enumerate(self._entity):
+            if entity is not None and self._names[i] is not None:
+                s.set_entity(self._names[i], entity)
+        return s
+
+    def freeze(self):
+        return self
+
+    def _read_only(self, *args, **kwargs):
+        raise FrozenSynListError('%s is read-only; use thaw() to get a mutable copy' % self.__class__.__name__)
+
+    new_item = add_term = add_set = add_synonym = add_synonyms = merge = set_name = split_term = detach = move = \
+        remove_term = apply_patch = set_entity = _read_only
+
+
+class FrozenFlowables(ReadOnlyFlowables, FrozenSynList):
+    """
+    Read-only snapshot of a Flowables.
+    """
+    def __init__(self):
+        super(FrozenFlowables, self).__init__()
+        self._cas = ()
+
+    def _freeze(self, synlist):
+        self._cas = tuple(synlist.cas(i) for i in range(len(synlist._cas)))
+        super(FrozenFlowables, self)._freeze(synlist)
+
+    def _padded_cas(self, index):
+        return self._cas[index]
+
+    set_cas = FrozenSynList._read_only
@@ -0,0 +1,165 @@
+"""
+Optional counters and latency histograms for a SynList, to find out where the time of a slow workload goes.
+
+SynList.instrument() attaches an Instruments object to one SynList.  It replaces the SynList's timed methods (see
+SynList._timed) with wrappers on that instance only, so a SynList that is not instrumented runs the class methods
+untouched; the only other cost is a check for an attached Instruments on a rare path, a merge.  uninstrument() removes
+the wrappers.  The wrappers are not pickled: a pickled copy of an instrumented SynList, such as one sent to a worker
+process, is not instrumented.
+
+Counters:
+ * hits, misses: term lookups (_get_index, _find) that found an item or not
+ * merges, merge_rewrites: items merged, and keys re-pointed to the surviving item by those merges (none with
+   union_find=True)
+ * cas_parses: terms parsed as possible CAS numbers, all of which go through Flowables._key_cas
+
+Latencies are kept per method in histograms with power-of-two buckets in nanoseconds: bucket b counts the calls that
+took less than 2**b ns and at least 2**(b-1) ns.  Nested calls are timed separately, so a merge() includes the time of
+its _merge() calls.
+"""
+from collections import defaultdict
+from time import perf_counter
+
+
+COUNTERS = ('hits', 'misses', 'merges', 'merge_rewrites', 'cas_parses')
+
+# term lookups: _get_index raises KeyError on a miss, _find returns None
+LOOKUPS = ('_get_index', '_find')
+
+# methods whose every call is also counted
+CALL_COUNTERS = {'_key_cas': 'cas_parses'}
+
+
+class Histogram(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = defaultdict(int)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[int(seconds * 1e9).bit_length()] += 1
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-th quantile, in seconds
+        :param q: between 0 and 1
+        :return:
+        """
+        target = q * self.count
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= target:
+                return min(2 ** b / 1e9, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max,
+                'p50': self.quantile(0.5),
+                'p99': self.quantile(0.99),
+                'buckets': dict((2 ** b, n) for b, n in sorted(self.buckets.items()))}
+
+
+class Instruments(object):
+    """
+    Counters and latency histograms for one SynList.
+    """
+    def __init__(self, callback=None):
+        """
+        :param callback: [None] called as callback(method, seconds) after each timed call
+        """
+        self.callback = callback
+        self.counters = dict((k, 0) for k in COUNTERS)
+        self.latency = defaultdict(Histogram)
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def observe(self, op, seconds):
+        self.latency[op].add(seconds)
+        if self.callback is not None:
+            self.callback(op, seconds)
+
+    def reset(self):
+        for k in self.counters:
+            self.counters[k] = 0
+        self.latency.clear()
+
+    def stats(self):
+        """
+        :return: a dict with 'counters': {counter: n} and 'latency': {method: histogram snapshot}, where a snapshot
+         holds count, total, mean, max, p50 and p99 in seconds, and buckets: {upper bound in ns: count}
+        """
+        return {'counters': dict(self.counters),
+                'latency': dict((op, h.snapshot()) for op, h in self.latency.items())}
+
+    def _timer(self, op, fn):
+        observe = self.observe
+        counter = CALL_COUNTERS.get(op)
+        counters = self.counters
+
+        def timed(*args, **kwargs):
+            if counter is not None:
+                counters[counter] += 1
+            start = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(op, perf_counter() - start)
+        return timed
+
+    def _lookup_timer(self, op, fn):
+        observe = self.observe
+        counters = self.counters
+
+        def timed(term):
+            start = perf_counter()
+            try:
+                index = fn(term)
+            except KeyError:
+                counters['misses'] += 1
+                raise
+            finally:
+                observe(op, perf_counter() - start)
+            if index is None:
+                counters['misses'] += 1
+            else:
+                counters['hits'] += 1
+            return index
+        return timed
+
+    def attach(self, synlist):
+        """
+        Wrap the synlist's timed methods, on the instance
+        :param synlist:
+        :return:
+        """
+        for op in LOOKUPS:
+            setattr(synlist, op, self._lookup_timer(op, getattr(synlist, op)))
+        for op in synlist._timed:
+            setattr(synlist, op, self._timer(op, getattr(synlist, op)))
+        synlist._instruments = self
+
+    @staticmethod
+    def detach(synlist):
+        Instruments.strip(synlist.__dict__, synlist._timed)
+
+    @staticmethod
+    def strip(state, timed):
+        """
+        Remove the wrappers and the Instruments from the attributes of a SynList
+        :param state: the SynList's __dict__, or a copy of it
+        :param timed: the SynList's timed methods
+        :return:
+        """
+        for op in LOOKUPS + tuple(timed):
+            state.pop(op, None)
+        state.pop('_instruments', None)
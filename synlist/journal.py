@@ -0,0 +1,242 @@
+"""
+Persist a SynList as a checkpoint plus an append-only journal of the changes made since, so that saving a change costs
+time proportional to the change rather than to the whole list.
+
+A journal directory holds numbered generations:
+ * checkpoint-NNNNNN.jsonl: the list as of the start of the generation, written by dump(lines=True)
+ * journal-NNNNNN.jsonl: one record per change made during the generation
+
+Each record is one line of JSON: {"op": method name, "args": [...], "kwargs": {...}, "time": seconds since the epoch},
+with "error": the exception class name if the call raised.  Items are always recorded by a term rather than by index,
+since indices are not preserved by a checkpoint.  A call that raised is recorded anyway, because it may have made
+changes before raising; replaying it must raise the same exception.
+
+Opening a directory loads the latest checkpoint and replays its journal.  checkpoint() starts a new generation: it
+writes the current list as a new checkpoint, starts a new journal (entities, which are not part of the serialized
+list, are re-recorded at its head), and deletes the superseded checkpoint.  Old journals are kept as an audit trail
+unless prune is set.
+"""
+import os
+import re
+import json
+import time
+
+from synlist.synlist import SynList
+
+
+CHECKPOINT = 'checkpoint-%06d.jsonl'
+JOURNAL = 'journal-%06d.jsonl'
+_GENERATION = re.compile(r'^checkpoint-(\d{6})\.jsonl$')
+
+
+class JournalError(Exception):
+    """
+    Replaying a journal did not reproduce the outcome that was recorded
+    """
+    pass
+
+
+class Journal(object):
+    """
+    A SynList (or subclass) whose changes are journaled.  Make changes through the methods of the Journal; queries are
+    passed through to the SynList, which is also available as the 'synlist' attribute.  Entities must be JSON
+    serializable.
+    """
+    def __init__(self, path, cls=SynList, checkpoint_every=None, prune=False, fsync=False, **kwargs):
+        """
+        :param path: the journal directory, created if it does not exist
+        :param cls: [SynList] the class of a new list
+        :param checkpoint_every: [None] start a new generation automatically after this many records
+        :param prune: [False] delete each journal once it is superseded by a checkpoint
+        :param fsync: [False] sync the journal file to disk after every record, not only flush it
+        :param kwargs: passed to the constructor of a new list (e.g. ignore_case), and when loading a checkpoint
+        """
+        self.path = path
+        self._cls = cls
+        self._kwargs = kwargs
+        self._checkpoint_every = checkpoint_every
+        self._prune = prune
+        self._fsync = fsync
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        generations = [int(m.group(1)) for m in map(_GENERATION.match, os.listdir(path)) if m is not None]
+        if generations:
+            self._generation = max(generations)
+            with open(self._file(CHECKPOINT), encoding='utf-8') as fp:
+                self.synlist = cls.load(fp, lines=True, bulk=True, **dict(self._options()))
+            self._records = self._replay()
+            self._fp = open(self._file(JOURNAL), 'a', encoding='utf-8')
+        else:
+            self._generation = -1
+            self.synlist = cls(**kwargs)
+            self._fp = None
+            self.checkpoint()
+
+    def _options(self):
+        return ((k, v) for k, v in self._kwargs.items() if k != 'ignore_case')
+
+    def _file(self, pattern, generation=None):
+        if generation is None:
+            generation = self._generation
+        return os.path.join(self.path, pattern % generation)
+
+    def _replay(self):
+        """
+        Apply the current journal to the checkpoint just loaded.  A partial last line, left by a crash while it was
+        being written, is dropped.
+        :return: the number of records replayed
+        """
+        path = self._file(JOURNAL)
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        with open(path, 'r+', encoding='utf-8') as fp:
+            good = 0
+            for line in iter(fp.readline, ''):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if line.endswith('\n'):
+                        raise JournalError('%s: unreadable record %d' % (path, count + 1))
+                    fp.seek(good)
+                    fp.truncate()
+                    break
+                self._redo(record)
+                good = fp.tell()
+                count += 1
+        return count
+
+    def _call(self, op, args, kwargs):
+        if op == 'add_synonym':
+            args = [self.synlist._get_index(args[0])] + args[1:]  # recorded by term
+        return getattr(self.synlist, op)(*args, **kwargs)
+
+    def _redo(self, record):
+        error = None
+        try:
+            self._call(record['op'], record['args'], record.get('kwargs', {}))
+        except Exception as e:
+            error = e.__class__.__name__
+        if error != record.get('error'):
+            raise JournalError('Replaying %s gave %s instead of %s' % (record, error, record.get('error')))
+
+    def _write(self, record):
+        self._fp.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._fp.flush()
+        if self._fsync:
+            os.fsync(self._fp.fileno())
+        self._records += 1
+
+    def _term(self, term):
+        """
+        A term that identifies the same item as the given term or index
+        """
+        if isinstance(term, int):
+            return self.synlist._name[term]
+        return term
+
+    def _apply(self, op, *args, **kwargs):
+        record = {'op': op, 'args': list(args)}
+        if kwargs:
+            record['kwargs'] = kwargs
+        json.dumps(record)  # fail before making any change if the record cannot be written
+        try:
+            result = self._call(op, list(args), kwargs)
+        except Exception as e:
+            record['error'] = e.__class__.__name__
+            record['time'] = time.time()
+            self._write(record)
+            raise
+        record['time'] = time.time()
+        self._write(record)
+        if self._checkpoint_every is not None and self._records >= self._checkpoint_every:
+            self.checkpoint()
+        return result
+
+    def checkpoint(self):
+        """
+        Start a new generation: write the list as a checkpoint and start an empty journal
+        :return:
+        """
+        previous = self._generation
+        self._generation += 1
+        tmp = self._file(CHECKPOINT) + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fp:
+            self.synlist.dump(fp, lines=True)
+        os.replace(tmp, self._file(CHECKPOINT))
+        if self._fp is not None:
+            self._fp.close()
+        self._fp = open(self._file(JOURNAL), 'w', encoding='utf-8')
+        self._records = 0
+        for i, entity in enumerate(self.synlist._entity):
+            if entity is not None and self.synlist._list[i] is not None:
+                self._write({'op': 'set_entity', 'args': [self.synlist._name[i], entity]})
+        self._records = 0
+        if previous >= 0:
+            os.remove(self._file(CHECKPOINT, previous))
+            if self._prune and os.path.exists(self._file(JOURNAL, previous)):
+                os.remove(self._file(JOURNAL, previous))
+
+    def close(self):
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getattr__(self, item):
+        if item == 'synlist':
+            raise AttributeError(item)
+        return getattr(self.synlist, item)
+
+    def __len__(self):
+        return len(self.synlist)
+
+    def __getitem__(self, term):
+        return self.synlist[term]
+
+    # journaled changes
+
+    def add_term(self, term):
+        return self._apply('add_term', term)
+
+    def add_set(self, it, merge=False):
+        return self._apply('add_set', list(it), merge=merge)
+
+    def add_synonym(self, index, term):
+        return self._apply('add_synonym', self._term(index), term)
+
+    def add_synonyms(self, *terms):
+        return self._apply('add_synonyms', *terms)
+
+    def merge(self, dominant, *terms, **kwargs):
+        return self._apply('merge', self._term(dominant), *[self._term(t) for t in terms], **kwargs)
+
+    def set_name(self, name):
+        return self._apply('set_name', name)
+
+    def split_term(self, term):
+        return self._apply('split_term', term)
+
+    def detach(self, term):
+        return self._apply('detach', term)
+
+    def move(self, term, new_term):
+        return self._apply('move', term, self._term(new_term))
+
+    def set_entity(self, term, entity):
+        return self._apply('set_entity', self._term(term), entity)
+
+    def import_sets(self, sets, policy='skip'):
+        return self._apply('import_sets', [list(s) for s in sets], policy=policy)
+
+    def remove_term(self, term):
+        return self._apply('remove_term', term)
+
+    def set_cas(self, term, cas):
+        return self._apply('set_cas', self._term(term), cas)
+
+    def apply_patch(self, patch):
+        return self._apply('apply_patch', list(patch))
@@ -0,0 +1,456 @@
+"""
+Lexical indices over the sanitized keys of a SynList.
+
+The indices here store *keys*, not item indices: the key->item mapping stays in the SynList's _dict, so merges and
+splits (which only re-point keys) never need to touch a lexical index.  Only the creation of a new key does.
+"""
+import re
+import heapq
+from bisect import bisect_left
+from collections import defaultdict
+
+
+REGEX_META = frozenset('.^$*+?{}[]\\|()')
+
+# escapes that stand for a literal character rather than a character class or assertion
+_LITERAL_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'f': '\f', 'v': '\v'}
+
+_VERBOSE_FLAG = re.compile(r'\(\?[a-zA-Z]*x')
+
+# escapes with arguments: hexadecimal and named characters, octal escapes and backreferences
+_ESCAPE_ARGUMENT = re.compile(r'x[0-9a-fA-F]{0,2}|u[0-9a-fA-F]{0,4}|U[0-9a-fA-F]{0,8}|N(\{[^}]*\}?)?|0[0-7]{0,2}|'
+                              r'[0-7]{3}|[1-9][0-9]?')
+
+
+def is_literal(pattern):
+    """
+    True if the pattern contains no regular expression metacharacters, i.e. it can only match itself.
+    :param pattern:
+    :return:
+    """
+    return not any(c in REGEX_META for c in pattern)
+
+
+def literal_fragments(pattern):
+    """
+    Extract the literal runs of text that any match of a simple regular expression must contain.  This is
+    deliberately conservative: anything inside a group is ignored, character classes and wildcards break runs, and
+    a quantified character is dropped from its run unless it must occur at least once.  Non-ASCII characters also break
+    runs, since case-insensitive matching of them does not always agree with str.lower().
+
+    :param pattern: a regular expression
+    :return: a list of lowercased fragments (possibly empty), or None if the pattern has a top-level alternation and
+     therefore no required text.
+    """
+    if _VERBOSE_FLAG.search(pattern):
+        return []  # whitespace in the pattern is not literal
+    fragments = []
+    run = []
+    depth = 0
+    last_literal = False
+    i = 0
+    n = len(pattern)
+
+    def _end_run():
+        if run:
+            fragments.append(''.join(run).lower())
+            del run[:]
+
+    while i < n:
+        c = pattern[i]
+        was_literal, last_literal = last_literal, False
+        if c == '\\':
+            nxt = pattern[i + 1:i + 2]
+            if depth == 0 and nxt and (not nxt.isalnum() or nxt in _LITERAL_ESCAPES) and nxt.isascii():
+                run.append(_LITERAL_ESCAPES.get(nxt, nxt))
+                last_literal = True
+            else:
+                _end_run()
+                m = _ESCAPE_ARGUMENT.match(pattern, i + 1)
+                if m:
+                    i += len(m.group()) + 1
+                    continue
+            i += 2
+            continue
+        if c == '[':
+            _end_run()
+            # skip the character class; a ']' immediately after '[' or '[^' is literal
+            i += 1
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < n and pattern[i] != ']':
+                if pattern[i] == '\\':
+                    i += 1
+                i += 1
+            i += 1
+            continue
+        if c == '(':
+            _end_run()
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|':
+            if depth == 0:
+                return None
+        elif c in '*?{':
+            optional = c != '{' or pattern[i + 1:i + 2] in ('0', ',')
+            if optional and was_literal:
+                run.pop()
+            _end_run()
+            if c == '{':
+                close = pattern.find('}', i)
+                i = n if close < 0 else close
+            if pattern[i + 1:i + 2] in ('?', '+'):
+                i += 1  # lazy or possessive modifier
+        elif c == '+':
+            _end_run()
+            if pattern[i + 1:i + 2] in ('?', '+'):
+                i += 1
+        elif c in '.^$':
+            _end_run()
+        elif depth == 0 and c.isascii():
+            run.append(c)
+            last_literal = True
+        else:
+            _end_run()
+        i += 1
+    _end_run()
+    return fragments
+
+
+class TrigramIndex(object):
+    """
+    Postings from each case-folded character trigram to the set of keys that contain it.  Keys shorter than three
+    characters are not indexed, since they can never contain a fragment long enough to be looked up.
+    """
+    def __init__(self):
+        self._postings = defaultdict(set)
+
+    @staticmethod
+    def _grams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def __len__(self):
+        return len(self._postings)
+
+    def add(self, key):
+        for g in self._grams(key.lower()):
+            self._postings[g].add(key)
+
+    def discard(self, key):
+        for g in self._grams(key.lower()):
+            post = self._postings.get(g)
+            if post is not None:
+                post.discard(key)
+                if len(post) == 0:
+                    del self._postings[g]
+
+    def candidates(self, fragments):
+        """
+        Keys that contain every trigram of every fragment.  The result is a superset of the keys that actually
+        contain the fragments, and must be verified by the caller.
+        :param fragments: lowercased literal fragments
+        :return: a set of keys, or None if no fragment is long enough to narrow the search
+        """
+        grams = set()
+        for f in fragments:
+            grams.update(self._grams(f))
+        if len(grams) == 0:
+            return None
+        posts = []
+        for g in grams:
+            post = self._postings.get(g)
+            if post is None:
+                return set()
+            posts.append(post)
+        posts.sort(key=len)
+        found = set(posts[0])
+        for post in posts[1:]:
+            found.intersection_update(post)
+            if len(found) == 0:
+                break
+        return found
+
+
+class PrefixIndex(object):
+    """
+    The keys in case-folded sorted order, for prefix queries.  New keys are collected in a small unsorted buffer and
+    merged into the sorted list in batches, so that adding a key does not shift the whole list; a query sorts the
+    buffer and reads from both.  The buffer is merged once it holds more than about the square root of the number of
+    sorted keys.  A discarded key is only forgotten; its folded text stays in the lists and is skipped.
+    """
+    def __init__(self):
+        self._sorted = []  # case-folded keys
+        self._pending = []
+        self._pending_sorted = True
+        self._keys = dict()  # case-folded key -> key, or a tuple of keys that fold to the same text
+        self._gone = set()  # case-folded keys still in the lists whose keys have all been discarded
+
+    def __len__(self):
+        return len(self._sorted) + len(self._pending) - len(self._gone)
+
+    def add(self, key):
+        folded = key.lower()
+        held = self._keys.get(folded)
+        if held is None:
+            self._keys[folded] = key
+            if folded in self._gone:
+                self._gone.discard(folded)
+            else:
+                self._pending.append(folded)
+                self._pending_sorted = False
+        elif isinstance(held, tuple):
+            if key not in held:
+                self._keys[folded] = held + (key,)
+        elif held != key:
+            self._keys[folded] = (held, key)
+
+    def discard(self, key):
+        folded = key.lower()
+        held = self._keys.get(folded)
+        if isinstance(held, tuple):
+            rest = tuple(k for k in held if k != key)
+            self._keys[folded] = rest[0] if len(rest) == 1 else rest
+        elif held == key:
+            del self._keys[folded]
+            self._gone.add(folded)
+
+    def _settle(self):
+        if len(self._pending) ** 2 > len(self._sorted) + 1024:
+            self._sorted.extend(self._pending)
+            self._sorted.sort()  # two sorted runs: timsort merges them in linear time
+            self._pending = []
+        elif not self._pending_sorted:
+            self._pending.sort()
+        self._pending_sorted = True
+
+    @staticmethod
+    def _starting(folded_keys, prefix):
+        for i in range(bisect_left(folded_keys, prefix), len(folded_keys)):
+            k = folded_keys[i]
+            if not k.startswith(prefix):
+                break
+            yield k
+
+    def keys(self, prefix):
+        """
+        Keys that start with the prefix, ignoring case, in case-folded order
+        :param prefix: lowercased text
+        :return: a generator of keys
+        """
+        self._settle()
+        for folded in heapq.merge(self._starting(self._sorted, prefix), self._starting(self._pending, prefix)):
+            held = self._keys.get(folded)
+            if held is None:
+                continue
+            if isinstance(held, tuple):
+                for key in sorted(held):
+                    yield key
+            else:
+                yield held
+
+
+def edit_distance(a, b, limit):
+    """
+    Levenshtein distance between two strings, computed only as far as needed to tell whether it is within a limit
+    :param a:
+    :param b:
+    :param limit: the largest distance of interest
+    :return: the distance, or None if it exceeds the limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return None
+    if len(a) > len(b):
+        a, b = b, a
+    # trim the common prefix and suffix, which never add to the distance
+    start = 0
+    while start < len(a) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a = a[start:len(a) - end]
+    b = b[start:len(b) - end]
+    if not a:
+        return len(b) if len(b) <= limit else None
+    # only cells within the limit of the diagonal can lead to a distance within the limit
+    n = len(b)
+    far = limit + 1
+    previous = [j if j <= limit else far for j in range(n + 1)]
+    for i, ca in enumerate(a, 1):
+        lo = max(1, i - limit)
+        hi = min(n, i + limit)
+        current = [far] * (n + 1)
+        current[0] = i if i <= limit else far
+        best = current[lo - 1]
+        for j in range(lo, hi + 1):
+            d = previous[j - 1] + (ca != b[j - 1])
+            if previous[j] + 1 < d:
+                d = previous[j] + 1
+            if current[j - 1] + 1 < d:
+                d = current[j - 1] + 1
+            current[j] = d
+            if d < best:
+                best = d
+        if best > limit:
+            return None
+        previous = current
+    return previous[n] if previous[n] <= limit else None
+
+
+def deletes(text, distance):
+    """
+    Every string obtained by deleting up to the given number of characters from the text, including the text itself
+    """
+    found = {text}
+    edge = {text}
+    for _ in range(distance):
+        edge = {t[:i] + t[i + 1:] for t in edge for i in range(len(t))}
+        found |= edge
+    return found
+
+
+class DeletionIndex(object):
+    """
+    Candidate keys for approximate matching, after the symmetric-deletion method (SymSpell): two strings within edit
+    distance d of each other have a common string among their variants with up to d characters deleted.  To bound the
+    number of variants, they are generated only from short windows at each end of a key: if two keys are within
+    distance d, then so are (in this symmetric-deletion sense) their leading windows, and their trailing windows.
+
+    Keys are grouped by leading window and by trailing window, and each window's deletion variants point to the
+    windows they came from.  A query looks up the variants of both of its windows, reads the keys of the smaller side
+    and keeps those whose other window was also hit.  The survivors are then checked with edit_distance().
+
+    Windows and variants are held by their hash() rather than as strings, and a window or variant with a single entry
+    holds it directly rather than in a list; this keeps the index to a few times the size of the keys themselves.  Two
+    windows with the same hash would share their entries, which only adds candidates; at 64 bits it does not happen in
+    practice.  hash() of a string differs between processes, so a pickled index holds only its keys and is rebuilt when
+    it is unpickled.
+    """
+    def __init__(self, max_distance=2, window=7):
+        self.max_distance = max_distance
+        self.window = window
+        self._heads = dict()  # hash of leading window -> key, or list of keys
+        self._tails = dict()
+        self._head_variants = dict()  # hash of deletion variant -> hash of window, or list of them
+        self._tail_variants = dict()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __getstate__(self):
+        keys = []
+        for held in self._heads.values():
+            if isinstance(held, list):
+                keys.extend(held)
+            else:
+                keys.append(held)
+        return {'max_distance': self.max_distance, 'window': self.window, 'keys': keys}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_distance'], state['window'])
+        for key in state['keys']:
+            self.add(key)
+
+    def _register(self, groups, variants, w, key):
+        h = hash(w)
+        held = groups.get(h)
+        if held is not None:
+            if isinstance(held, list):
+                held.append(key)
+            else:
+                groups[h] = [held, key]
+            return
+        groups[h] = key
+        for v in deletes(w, self.max_distance):
+            v = hash(v)
+            held = variants.setdefault(v, h)
+            if held is h:
+                continue
+            if isinstance(held, list):
+                held.append(h)
+            else:
+                variants[v] = [held, h]
+
+    @staticmethod
+    def _unregister(groups, w, key):
+        h = hash(w)
+        held = groups[h]
+        if isinstance(held, list):
+            held.remove(key)
+        else:
+            groups[h] = []  # the window's variants still point to it
+
+    def add(self, key):
+        """
+        :param key: a key not already in the index
+        """
+        self._register(self._heads, self._head_variants, key[:self.window], key)
+        self._register(self._tails, self._tail_variants, key[-self.window:], key)
+        self._count += 1
+
+    def discard(self, key):
+        """
+        Forget a key.  Its windows and their variants are kept, since other keys may share them.
+        :param key: a key in the index
+        """
+        self._unregister(self._heads, key[:self.window], key)
+        self._unregister(self._tails, key[-self.window:], key)
+        self._count -= 1
+
+    def _windows(self, variants, w, distance):
+        hit = set()
+        for v in deletes(w, distance):
+            held = variants.get(hash(v))
+            if held is None:
+                continue
+            if isinstance(held, list):
+                hit.update(held)
+            else:
+                hit.add(held)
+        return hit
+
+    @staticmethod
+    def _size(held):
+        return len(held) if isinstance(held, list) else 1
+
+    @staticmethod
+    def _keys_behind(groups, hits, other_groups, other_hits):
+        """
+        True if the windows hit on one side hold no more keys than those hit on the other side.  The side with fewer
+        windows is counted in full first, and the other only as far as needed.
+        """
+        if len(hits) > len(other_hits):
+            return not DeletionIndex._keys_behind(other_groups, other_hits, groups, hits)
+        size = DeletionIndex._size
+        total = sum(size(groups[w]) for w in hits)
+        other = 0
+        for w in other_hits:
+            other += size(other_groups[w])
+            if other >= total:
+                return True
+        return False
+
+    def candidates(self, text, distance):
+        """
+        Keys that may be within the given edit distance of the text; a superset, to be verified by the caller
+        :param text: a sanitized term
+        :param distance: at most max_distance
+        :return: a generator of keys
+        """
+        heads = self._windows(self._head_variants, text[:self.window], distance)
+        tails = self._windows(self._tail_variants, text[-self.window:], distance)
+        if self._keys_behind(self._heads, heads, self._tails, tails):
+            groups, others, cut = self._heads, tails, slice(-self.window, None)
+            hits = heads
+        else:
+            groups, others, cut = self._tails, heads, slice(None, self.window)
+            hits = tails
+        for w in hits:
+            held = groups[w]
+            for key in (held if isinstance(held, list) else (held,)):
+                if hash(key[cut]) in others:
+                    yield key
@@ -0,0 +1,205 @@
+"""
+A binary file format for SynLists that can be memory-mapped and queried in place, so that any number of processes can
+share one copy of the list through the page cache.
+
+The file is written from the tables of a PackedSynList (see synlist.packed).  After a 64-byte header, it holds a
+sequence of arrays of native-order uint32, each starting on a 4-byte boundary:
+
+ * string offsets [n_strings + 1], followed by the UTF-8 string bytes (padded)
+ * hash index [2 * n_slots]: (key string id, item index) pairs, open addressing with linear probing on the CRC-32 of
+   the key's UTF-8 bytes; empty slots hold NONE
+ * item offsets [n_items + 1] and item terms [n_terms]: the synonyms of item i are string ids
+   terms[offsets[i]:offsets[i + 1]]
+ * names [n_items]: string id of each item's canonical name
+ * cas [n_items]: string id of each item's padded CAS number (Flowables only)
+"""
+import sys
+import mmap
+import struct
+import zlib
+from array import array
+
+from synlist.packed import NONE
+from synlist.readonly import ReadOnlySynList, ReadOnlyFlowables
+
+
+MAGIC = b'SYNLIST1'
+HEADER = struct.Struct('<8s8I')
+HEADER_SIZE = 64
+
+IGNORE_CASE = 0x1
+FLOWABLES = 0x2
+BIG_ENDIAN = 0x4
+
+
+def _pad(n):
+    return (4 - n % 4) % 4
+
+
+def _hash_index(packed):
+    """
+    Build the open-addressing hash table for the keys of a packed SynList.  The table has a power-of-two number of slots
+    and is at most half full.
+    :param packed:
+    :return: n_slots, array('I') of 2 * n_slots entries
+    """
+    n_slots = 8
+    while n_slots < 2 * len(packed._key_str):
+        n_slots *= 2
+    mask = n_slots - 1
+    slots = array('I', [NONE]) * (2 * n_slots)
+    for sid, item in zip(packed._key_str, packed._key_item):
+        h = zlib.crc32(packed._bytes(sid)) & mask
+        while slots[2 * h] != NONE:
+            h = (h + 1) & mask
+        slots[2 * h] = sid
+        slots[2 * h + 1] = item
+    return n_slots, slots
+
+
+def write_binary(packed, path):
+    """
+    Write a PackedSynList (or PackedFlowables) in the memory-mappable format.
+    :param packed:
+    :param path:
+    :return: the number of bytes written
+    """
+    flags = 0
+    if packed._ignore_case:
+        flags |= IGNORE_CASE
+    cas = getattr(packed, '_cas', None)
+    if cas is not None:
+        flags |= FLOWABLES
+    if sys.byteorder == 'big':
+        flags |= BIG_ENDIAN
+    n_slots, slots = _hash_index(packed)
+    n_items = len(packed._names)
+    n_live = len(packed)
+    header = HEADER.pack(MAGIC, flags, len(packed._offsets) - 1, len(packed._strings), n_slots, n_items,
+                         len(packed._item_terms), n_live, 0)
+    with open(path, 'wb') as fp:
+        fp.write(header + b'\x00' * (HEADER_SIZE - len(header)))
+        packed._offsets.tofile(fp)
+        fp.write(packed._strings + b'\x00' * _pad(len(packed._strings)))
+        slots.tofile(fp)
+        packed._item_off.tofile(fp)
+        packed._item_terms.tofile(fp)
+        packed._names.tofile(fp)
+        if cas is not None:
+            cas.tofile(fp)
+        return fp.tell()
+
+
+class MappedSynList(ReadOnlySynList):
+    """
+    Read-only SynList queried directly from a memory-mapped binary file.  Nothing is deserialized on opening; each
+    lookup hashes the sanitized key and probes the file's hash index.  Pickling a MappedSynList pickles only its path.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._fp = open(path, 'rb')
+        self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, flags, n_strings, n_bytes, n_slots, n_items, n_terms, n_live, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a SynList binary file' % path)
+        if bool(flags & BIG_ENDIAN) != (sys.byteorder == 'big'):
+            raise ValueError('%s was written on a machine with different byte order' % path)
+        self._ignore_case = bool(flags & IGNORE_CASE)
+        self._flowables = bool(flags & FLOWABLES)
+        self._count = n_live
+        self._n_slots = n_slots
+        self._mask = n_slots - 1
+
+        mv = memoryview(self._mm)
+        pos = HEADER_SIZE
+
+        def _section(n, fmt='I'):
+            nonlocal pos
+            size = n * 4 if fmt == 'I' else n
+            sec = mv[pos:pos + size]
+            pos += size + _pad(size)
+            return sec.cast(fmt) if fmt == 'I' else sec
+
+        self._offsets = _section(n_strings + 1)
+        self._strings = _section(n_bytes, 'B')
+        self._slots = _section(2 * n_slots)
+        self._item_off = _section(n_items + 1)
+        self._item_terms = _section(n_terms)
+        self._names = _section(n_items)
+        self._cas = _section(n_items) if self._flowables else None
+
+    def close(self):
+        for attr in ('_offsets', '_strings', '_slots', '_item_off', '_item_terms', '_names', '_cas'):
+            sec = getattr(self, attr)
+            if sec is not None:
+                sec.release()
+            setattr(self, attr, None)
+        self._mm.close()
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __reduce__(self):
+        return self.__class__, (self.path,)
+
+    def _string(self, i):
+        if i == NONE:
+            return None
+        return str(self._strings[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+    def _find(self, key):
+        target = key.encode('utf-8')
+        slots = self._slots
+        offsets = self._offsets
+        h = zlib.crc32(target) & self._mask
+        while True:
+            sid = slots[2 * h]
+            if sid == NONE:
+                raise KeyError(key)
+            if self._strings[offsets[sid]:offsets[sid + 1]] == target:
+                return slots[2 * h + 1]
+            h = (h + 1) & self._mask
+
+    def _get_index(self, term):
+        if term is None:
+            raise KeyError
+        if isinstance(term, int):
+            if term < len(self._names):
+                return term
+            raise IndexError('Item index out of range')
+        return self._find(self._sanitize(term))
+
+    def __len__(self):
+        return self._count
+
+    def _item_name(self, index):
+        return self._string(self._names[index])
+
+    def _synonyms(self, index):
+        return [self._string(i) for i in self._item_terms[self._item_off[index]:self._item_off[index + 1]]]
+
+    def _source_name(self):
+        return 'Flowables' if self._flowables else 'SynList'
+
+    def synonym_set(self, index):
+        start, end = self._item_off[index], self._item_off[index + 1]
+        if start == end:
+            return None
+        return set(self._string(i) for i in self._item_terms[start:end])
+
+
+class MappedFlowables(ReadOnlyFlowables, MappedSynList):
+    """
+    Memory-mapped Flowables, with CAS lookups.
+    """
+    def __init__(self, path):
+        super(MappedFlowables, self).__init__(path)
+        if not self._flowables:
+            raise ValueError('%s does not contain Flowables' % path)
+
+    def _padded_cas(self, index):
+        return self._string(self._cas[index])
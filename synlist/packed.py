@@ -0,0 +1,166 @@
+"""
+Read-only, array-backed storage for a SynList.
+
+A PackedSynList holds the same items as the SynList it was made from, but stores each distinct string (term or key)
+once, UTF-8 encoded, in a single byte string.  Everything else is an array('I') of string ids or offsets:
+
+ * _offsets: start of string i in _strings is _offsets[i]; end is _offsets[i + 1]
+ * _key_str, _key_item: the sanitized keys as string ids, sorted, and the item each one refers to
+ * _item_off, _item_terms: the synonyms of item i are the string ids _item_terms[_item_off[i]:_item_off[i + 1]]
+ * _names: the canonical name of each item, as a string id
+
+Lookups binary-search the sorted key table.  Item indices are the same as in the source SynList.
+"""
+from array import array
+
+from synlist.readonly import ReadOnlySynList, ReadOnlyFlowables
+
+
+NONE = 0xFFFFFFFF  # string id standing for None
+
+
+class PackedSynList(ReadOnlySynList):
+    """
+    Immutable, compact copy of a SynList.  Provides the SynList query API; use to_synlist() to get back a mutable
+    SynList.
+    """
+    @classmethod
+    def from_synlist(cls, synlist):
+        synlist._require_all()
+        p = cls(synlist._ignore_case, synlist.__class__)
+        p._pack(synlist)
+        return p
+
+    def __init__(self, ignore_case, source):
+        """
+        :param ignore_case:
+        :param source: the class of the SynList being packed, which to_synlist() will construct
+        """
+        self._ignore_case = ignore_case
+        self._source = source
+        self._strings = b''
+        self._offsets = array('I', [0])
+        self._ids = dict()  # used only while packing
+        self._key_str = array('I')
+        self._key_item = array('I')
+        self._item_off = array('I', [0])
+        self._item_terms = array('I')
+        self._names = array('I')
+        self._entity = dict()
+
+    def _intern(self, buf, string):
+        if string is None:
+            return NONE
+        i = self._ids.get(string)
+        if i is None:
+            i = len(self._offsets) - 1
+            buf += string.encode('utf-8')
+            self._offsets.append(len(buf))
+            self._ids[string] = i
+        return i
+
+    def _pack(self, synlist):
+        buf = bytearray()
+        for i, terms in enumerate(synlist._list):
+            if terms is not None:
+                self._item_terms.extend(self._intern(buf, t) for t in terms)
+                if synlist._entity[i] is not None:
+                    self._entity[i] = synlist._entity[i]
+            self._item_off.append(len(self._item_terms))
+            self._names.append(self._intern(buf, synlist._name[i]))
+        # code point order of str is the same as byte order of its UTF-8 encoding
+        for k in sorted(synlist._dict.keys()):
+            self._key_str.append(self._intern(buf, k))
+            self._key_item.append(synlist._lookup(k))
+        self._pack_extra(synlist, buf)
+        self._strings = bytes(buf)
+        self._ids = dict()
+
+    def _pack_extra(self, synlist, buf):
+        pass
+
+    def _string(self, i):
+        if i == NONE:
+            return None
+        return self._strings[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+
+    def _bytes(self, i):
+        return self._strings[self._offsets[i]:self._offsets[i + 1]]
+
+    def _find(self, key):
+        target = key.encode('utf-8')
+        lo = 0
+        hi = len(self._key_str)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(self._key_str[mid]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._key_str) and self._bytes(self._key_str[lo]) == target:
+            return self._key_item[lo]
+        raise KeyError(key)
+
+    def _get_index(self, term):
+        if term is None:
+            raise KeyError
+        if isinstance(term, int):
+            if term < len(self._names):
+                return term
+            raise IndexError('Item index out of range')
+        return self._find(self._sanitize(term))
+
+    def __len__(self):
+        return sum(1 for i in range(len(self._names)) if self._item_off[i] < self._item_off[i + 1])
+
+    def _item_name(self, index):
+        return self._string(self._names[index])
+
+    def _synonyms(self, index):
+        return [self._string(i) for i in self._item_terms[self._item_off[index]:self._item_off[index + 1]]]
+
+    def entity(self, term):
+        return self._entity.get(self._get_index(term))
+
+    def all_terms(self):
+        return [self._string(i) for i in self._key_str]
+
+    def synonym_set(self, index):
+        start, end = self._item_off[index], self._item_off[index + 1]
+        if start == end:
+            return None
+        return set(self._string(i) for i in self._item_terms[start:end])
+
+    def to_synlist(self, **kwargs):
+        """
+        A mutable SynList (of the original class) with the same items.  Item indices are not preserved.
+        :param kwargs: passed to the constructor
+        :return:
+        """
+        return self._source.from_json(self.serialize(), bulk=True, **kwargs)
+
+    def nbytes(self):
+        """
+        Size of the packed tables, in bytes (not counting entities)
+        :return:
+        """
+        arrays = (self._offsets, self._key_str, self._key_item, self._item_off, self._item_terms, self._names)
+        return len(self._strings) + sum(a.itemsize * len(a) for a in arrays)
+
+
+class PackedFlowables(ReadOnlyFlowables, PackedSynList):
+    """
+    Packed copy of a Flowables.  The CAS number of each item is kept as the string id of its padded key.
+    """
+    def __init__(self, ignore_case, source):
+        super(PackedFlowables, self).__init__(ignore_case, source)
+        self._cas = array('I')
+
+    def _pack_extra(self, synlist, buf):
+        self._cas.extend(self._intern(buf, synlist.cas(i)) for i in range(len(synlist._cas)))
+
+    def _padded_cas(self, index):
+        return self._string(self._cas[index])
+
+    def nbytes(self):
+        return super(PackedFlowables, self).nbytes() + self._cas.itemsize * len(self._cas)
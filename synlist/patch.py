@@ -0,0 +1,302 @@
+"""
+Differences between two versions of a SynList, as a patch that turns one into the other: to keep copies in step by
+shipping only what changed, rather than the whole serialized list.
+
+A patch is a list of records in the format of the journal (see synlist.journal): {"op": method name, "args": [...]},
+with "kwargs" where needed.  Items are named by a term, never by index, since indices differ between copies.  The
+operations are merge, detach, move, add_set, add_synonyms, add_synonym (whose first argument is a term of the item),
+set_name, remove_term and, for a Flowables, set_cas, so a patch applied through a Journal is recorded like any other
+change.
+
+diff() aligns the items of the two versions through the keys they share, in time proportional to the number of terms:
+each old item follows the new item that holds most of its keys, and of the old items following a new item, the one
+holding most of its keys (with Flowables, preferably the one with its CAS number) is its 'home'.  The patch then
+ * merges the other old items that follow a new item into its home
+ * names each home after a term that stays in it, so that no name has to move
+ * moves the keys that end up in another item, detaching the first key of a new item that has no home
+ * adds the terms that are new, renames the items, and removes the terms that are gone: an old item none of whose
+   keys survive is removed term by term
+ * with Flowables, sets the canonical CAS number of each item whose CAS numbers changed.  A CAS number only ever joins
+   an item by a merge with multi_cas=True, so that it cannot conflict with the numbers the item holds on the way.
+
+Terms are compared spelling by spelling.  Spellings that a class does not keep (a Flowables drops a second spelling of
+a key, and a CAS number is kept in the spellings it was added in) are left as they are.  Entities are not compared.
+"""
+
+OPS = ('merge', 'detach', 'move', 'add_set', 'add_synonyms', 'add_synonym', 'set_name', 'remove_term', 'set_cas')
+
+
+class PatchError(Exception):
+    pass
+
+
+def _items(synlist):
+    """
+    The live items of a SynList with their terms grouped by key
+    :param synlist:
+    :return: a list of (name, {key: set of terms}, cas) for the live items, and a dict key -> position in the list
+    """
+    synlist._require_all()
+    items = []
+    where = dict()
+    for index, terms in enumerate(synlist._list):
+        if terms is None:
+            continue
+        keyed = dict()
+        for t in terms:
+            keyed.setdefault(synlist._term_key(t), set()).add(t)
+        for k in keyed:
+            where[k] = len(items)
+        items.append((synlist._name[index], keyed, synlist._item_cas(index)))
+    return items, where
+
+
+class _Patch(object):
+    """
+    The state of a diff under construction.  New items are referred to by their position j in the new version.  For
+    each of them the patch keeps track of a term that identifies the item standing for it on the old side (its anchor)
+    and of that item's name, as far as it is known.
+    """
+    def __init__(self, old, new):
+        self.records = []
+        self.old, self.where = _items(old)
+        self.new, _ = _items(new)
+        self.term_key = old._term_key
+        self.key_cas = old._key_cas
+        self.spellings = old._spellings
+        self.anchor = dict()
+        self.current = dict()
+        self.touched = set()  # new items whose canonical CAS number may differ from the one they should have
+
+    def emit(self, op, *args, **kwargs):
+        self.records.append({'op': op, 'args': list(args), 'kwargs': kwargs} if kwargs else
+                            {'op': op, 'args': list(args)})
+
+    def ref(self, term):
+        """
+        A term to find an item by: a CAS number is looked up in its padded form, which is always a key
+        """
+        key = self.term_key(term)
+        return term if self.key_cas(key) is None else key
+
+    def _grown(self, j):
+        """
+        Terms were added to item j: a Flowables replaces a name that is a CAS number with the first other term added
+        """
+        name = self.current.get(j)
+        if name is not None and self.key_cas(self.term_key(name)) is not None:
+            self.current[j] = None
+
+    def _join(self, j, term):
+        """
+        Merge the item that term was just made into into item j: a CAS number never collides this way
+        """
+        self.emit('merge', self.anchor[j], term, multi_cas=True)
+        self.touched.add(j)
+
+    def align(self):
+        """
+        :return: the new item each old item follows, and the home of each new item: {old: new}, {new: old}
+        """
+        best = dict()  # old item -> (shared keys, new item)
+        for j, (_, keyed, _) in enumerate(self.new):
+            counts = dict()
+            for k in keyed:
+                i = self.where.get(k)
+                if i is not None:
+                    counts[i] = counts.get(i, 0) + 1
+            for i, c in counts.items():
+                if i not in best or c > best[i][0]:
+                    best[i] = (c, j)
+        home = dict()
+        for i in sorted(best):
+            c, j = best[i]
+            rank = (self.old[i][2] is not None and self.old[i][2] == self.new[j][2], c)
+            if j not in home or rank > home[j][0]:
+                home[j] = (rank, i)
+        return dict((i, j) for i, (c, j) in best.items()), dict((j, i) for j, (_, i) in home.items())
+
+    def merges(self, follows, home):
+        followers = dict()
+        for i in sorted(follows):
+            if home[follows[i]] != i:
+                followers.setdefault(follows[i], []).append(i)
+        for j, h in sorted(home.items()):
+            if self.old[h][2] != self.new[j][2]:
+                self.touched.add(j)
+            others = followers.get(j)
+            if others is None:
+                continue
+            terms = [self.ref(self.old[i][0]) for i in [h] + others]
+            if any(self.old[i][2] is not None for i in others):
+                self.emit('merge', *terms, multi_cas=True)
+                self.touched.add(j)
+            else:
+                self.emit('merge', *terms)
+
+    def names(self, follows, home):
+        """
+        Name each home after a term that stays in it, preferably its new name, so that no name has to move
+        """
+        for j, h in sorted(home.items()):
+            name, keyed, _ = self.new[j]
+            old_name, old_keyed, _ = self.old[h]
+            k = self.term_key(name)
+            i = self.where.get(k)
+            if k in keyed and i is not None and name in self.old[i][1][k] and follows[i] == j:
+                staying = name
+            elif self.term_key(old_name) in keyed:
+                staying = old_name
+            else:
+                staying = self.ref(min(min(old_keyed[k]) for k in old_keyed if k in keyed))
+            if staying != old_name:
+                self.emit('set_name', staying)
+            self.anchor[j] = self.current[j] = staying
+
+    def moves(self, follows):
+        """
+        Move the keys that end up in another item.  A CAS number is detached and merged in, so that it cannot collide
+        with a CAS number of the item it goes to.
+        """
+        for j, (_, keyed, _) in enumerate(self.new):
+            for k in sorted(keyed):
+                i = self.where.get(k)
+                if i is None or follows[i] == j:
+                    continue
+                term = self.ref(min(self.old[i][1][k]))
+                cas = self.key_cas(k) is not None
+                if cas:
+                    self.touched.update((j, follows[i]))
+                if j not in self.anchor:
+                    self.emit('detach', term)
+                    self.anchor[j] = self.current[j] = term
+                elif cas:
+                    self.emit('detach', term)
+                    self._join(j, term)
+                else:
+                    self.emit('move', term, self.anchor[j])
+
+    def additions(self):
+        """
+        Add the terms that are new.  A new item is made from its new terms; it takes at most one CAS number that way,
+        and any others are merged in.
+        """
+        for j, (name, keyed, _) in enumerate(self.new):
+            fresh = []
+            numbers = []
+            for k in sorted(keyed):
+                i = self.where.get(k)
+                if i is not None:
+                    if self.spellings:
+                        for t in sorted(keyed[k] - self.old[i][1][k]):
+                            self.emit('add_synonym', self.anchor[j], t)  # another spelling of a key it holds
+                    continue
+                if self.key_cas(k) is not None:
+                    if j in self.anchor or numbers:
+                        numbers.append(sorted(keyed[k]))
+                        continue
+                    numbers.append(None)
+                fresh.extend(sorted(keyed[k]))
+            if fresh:
+                if j in self.anchor:
+                    self.emit('add_synonyms', self.anchor[j], *fresh)
+                    self._grown(j)
+                else:
+                    if name in fresh:
+                        fresh.remove(name)
+                        fresh.insert(0, name)
+                    self.emit('add_set', fresh)
+                    self.anchor[j] = self.current[j] = self.ref(fresh[0])
+                    if len(fresh) > 1:
+                        self._grown(j)
+            for terms in numbers:
+                if terms is not None:
+                    self.emit('add_set', terms)
+                    self._join(j, self.ref(terms[0]))
+                    self._grown(j)
+            if numbers:
+                self.touched.add(j)
+
+    def renames(self):
+        for j, (name, _, _) in enumerate(self.new):
+            if self.current.get(j) != name:
+                self.emit('set_name', name)
+                self.current[j] = name
+
+    def removals(self, follows):
+        """
+        Remove the terms that are gone.  An old item none of whose keys survive is removed term by term, its name last.
+        """
+        gone = dict()
+        for _, keyed, _ in self.new:
+            gone.update(keyed)
+        for i, (name, keyed, _) in enumerate(self.old):
+            last = []
+            for k in sorted(keyed):
+                if k in gone:
+                    if not self.spellings:
+                        continue
+                    terms = keyed[k] - gone[k]
+                else:
+                    # without spellings, one removal takes every spelling of the key
+                    terms = keyed[k] if self.spellings else [self.ref(min(keyed[k]))]
+                    if i in follows and self.key_cas(k) is not None:
+                        self.touched.add(follows[i])
+                for t in sorted(terms):
+                    if i not in follows and (t == name if self.spellings else k == self.term_key(name)):
+                        last.append(t)
+                    else:
+                        self.emit('remove_term', t)
+            for t in last:
+                self.emit('remove_term', t)
+
+    def canonical(self):
+        """
+        Settle the canonical CAS number of the items whose CAS numbers changed
+        """
+        for j in sorted(self.touched):
+            name, keyed, n = self.new[j]
+            self.emit('set_cas', self.ref(name), None if n is None else next(k for k in keyed if self.key_cas(k) == n))
+
+    def build(self):
+        follows, home = self.align()
+        self.merges(follows, home)
+        self.names(follows, home)
+        self.moves(follows)
+        self.additions()
+        self.renames()
+        self.removals(follows)
+        self.canonical()
+        return self.records
+
+
+def diff(old, new):
+    """
+    A patch that turns old into new (see module docstring)
+    :param old: a SynList
+    :param new: a SynList of the same class and ignore_case
+    :return: a list of records
+    """
+    if old._ignore_case != new._ignore_case:
+        raise ValueError('Cannot compare SynLists with different ignore_case')
+    return _Patch(old, new).build()
+
+
+def apply_patch(synlist, patch):
+    """
+    Replay a patch made by diff() onto a copy of its old version
+    :param synlist:
+    :param patch: a list of records
+    :return: the number of records applied
+    """
+    count = 0
+    for record in patch:
+        op = record['op']
+        if op not in OPS:
+            raise PatchError('Not a patch operation: %s' % op)
+        args = list(record['args'])
+        if op == 'add_synonym':
+            args[0] = synlist._get_index(args[0])  # recorded by term
+        getattr(synlist, op)(*args, **record.get('kwargs', {}))
+        count += 1
+    return count
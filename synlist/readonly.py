@@ -0,0 +1,94 @@
+"""
+The query API shared by the read-only SynLists: frozen snapshots (synlist.frozen), packed copies (synlist.packed) and
+memory-mapped files (synlist.mapped).  Each of them stores its items differently; the queries are written once here in
+terms of a few accessors that the storage provides.
+"""
+from synlist.batch import BatchLookup
+
+
+class ReadOnlySynList(BatchLookup):
+    """
+    Subclasses provide _get_index(term), synonym_set(index), _item_name(index) and _synonyms(index), and hold
+    _ignore_case and the _names of their items.
+    """
+    def _sanitize(self, key):
+        key = key.strip()
+        if self._ignore_case:
+            key = key.lower()
+        return key
+
+    def _known(self, term):
+        if term is None:
+            return None
+        try:
+            return self._get_index(term)
+        except KeyError:
+            return None
+
+    def _item_name(self, index):
+        raise NotImplementedError
+
+    def _synonyms(self, index):
+        """
+        :param index:
+        :return: the synonyms of an item, as a sequence; empty for an empty slot
+        """
+        raise NotImplementedError
+
+    def _source_name(self):
+        """
+        The name of the class the list was made from, under which serialize() lists the items
+        :return:
+        """
+        return self._source.__name__
+
+    def index(self, term):
+        return self._known(term)
+
+    def name(self, term):
+        return self._item_name(self._get_index(term))
+
+    def synonyms_for(self, term):
+        inx = self._known(term)
+        if inx is None:
+            return None
+        return self.synonym_set(inx)
+
+    def are_synonyms(self, term1, term2):
+        k1 = self._known(term1)
+        return k1 == self._known(term2) and k1 is not None
+
+    def __getitem__(self, term):
+        return self.synonyms_for(term)
+
+    def _serialize_set(self, index):
+        return {"name": self._item_name(index),
+                "synonyms": list(self._synonyms(index))}
+
+    def serialize(self):
+        return {
+            'ignore_case': self._ignore_case,
+            self._source_name(): [e for e in map(self._serialize_set, range(len(self._names))) if e['synonyms']]
+        }
+
+
+class ReadOnlyFlowables(object):
+    """
+    Mixin adding the CAS queries of a Flowables to a ReadOnlySynList.  Subclasses provide _padded_cas(index), the padded
+    CAS number of an item or None.
+    """
+    def _padded_cas(self, index):
+        raise NotImplementedError
+
+    def cas(self, term):
+        return self._padded_cas(self._get_index(term))
+
+    def cas_many(self, terms):
+        return self._many(terms, self.cas)
+
+    def cas_name(self, term):
+        ind = self._get_index(term)
+        cas = self._padded_cas(ind)
+        if cas is not None:
+            return cas.lstrip('0')  # trim_cas
+        return self._item_name(ind)
@@ -0,0 +1,241 @@
+"""
+Resolve the raw terms of a large table of rows, such as the flow names of an inventory, to canonical names and CAS
+numbers, as a stream.
+
+resolve() reads rows lazily from any iterable and cuts them into chunks of consecutive rows.  Each distinct term of a
+chunk is looked up once (see synlist.batch), however often it repeats, and the results are written into the rows of the
+chunk, which are yielded in input order.  The results of recent distinct terms are also kept for later chunks, in a
+bounded cache.  Only a bounded number of chunks is held at a time, whatever the length of the input.
+
+With workers, the lookups are done by a pool of worker processes, each holding a read-only snapshot of the list that it
+receives once, when it starts:
+ * a MappedSynList or MappedFlowables (see synlist.mapped) is sent by its path and mapped by every worker, so that all
+   of them share one copy of the list through the page cache.  This is the cheapest way to resolve with many workers.
+ * a SynList or Flowables is frozen (see synlist.frozen), and the frozen snapshot is pickled to each worker
+ * any other read-only lookup object (FrozenSynList, PackedSynList) is pickled to each worker as it is
+Rows never leave this process: only the distinct terms of a chunk are sent to a worker, and only their results come
+back.  While the rows of one chunk are yielded, the lookups of the next few chunks are under way.
+
+read_rows() and write_rows() read and write CSV or JSON Lines files one row at a time.
+"""
+import os
+import csv
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from synlist.batch import MISSING
+from synlist.cache import QueryCache, _MISSING
+
+
+FORMATS = ('csv', 'jsonl')
+
+_lookup = None  # the snapshot held by a worker process
+
+
+def default_fields(synlist):
+    """
+    :param synlist: a SynList or any read-only copy of one
+    :return: {'name': 'name', 'cas': 'cas'} for a list with CAS numbers, otherwise {'name': 'name'}
+    """
+    if hasattr(synlist, 'cas'):
+        return {'name': 'name', 'cas': 'cas'}
+    return {'name': 'name'}
+
+
+def _resolve_terms(lookup, terms, fields):
+    """
+    :param lookup: a SynList or read-only copy of one
+    :param terms: a list of distinct terms
+    :param fields: a list of query method names, each taking an item index
+    :return: for each field, a list of its values aligned with terms, with None for unknown terms
+    """
+    distinct = dict.fromkeys(terms)
+    lookup._resolve_distinct(distinct)
+    indices = list(distinct.values())
+    return [[None if i == MISSING else q(i) for i in indices] for q in [getattr(lookup, f) for f in fields]]
+
+
+def _start_worker(lookup):
+    global _lookup
+    _lookup = lookup
+
+
+def _work(terms, fields):
+    return _resolve_terms(_lookup, terms, fields)
+
+
+def _worthwhile(cache):
+    """
+    :return: the cache, or None once it has been asked for as many terms as it holds and has missed more of them than
+     it hit: a miss and the put that follows cost about as much as a lookup, so such a cache costs more than it saves
+    """
+    if cache is not None and cache.hits + cache.misses > cache.size and cache.hits < cache.misses:
+        return None
+    return cache
+
+
+def _snapshot(synlist):
+    """
+    What to send to the worker processes (see module docstring)
+    """
+    if hasattr(synlist, 'freeze'):
+        return synlist.freeze()  # a FrozenSynList returns itself
+    return synlist
+
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Chunk(object):
+    """
+    A chunk of rows, with the results already known for its terms, one dict per output column, and the distinct terms
+    still to look up.  The rows of a chunk are either all dicts or all sequences.
+    """
+    def __init__(self, rows, column, width, cache, version):
+        self.rows = rows
+        self.dicts = len(rows) > 0 and isinstance(rows[0], dict)
+        if self.dicts:
+            self.keys = [row.get(column) for row in rows]
+        else:
+            self.keys = [row[column] if column < len(row) else None for row in rows]
+        distinct = dict.fromkeys(self.keys)
+        distinct.pop(None, None)
+        distinct.pop('', None)
+        self.found = [dict() for _ in range(width)]
+        if cache is None:
+            self.terms = list(distinct)
+            return
+        self.terms = []
+        for t in distinct:
+            v = cache.get(t, version)
+            if v is _MISSING:
+                self.terms.append(t)
+            else:
+                for found, x in zip(self.found, v):
+                    found[t] = x
+
+    def enrich(self, results, columns, cache, version):
+        """
+        Write the results into the rows, a column at a time: as new keys of dict rows, or appended to a copy of each
+        sequence row
+        :param results: the values of each column for self.terms, as returned by _resolve_terms
+        :param columns: the names of the output columns
+        :param cache: a QueryCache to keep the results in, or None
+        :param version: the version of the list the results were computed for
+        :return: the rows
+        """
+        for found, values in zip(self.found, results):
+            found.update(zip(self.terms, values))
+        if cache is not None:
+            for t, v in zip(self.terms, zip(*results)):
+                cache.put(t, version, v)
+        rows = self.rows
+        if self.dicts:
+            for c, found in zip(columns, self.found):
+                get = found.get
+                for row, t in zip(rows, self.keys):
+                    row[c] = get(t)
+        else:
+            for n, t in enumerate(self.keys):
+                rows[n] = list(rows[n]) + [found.get(t) for found in self.found]
+        return rows
+
+
+def resolve(rows, synlist, column, fields=None, chunk_size=10000, workers=0, in_flight=None, cache_size=65536):
+    """
+    Resolve the term in each of a stream of rows (see module docstring).  Unknown and missing terms get None in every
+    output column.
+    :param rows: an iterable of dicts (e.g. from read_rows or csv.DictReader), or of lists (e.g. from csv.reader)
+    :param synlist: a SynList, Flowables, or read-only copy of one; with workers, preferably a MappedFlowables
+    :param column: the key (or, for list rows, the position) of the term to resolve in each row
+    :param fields: [None] a dict {output column: query method}, where each query method takes an item index, e.g.
+     {'flowable': 'name', 'cas': 'cas', 'cas_name': 'cas_name'}.  None for default_fields(synlist).  Dict rows get the
+     output columns as keys; list rows get the values appended in the order of the dict.
+    :param chunk_size: [10000] number of rows resolved together
+    :param workers: [0] number of worker processes; 0 to resolve in this process, None for one per CPU
+    :param in_flight: [None] with workers, the most chunks submitted and not yet yielded; None for twice the number of
+     workers.  At most chunk_size * in_flight rows are held at a time.
+    :param cache_size: [65536] number of distinct terms whose results are kept for later chunks (see synlist.cache),
+     so that a term repeated throughout the input is looked up once; 0 for none.  In this process, a change to the list
+     invalidates the cache; workers resolve against their snapshot, whatever happens to the list.  The cache is
+     dropped if, after as many lookups as it holds, it has missed more than it hit.
+    :return: a generator of the rows, with their output columns filled in, in input order
+    """
+    if fields is None:
+        fields = default_fields(synlist)
+    columns = list(fields.keys())
+    queries = list(fields.values())
+    cache = QueryCache(cache_size) if cache_size else None
+    if workers == 0:
+        for c in _chunks(rows, chunk_size):
+            version = synlist._version if hasattr(synlist, '_version') else 0
+            chunk = _Chunk(c, column, len(columns), cache, version)
+            yield from chunk.enrich(_resolve_terms(synlist, chunk.terms, queries), columns, cache, version)
+            cache = _worthwhile(cache)
+        return
+    workers = workers or os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=(_snapshot(synlist),))
+    pending = deque()
+    try:
+        for c in _chunks(rows, chunk_size):
+            # terms resolved in a chunk still in flight are looked up again, rather than waited for
+            chunk = _Chunk(c, column, len(columns), cache, 0)
+            pending.append((chunk, executor.submit(_work, chunk.terms, queries)))
+            if len(pending) >= (in_flight or 2 * workers):
+                chunk, future = pending.popleft()
+                yield from chunk.enrich(future.result(), columns, cache, 0)
+                cache = _worthwhile(cache)
+        while pending:
+            chunk, future = pending.popleft()
+            yield from chunk.enrich(future.result(), columns, cache, 0)
+    finally:
+        executor.shutdown(cancel_futures=True)  # if the caller stops early, do not resolve chunks nobody will read
+
+
+def read_rows(fp, fmt='csv', **kwargs):
+    """
+    Read a table one row at a time
+    :param fp: a text file (for CSV, opened with newline='')
+    :param fmt: ['csv'] 'csv', with a header line, or 'jsonl', one JSON object per line
+    :param kwargs: passed to csv.DictReader
+    :return: an iterator of dicts
+    """
+    if fmt == 'csv':
+        return csv.DictReader(fp, **kwargs)
+    if fmt == 'jsonl':
+        return (json.loads(line) for line in fp if line.strip())
+    raise ValueError('Unknown format %s; use one of %s' % (fmt, ', '.join(FORMATS)))
+
+
+def write_rows(fp, rows, fmt='csv', fieldnames=None):
+    """
+    Write dict rows one at a time
+    :param fp: a text file (for CSV, opened with newline='')
+    :param rows: an iterable of dicts
+    :param fmt: ['csv'] or 'jsonl'
+    :param fieldnames: [None] the CSV columns; None for the keys of the first row
+    :return: number of rows written
+    """
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format %s; use one of %s' % (fmt, ', '.join(FORMATS)))
+    count = 0
+    writer = None
+    for row in rows:
+        if fmt == 'jsonl':
+            fp.write(json.dumps(row) + '\n')
+        else:
+            if writer is None:
+                writer = csv.DictWriter(fp, fieldnames or list(row.keys()))
+                writer.writeheader()
+            writer.writerow(row)
+        count += 1
+    return count
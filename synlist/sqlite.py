@@ -0,0 +1,519 @@
+"""
+A SynList stored in a local SQLite file, for corpora too large to hold in memory or to re-serialize after every edit.
+
+SqliteSynList and SqliteFlowables are a SynList and a Flowables whose containers (_list, _dict, _name, and for
+Flowables _cas and _cas_index) are replaced by views of database tables, so every operation follows exactly the same
+rules as in memory.  Operations that would otherwise touch every item (merges, search, serialization) are rewritten
+as single statements.
+
+Tables:
+ * items (id, name, cas): one row per live item; a merged item's row is deleted
+ * terms (item, term): the synonyms of each item, indexed by item
+ * keys (key, item): every sanitized key, indexed both ways
+ * cas (number, item): every encoded CAS number (Flowables), indexed both ways
+ * meta: the class that created the file, and ignore_case
+
+Changes are made in SQLite transactions: group them with transaction(), or call commit().  Uncommitted changes are
+lost if the process exits without close().  Key lookups go through a bounded LRU cache held in memory.  Entities are
+held in memory only and are not stored in the file.
+"""
+import re
+import sqlite3
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from synlist.synlist import SynList
+from synlist.flowables import Flowables
+from synlist.lexical import is_literal
+from synlist.bloom import BloomFilter
+from synlist.cache import cached_query
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name TEXT, cas INTEGER);
+CREATE TABLE IF NOT EXISTS terms (item INTEGER NOT NULL, term TEXT NOT NULL, UNIQUE (item, term));
+CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, item INTEGER NOT NULL) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS keys_item ON keys (item);
+CREATE TABLE IF NOT EXISTS cas (number INTEGER PRIMARY KEY, item INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS cas_item ON cas (item);
+'''
+
+_MISSING = object()
+
+
+class TermRows(object):
+    """
+    The synonyms of one item, as a set that writes through to the terms table
+    """
+    def __init__(self, db, item):
+        self._db = db
+        self._item = item
+
+    def _rows(self):
+        return [r[0] for r in self._db.execute('SELECT term FROM terms WHERE item = ? ORDER BY rowid', (self._item,))]
+
+    def __iter__(self):
+        return iter(self._rows())
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM terms WHERE item = ?', (self._item,)).fetchone()[0]
+
+    def __contains__(self, term):
+        return self._db.execute('SELECT 1 FROM terms WHERE item = ? AND term = ?', (self._item, term)).fetchone() \
+            is not None
+
+    def add(self, term):
+        self._db.execute('INSERT OR IGNORE INTO terms (item, term) VALUES (?, ?)', (self._item, term))
+
+    def remove(self, term):
+        if self._db.execute('DELETE FROM terms WHERE item = ? AND term = ?', (self._item, term)).rowcount == 0:
+            raise KeyError(term)
+
+    def __ior__(self, other):
+        self._db.executemany('INSERT OR IGNORE INTO terms (item, term) VALUES (?, ?)',
+                             ((self._item, t) for t in other))
+        return self
+
+
+class ItemRows(object):
+    """
+    Stands in for SynList._list: entry i is a TermRows for a live item, or None for an index with no item
+    """
+    def __init__(self, owner):
+        self._owner = owner
+
+    def __len__(self):
+        return self._owner._next
+
+    def __getitem__(self, index):
+        if self._owner._db.execute('SELECT 1 FROM items WHERE id = ?', (index,)).fetchone() is None:
+            return None
+        return TermRows(self._owner._db, index)
+
+    def __setitem__(self, index, terms):
+        db = self._owner._db
+        db.execute('DELETE FROM terms WHERE item = ?', (index,))
+        if terms is None:
+            db.execute('DELETE FROM items WHERE id = ?', (index,))
+        else:
+            TermRows(db, index).__ior__(list(terms))
+
+    def __iter__(self):
+        """
+        Plain sets of synonyms in index order, with None for indices that have no item.  One query in all.
+        """
+        rows = self._owner._db.execute('SELECT items.id, terms.term FROM items LEFT JOIN terms ON terms.item = items.id '
+                                       'ORDER BY items.id, terms.rowid')
+        index = 0
+        current = None
+        for item, term in rows:
+            if item != current:
+                if current is not None:
+                    yield terms
+                    index += 1
+                while index < item:
+                    yield None
+                    index += 1
+                current = item
+                terms = set()
+            if term is not None:
+                terms.add(term)
+        if current is not None:
+            yield terms
+            index += 1
+        while index < len(self):
+            yield None
+            index += 1
+
+
+class Column(object):
+    """
+    Stands in for a per-item list (_name, or _cas for Flowables): one column of the items table
+    """
+    def __init__(self, owner, column):
+        self._owner = owner
+        self._get = 'SELECT %s FROM items WHERE id = ?' % column
+        self._set = 'UPDATE items SET %s = ? WHERE id = ?' % column
+        self._all = 'SELECT id, %s FROM items ORDER BY id' % column
+
+    def __len__(self):
+        return self._owner._next
+
+    def __getitem__(self, index):
+        row = self._owner._db.execute(self._get, (index,)).fetchone()
+        return None if row is None else row[0]
+
+    def __setitem__(self, index, value):
+        self._owner._db.execute(self._set, (value, index))
+
+    def append(self, value):
+        pass  # the row was created by new_item()
+
+    def __iter__(self):
+        index = 0
+        for i, value in self._owner._db.execute(self._all):
+            while index < i:
+                yield None
+                index += 1
+            yield value
+            index += 1
+        while index < len(self):
+            yield None
+            index += 1
+
+
+class Entities(Column):
+    """
+    Entities are arbitrary objects, kept in memory only
+    """
+    def __init__(self, owner):
+        self._owner = owner
+        self._entities = dict()
+
+    def __getitem__(self, index):
+        return self._entities.get(index)
+
+    def __setitem__(self, index, value):
+        if value is None:
+            self._entities.pop(index, None)
+        else:
+            self._entities[index] = value
+
+    def __iter__(self):
+        return (self._entities.get(i) for i in range(len(self)))
+
+
+class KeyTable(object):
+    """
+    Stands in for a dict of keys (SynList._dict, or _cas_index for Flowables): one indexed table, with a bounded LRU
+    cache of lookups, including misses, in front of it.
+    """
+    def __init__(self, db, table, key, cache_size):
+        self._db = db
+        self._get = 'SELECT item FROM %s WHERE %s = ?' % (table, key)
+        self._set = 'INSERT OR REPLACE INTO %s (%s, item) VALUES (?, ?)' % (table, key)
+        self._del = 'DELETE FROM %s WHERE %s = ?' % (table, key)
+        self._keys = 'SELECT %s FROM %s' % (key, table)
+        self._count = 'SELECT COUNT(*) FROM %s' % table
+        self._repoint = 'UPDATE %s SET item = ? WHERE item = ?' % table
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cached_by_item = dict()  # item -> set of cached keys, so that merges can correct the cache
+
+    def clear_cache(self):
+        self._cache.clear()
+        self._cached_by_item.clear()
+
+    def _cache_put(self, key, item):
+        old = self._cache.pop(key, _MISSING)
+        if old is not _MISSING and old is not None:
+            self._cached_by_item[old].discard(key)
+        self._cache[key] = item
+        if item is not None:
+            self._cached_by_item.setdefault(item, set()).add(key)
+        if len(self._cache) > self._cache_size:
+            k, i = self._cache.popitem(last=False)
+            if i is not None:
+                self._cached_by_item[i].discard(k)
+
+    def get(self, key, default=None):
+        item = self._cache.get(key, _MISSING)
+        if item is _MISSING:
+            row = self._db.execute(self._get, (key,)).fetchone()
+            item = None if row is None else row[0]
+            self._cache_put(key, item)
+        else:
+            self._cache.move_to_end(key)
+        return default if item is None else item
+
+    def __getitem__(self, key):
+        item = self.get(key)
+        if item is None:
+            raise KeyError(key)
+        return item
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, item):
+        self._db.execute(self._set, (key, item))
+        self._cache_put(key, item)
+
+    def __delitem__(self, key):
+        if self._db.execute(self._del, (key,)).rowcount == 0:
+            raise KeyError(key)
+        self._cache_put(key, None)
+
+    def __len__(self):
+        return self._db.execute(self._count).fetchone()[0]
+
+    def keys(self):
+        return (r[0] for r in self._db.execute(self._keys))
+
+    __iter__ = keys
+
+    def repoint(self, merge, into):
+        """
+        Point every key of item 'merge' at item 'into', in one statement
+        """
+        self._db.execute(self._repoint, (into, merge))
+        keys = self._cached_by_item.pop(merge, set())
+        for k in keys:
+            self._cache[k] = into
+        self._cached_by_item.setdefault(into, set()).update(keys)
+
+
+class SqliteSynList(SynList):
+    """
+    A SynList kept in an SQLite file.  Opening an existing file resumes where it was left; ignore_case is only used
+    when the file is created.  Item indices are stable across openings, as long as the file is the only copy.
+    """
+    def __init__(self, path, ignore_case=False, cache_size=65536, bloom_filter=False, query_cache=0):
+        """
+        :param path: the database file, created if it does not exist (':memory:' for a temporary database)
+        :param ignore_case: [False] for a new file
+        :param cache_size: [65536] number of key lookups to keep in memory
+        :param bloom_filter: [False] keep a Bloom filter of the keys in memory, so that most lookups of unknown terms
+         are answered without a query.  It is filled from the keys table when the file is opened.
+        :param query_cache: [0] see SynList
+        """
+        super(SqliteSynList, self).__init__(ignore_case=ignore_case, query_cache=query_cache)
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+        meta = dict(self._db.execute('SELECT key, value FROM meta'))
+        if not meta:
+            meta = {'class': self.__class__.__name__, 'ignore_case': str(int(bool(ignore_case)))}
+            self._db.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', meta.items())
+            self._db.commit()
+        elif meta['class'] != self.__class__.__name__:
+            raise ValueError('%s holds a %s, not a %s' % (path, meta['class'], self.__class__.__name__))
+        self._ignore_case = bool(int(meta['ignore_case']))  # the file's, whatever was asked for
+        self._cache_size = cache_size
+        self._depth = 0
+        self._snapshots = []  # the entities at the start of each open transaction() block
+        self._count()
+        self._list = ItemRows(self)
+        self._name = Column(self, 'name')
+        self._entity = Entities(self)
+        self._dict = KeyTable(self._db, 'keys', 'key', cache_size)
+        if bloom_filter:
+            self._filter = BloomFilter(capacity=max(65536, len(self._dict)))
+            self._filter.update(self._dict.keys())
+
+    def _options(self):
+        return {'cache_size': self._cache_size, 'bloom_filter': self._filter is not None,
+                'query_cache': 0 if self._cache is None else self._cache.size}
+
+    def commit(self):
+        self._db.commit()
+
+    def _count(self):
+        """
+        Read the next item id and the number of live items from the database
+        :return:
+        """
+        self._next, self._live = self._db.execute('SELECT COALESCE(MAX(id) + 1, 0), COUNT(*) FROM items').fetchone()
+
+    def _reset(self):
+        """
+        Forget what is held in memory about the database, after a rollback
+        :return:
+        """
+        self._version += 1
+        self._reset_caches()
+        self._keyed = dict()  # term maps are rebuilt as needed
+        self._count()
+
+    def rollback(self):
+        """
+        Discard the changes made since the last commit.  Entities are not in the database and keep any changes made
+        to them; use transaction() to have them restored too.
+        :return:
+        """
+        self._db.rollback()
+        self._reset()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Make a batch of changes atomically.  If the block raises an exception, the changes made in it are rolled back,
+        and the entities, which are held in memory, are restored as they were when the block started; otherwise
+        everything is committed at the end of the outermost block.  Blocks may be nested.
+        :return:
+        """
+        self._db.execute('SAVEPOINT synlist_batch')
+        self._depth += 1
+        self._snapshots.append(dict(self._entity._entities))
+        try:
+            yield self
+        except BaseException:
+            self._db.execute('ROLLBACK TO synlist_batch')
+            self._db.execute('RELEASE synlist_batch')
+            self._entity._entities = self._snapshots[-1]
+            self._reset()
+            raise
+        finally:
+            self._depth -= 1
+            self._snapshots.pop()
+        self._db.execute('RELEASE synlist_batch')
+        if self._depth == 0:
+            self.commit()
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.rollback()
+        self.close()
+
+    def new_item(self, entity=None):
+        self._version += 1
+        k = self._next
+        self._db.execute('INSERT INTO items (id) VALUES (?)', (k,))
+        self._next += 1
+        self._live += 1
+        self._entity[k] = entity
+        return k
+
+    def compact(self):
+        """
+        Same as SynList.compact, in the database: item ids are renumbered by two statements per table, through a
+        temporary mapping table.
+        :return: a list giving the new index of each old index, or None for an id that held no item
+        """
+        db = self._db
+        n = self._next
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS synlist_remap (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)')
+        db.execute('DELETE FROM synlist_remap')
+        db.execute('INSERT INTO synlist_remap (old, new) SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 FROM items')
+        remap = [None] * n
+        live = 0
+        for old, new in db.execute('SELECT old, new FROM synlist_remap'):
+            remap[old] = new
+            live += 1
+        if live < n:
+            self._version += 1
+            # two steps, through negative ids, so that no id is ever held by two rows at once
+            for table, column in (('items', 'id'), ('terms', 'item'), ('keys', 'item'), ('cas', 'item')):
+                db.execute('UPDATE %s SET %s = -1 - (SELECT new FROM synlist_remap WHERE old = %s.%s)'
+                           % (table, column, table, column))
+                db.execute('UPDATE %s SET %s = -1 - %s' % (table, column, column))
+            entities = self._entity._entities
+            self._entity._entities = dict((remap[i], e) for i, e in entities.items() if remap[i] is not None)
+            if self._keyed:
+                self._keyed = dict((remap[i], keyed) for i, keyed in self._keyed.items())
+            self._next = live
+            self._reset_caches()
+        db.execute('DELETE FROM synlist_remap')
+        self._rebuild_filter()
+        return remap
+
+    def _reset_caches(self):
+        self._dict.clear_cache()
+
+    def synonym_set(self, index):
+        terms = self._list[index]
+        if terms is None:
+            return None
+        return set(terms)
+
+    def _merge_items(self, merge, into):
+        db = self._db
+        db.execute('UPDATE OR IGNORE terms SET item = ? WHERE item = ?', (into, merge))
+        db.execute('DELETE FROM items WHERE id = ?', (merge,))
+        db.execute('DELETE FROM terms WHERE item = ?', (merge,))
+        self._dict.repoint(merge, into)
+        self._entity[merge] = None
+
+    @cached_query
+    def search(self, term):
+        """
+        Same as SynList.search, evaluated in the database
+        :param term:
+        :return:
+        """
+        if is_literal(term):
+            needle = term.lower()
+
+            def _test(k):
+                return needle in k.lower()
+        else:
+            regex = re.compile(term, flags=re.IGNORECASE)
+
+            def _test(k):
+                return regex.search(k) is not None
+
+        self._db.create_function('synlist_match', 1, _test, deterministic=True)
+        return set(r[0] for r in self._db.execute('SELECT DISTINCT item FROM keys WHERE synlist_match(key)'))
+
+    def complete(self, prefix, limit=10):
+        """
+        Same as SynList.complete.  When keys are lowercased, the prefix is read as a range of the keys table.
+        :param prefix:
+        :param limit:
+        :return:
+        """
+        if not self._ignore_case:
+            return super(SqliteSynList, self).complete(prefix, limit=limit)
+        prefix = prefix.lstrip().lower()
+        rows = self._db.execute('SELECT keys.key, keys.item, items.name FROM keys JOIN items ON items.id = keys.item '
+                                'WHERE keys.key >= ? AND keys.key < ? ORDER BY keys.key LIMIT ?',
+                                (prefix, prefix + '\U0010ffff', -1 if limit is None else limit))
+        return [tuple(r) for r in rows]
+
+    def _serialize_sets(self):
+        return (entry for item, entry in self._serialize_items())
+
+    def _serialize_items(self):
+        rows = self._db.execute('SELECT items.id, items.name, terms.term FROM items JOIN terms ON terms.item = items.id '
+                                'ORDER BY items.id, terms.rowid')
+        current = None
+        for item, name, term in rows:
+            if item != current:
+                if current is not None:
+                    yield current, entry
+                current = item
+                entry = {'name': name, 'synonyms': []}
+            entry['synonyms'].append(term)
+        if current is not None:
+            yield current, entry
+
+
+class SqliteFlowables(Flowables, SqliteSynList):
+    """
+    A Flowables kept in an SQLite file.  CAS numbers are kept in the cas column of the items table and in the cas
+    table.
+    """
+    def __init__(self, path, ignore_case=None, check_digits=False, cache_size=65536, bloom_filter=False,
+                 query_cache=0):
+        """
+        :param path:
+        :param ignore_case: this parameter is ignored for flowables
+        :param check_digits: [False] see Flowables
+        :param cache_size: [65536] number of key lookups and of CAS lookups to keep in memory
+        :param bloom_filter: [False] see SqliteSynList
+        :param query_cache: [0] see SynList
+        """
+        super(SqliteFlowables, self).__init__(path=path, check_digits=check_digits, cache_size=cache_size,
+                                              bloom_filter=bloom_filter, query_cache=query_cache)
+        self._cas = Column(self, 'cas')
+        self._cas_index = KeyTable(self._db, 'cas', 'number', cache_size)
+
+    def _merge(self, merge, into):
+        super(SqliteFlowables, self)._merge(merge, into)
+        self._cas_index.repoint(merge, into)
+
+    def _serialize_sets(self):
+        return (self._serialize_cas(item, entry) for item, entry in self._serialize_items())
+
+    def _reset_caches(self):
+        super(SqliteFlowables, self)._reset_caches()
+        self._cas_index.clear_cache()
+
@@ -0,0 +1,173 @@
+"""
+Incremental readers for the SynList serialization formats, so that a list can be loaded one entry at a time without
+holding the whole document in memory.
+
+Two formats are supported:
+ * JSON: the same {'ignore_case': ..., <ClassName>: [...]} document that serialize() produces
+ * JSON Lines: a header line {'ignore_case': ..., 'class': <ClassName>} followed by one entry per line
+"""
+import json
+
+
+_WHITESPACE = ' \t\n\r'
+
+
+class JsonStreamReader(object):
+    """
+    Reads a serialized SynList document from a text file in chunks.  On construction, the top-level keys that
+    precede the list of entries are parsed into the 'header' dict; iterating the reader then yields the entries one at a
+    time.  Any top-level keys that follow the list are added to the header once iteration is complete.
+    """
+    def __init__(self, fp, list_key, chunk_size=1 << 16):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._list_key = list_key
+        self._in_list = False
+        self.header = dict()
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+        else:
+            self._read_members()
+
+    def _fill(self):
+        chunk = self._fp.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof:
+                return ''
+            self._fill()
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c == '' or c not in chars:
+            raise ValueError('Expected one of %r at offset %d; found %r' % (chars, self._pos, c))
+        self._pos += 1
+        return c
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+                # a value that runs to the end of the buffer may have been cut short (e.g. a number)
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def _read_members(self):
+        """
+        Parse top-level members until the list of entries begins or the document ends.
+        :return:
+        """
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == self._list_key:
+                self._expect('[')
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    self._in_list = True
+                    return
+            else:
+                self.header[key] = self._value()
+            if self._expect(',}') == '}':
+                return
+
+    @property
+    def list_started(self):
+        """
+        True if the list of entries was reached before the header was complete
+        :return:
+        """
+        return self._in_list
+
+    def __iter__(self):
+        while self._in_list:
+            yield self._value()
+            if self._expect(',]') == ']':
+                self._in_list = False
+                if self._expect(',}') == ',':
+                    self._read_members()
+
+
+class JsonLinesReader(object):
+    """
+    Reads the JSON Lines serialization: a header object on the first line, then one entry per line.  Blank lines are
+    ignored.
+    """
+    def __init__(self, fp, list_key):
+        self._fp = fp
+        line = fp.readline()
+        if not line.strip():
+            raise ValueError('Missing header line')
+        self.header = json.loads(line)
+        if self.header.get('class', list_key) != list_key:
+            raise ValueError('File contains %s, not %s' % (self.header['class'], list_key))
+
+    list_started = False
+
+    def __iter__(self):
+        for line in self._fp:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_json(fp, header, list_key, entries):
+    """
+    Write a serialized SynList document one entry at a time.  The header is written first, so that a reader can
+    construct the SynList before the entries arrive.
+    :param fp: a text file
+    :param header: dict of top-level keys other than the list
+    :param list_key: the key for the list of entries
+    :param entries: iterable of entry dicts
+    :return: number of entries written
+    """
+    fp.write('{')
+    for k, v in header.items():
+        fp.write('%s: %s, ' % (json.dumps(k), json.dumps(v)))
+    fp.write('%s: [' % json.dumps(list_key))
+    count = 0
+    for e in entries:
+        fp.write(',\n' if count else '\n')
+        fp.write(json.dumps(e))
+        count += 1
+    fp.write('\n]}\n')
+    return count
+
+
+def write_json_lines(fp, header, list_key, entries):
+    """
+    Write the JSON Lines serialization: a header line, which names the list_key as 'class', then one entry per line.
+    :param fp: a text file
+    :param header: dict of top-level keys other than the list
+    :param list_key:
+    :param entries: iterable of entry dicts
+    :return: number of entries written
+    """
+    h = dict(header)
+    h['class'] = list_key
+    fp.write(json.dumps(h) + '\n')
+    count = 0
+    for e in entries:
+        fp.write(json.dumps(e) + '\n')
+        count += 1
+    return count
@@ -1,5 +1,19 @@
+import os
 import re
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+
+from synlist.lexical import TrigramIndex, PrefixIndex, DeletionIndex, edit_distance, is_literal, literal_fragments
+from synlist.forest import DisjointSets
+from synlist.streaming import JsonStreamReader, JsonLinesReader, write_json, write_json_lines
+from synlist.directory import DirectoryStore, LazyKeys
+from synlist.packed import PackedSynList
+from synlist.frozen import FrozenSynList
+from synlist.mapped import MappedSynList, write_binary
+from synlist.batch import BatchLookup
+from synlist.instrument import Instruments
+from synlist.bloom import BloomFilter
+from synlist.cache import QueryCache, cached_query
+from synlist.patch import diff, apply_patch
 
 
 class InconsistentIndices(Exception):
@@ -21,7 +35,24 @@ class EntityFound(Exception):
     pass
 
 
-class SynList(object):
+# kind is 'term' or 'cas'; existing is the index of the item already holding the term, and index is the item whose
+# entry tried to claim it
+LoadConflict = namedtuple('LoadConflict', ('kind', 'term', 'existing', 'index'))
+
+
+class LoadConflicts(Exception):
+    """
+    Raised at the end of a validated bulk load.  The 'conflicts' attribute lists every LoadConflict found; the
+    'synlist' attribute holds the SynList as loaded, in which each conflicting term stayed with the item that
+    claimed it first.
+    """
+    def __init__(self, conflicts, synlist):
+        super(LoadConflicts, self).__init__('%d conflicts found during load' % len(conflicts))
+        self.conflicts = conflicts
+        self.synlist = synlist
+
+
+class SynList(BatchLookup):
     """
     An ordered list of synonym sets.  The SynList has two components:
      * a list of sets of "terms" that are unique throughout the SynList.  Each set indicates synonyms for one "item"
@@ -43,27 +74,206 @@ class SynList(object):
     And de-serialized:
      - from that list, construct the list. boo hoo!
     """
+    # methods timed by instrument(), besides the term lookups _get_index and _find
+    _timed = ('add_term', 'add_set', 'merge', 'split_term', 'detach', 'move', 'remove_term', 'set_name', 'search',
+              'serialize', 'synonyms_for', 'name', 'diff', 'apply_patch', '_merge', '_sanitize')
+    _instruments = None
+    _cache = None
+    _keyed = None  # index -> {key: terms}, for items whose terms have been moved (see _term_map)
+    _spellings = True  # add_synonym() keeps another spelling of a key that the item holds
+    _version = 0  # incremented by every change, to invalidate the query cache
+    _live = 0  # number of items that have not been merged away
+
     @classmethod
-    def from_json(cls, j):
+    def from_json(cls, j, bulk=False, validate=False, **kwargs):
+        """
+        :param j: a dict as produced by serialize()
+        :param bulk: [False] trust the input and build the items directly, rather than replaying add_set() and
+         set_name() for each entry.  Each entry must describe a distinct item.
+        :param validate: [False] with bulk=True, check every term for collisions with other items and raise a single
+         LoadConflicts at the end if any were found.
+        :param kwargs: passed to the constructor
+        :return:
+        """
         if 'ignore_case' in j:
             ignore_case = j['ignore_case']
         else:
             ignore_case = False
-        s = cls(ignore_case=ignore_case)
+        s = cls(ignore_case=ignore_case, **kwargs)
         json_string = cls.__name__
-        for i in j[json_string]:
-            s.add_set(i['synonyms'] + [i['name']])
-            s.set_name(i['name'])
+        s._add_entries(j[json_string], bulk, validate)
         return s
 
-    def __init__(self, ignore_case=False):
+    @classmethod
+    def load(cls, fp, lines=False, ignore_case=None, bulk=False, validate=False, **kwargs):
+        """
+        Read a SynList from a text file, one entry at a time, so that the parsed document is never held in memory.
+        :param fp: a text file containing the output of dump() (or json.dump(serialize()))
+        :param lines: [False] the file is in the JSON Lines format written by dump(lines=True)
+        :param ignore_case: [None] use the file's setting.  If a JSON file has the entries before 'ignore_case' (e.g.
+         it was written with sort_keys=True), the setting must be given here.
+        :param bulk: see from_json()
+        :param validate: see from_json()
+        :param kwargs: passed to the constructor
+        :return:
+        """
+        json_string = cls.__name__
+        if lines:
+            reader = JsonLinesReader(fp, json_string)
+        else:
+            reader = JsonStreamReader(fp, json_string)
+        if ignore_case is None:
+            if reader.list_started and 'ignore_case' not in reader.header:
+                raise ValueError('ignore_case follows the entries in this file; specify it explicitly')
+            ignore_case = reader.header.get('ignore_case', False)
+        s = cls(ignore_case=ignore_case, **kwargs)
+        s._add_entries(reader, bulk, validate)
+        return s
+
+    @classmethod
+    def from_directory(cls, path, lazy=False, **kwargs):
+        """
+        Open a SynList saved with to_directory().  The SynList stays attached to the directory, and save() writes back
+        only the items that changed.
+        :param path:
+        :param lazy: [False] read nothing up front; load each shard the first time a lookup needs one of its terms.
+         Operations that need every item (len, search, all_terms, serialize, dump) load the remaining shards.
+        :param kwargs: passed to the constructor
+        :return:
+        """
+        store = DirectoryStore(path)
+        s = cls(ignore_case=store.ignore_case, **kwargs)
+        s._store = store
+        if lazy:
+            s._dict = LazyKeys(s, store)
+            if s._filter is not None:
+                s._filter.update(store.routed_keys())
+        else:
+            store.load_all(s)
+        return s
+
+    @classmethod
+    def open_binary(cls, path):
+        """
+        Memory-map a file written by to_binary() and query it in place (see synlist.mapped)
+        :param path:
+        :return: a MappedSynList
+        """
+        return MappedSynList(path)
+
+    def _add_entries(self, entries, bulk, validate):
+        if bulk:
+            self.load_entries(entries, validate=validate)
+        else:
+            for i in entries:
+                self.add_set(i['synonyms'] + [i['name']])
+                self.set_name(i['name'])
+
+    def __init__(self, ignore_case=False, lexical_index=False, union_find=False, prefix_index=False, fuzzy_index=False,
+                 bloom_filter=False, query_cache=0):
+        """
+        :param ignore_case: [False] whether terms are .lower()ed before being used as keys
+        :param lexical_index: [False] maintain a trigram index over the keys to speed up search()
+        :param union_find: [False] resolve merged items through a disjoint-set forest instead of rewriting the keys of
+         merged items.  Merging then costs time proportional to the smaller of the two items.
+        :param prefix_index: [False] keep the keys in sorted order, so that complete() takes time proportional to the
+         number of completions rather than to the number of keys
+        :param fuzzy_index: [False] keep a deletion index over the keys (see lexical.DeletionIndex), so that closest()
+         only checks keys that may be within max_distance instead of every key
+        :param bloom_filter: [False] screen lookups through a Bloom filter over the keys (see synlist.bloom), so that
+         most unknown terms are rejected without consulting the keys.  Worthwhile only where the keys are expensive
+         to consult (an SQLite file, a lazily opened directory); an in-memory dict is faster than the filter.
+        :param query_cache: [0] keep up to this many results of name(), synonyms_for() and search() (and for
+         Flowables, cas() and cas_name()) in an LRU cache, reused until the SynList changes (see synlist.cache)
+        """
         self._name = []
         self._entity = []
         self._list = []
         self._dict = dict()
         self._ignore_case = ignore_case
+        self._lexicon = TrigramIndex() if lexical_index else None
+        self._forest = DisjointSets() if union_find else None
+        self._prefixes = PrefixIndex() if prefix_index else None
+        self._fuzzy = DeletionIndex() if fuzzy_index else None
+        self._filter = BloomFilter() if bloom_filter else None
+        self._cache = QueryCache(query_cache) if query_cache else None
+        self._store = None
+        self._keyed = dict()
+
+    def _options(self):
+        """
+        Constructor arguments, other than ignore_case, that a copy of this SynList should be made with
+        :return:
+        """
+        return {'lexical_index': self._lexicon is not None, 'union_find': self._forest is not None,
+                'prefix_index': self._prefixes is not None, 'fuzzy_index': self._fuzzy is not None,
+                'bloom_filter': self._filter is not None,
+                'query_cache': 0 if self._cache is None else self._cache.size}
+
+    def instrument(self, callback=None):
+        """
+        Start counting lookups and merges and timing calls on this SynList (see synlist.instrument).  Collection starts
+        afresh if the SynList was already instrumented.
+        :param callback: [None] called as callback(method, seconds) after each timed call
+        :return: the Instruments
+        """
+        self.uninstrument()
+        instruments = Instruments(callback)
+        instruments.attach(self)
+        return instruments
+
+    def uninstrument(self):
+        """
+        Stop collecting; the SynList runs at full speed again
+        :return:
+        """
+        Instruments.detach(self)
+
+    def __getstate__(self):
+        """
+        A SynList pickles as its attributes, without instrumentation (see synlist.instrument).  A Bloom filter is
+        pickled as its error rate only: its positions come from hash(), which differs between processes, so it is
+        filled again from the keys when the SynList is unpickled.
+        :return:
+        """
+        state = dict(self.__dict__)
+        if '_instruments' in state:
+            Instruments.strip(state, self._timed)
+        if self._filter is not None:
+            state['_filter'] = self._filter.error_rate
+        return state
+
+    def __setstate__(self, state):
+        error_rate = state.get('_filter')
+        self.__dict__.update(state)
+        if error_rate is not None:
+            self._filter = BloomFilter(error_rate=error_rate)
+            self._rebuild_filter()
+
+    def stats(self, reset=False):
+        """
+        A snapshot of what has been collected since instrument() was called (see Instruments.stats)
+        :param reset: [False] start counting afresh after taking the snapshot
+        :return: a dict, or None if the SynList is not instrumented
+        """
+        if self._instruments is None:
+            return None
+        snapshot = self._instruments.stats()
+        if reset:
+            self._instruments.reset()
+        return snapshot
+
+    def cache_stats(self):
+        """
+        Hit and miss counts of the query cache (see QueryCache.stats)
+        :return: a dict, or None if the SynList has no query cache
+        """
+        if self._cache is None:
+            return None
+        return self._cache.stats()
 
     def set_entity(self, term, entity):
+        self._version += 1
         ind = self._get_index(term)
         if self._entity[ind] is not None:
             if entity is not None:
@@ -74,18 +284,31 @@ class SynList(object):
         return self._entity[self._get_index(term)]
 
     def new_item(self, entity=None):
+        self._version += 1
         k = len(self._list)
         self._list.append(set())
         self._name.append(None)
         self._entity.append(entity)
+        if self._forest is not None:
+            self._forest.add()
+        self._live += 1
         return k
 
+    def _require_all(self):
+        """
+        Load any shards of a lazily-opened SynList that have not been read yet
+        :return:
+        """
+        if self._store is not None:
+            self._store.load_all(self)
+
     def __len__(self):
         """
-        Number of (non-None) items in the SynList
+        Number of (non-None) items in the SynList, counted as items are created and merged
         :return:
         """
-        return len([x for x in self._list if x is not None])
+        self._require_all()
+        return self._live
 
     def _sanitize(self, key):
         key = key.strip()
@@ -93,16 +316,138 @@ class SynList(object):
             key = key.lower()
         return key
 
+    def load_entries(self, entries, validate=False):
+        """
+        Bulk-construct items from serialized entries, in one pass and without the lookups that add_set performs.
+        Entries are trusted to be mutually disjoint unless validate is True.
+        :param entries: an iterable of {'name': name, 'synonyms': [...]} dicts
+        :param validate: [False] check each term against the existing keys.  A term that belongs to another item is
+         left there and recorded, and a LoadConflicts listing all of them is raised once every entry has been loaded.
+        :return: the number of items loaded
+        """
+        conflicts = [] if validate else None
+        count = 0
+        for e in entries:
+            self._load_entry(e, conflicts)
+            count += 1
+        if conflicts:
+            raise LoadConflicts(conflicts, self)
+        return count
+
+    def _load_entry(self, entry, conflicts=None):
+        """
+        Load one serialized entry.  Subclasses that write more than a name and synonyms per entry read it back here.
+        :param entry:
+        :param conflicts: see _load_item
+        :return: the index of the new item
+        """
+        return self._load_item(entry['name'], entry['synonyms'], conflicts)
+
+    def _load_item(self, name, synonyms, conflicts=None):
+        index = self.new_item()
+        terms = self._list[index]
+        for t in synonyms + [name]:
+            if t is None or t == '':
+                continue
+            key = self._sanitize(t)
+            if conflicts is not None and key in self._dict and self._lookup(key) != index:
+                conflicts.append(LoadConflict('term', t, self._lookup(key), index))
+                continue
+            terms.add(t)
+            self._set_key(key, index)
+        self._name[index] = name
+        if conflicts is not None:
+            self._settle_loaded_item(index, synonyms)
+        return index
+
+    def _settle_loaded_item(self, index, synonyms):
+        """
+        After a validated load, make sure an item that lost terms to other items is still consistent: its name must
+        be one of its own terms, and an item left with no terms at all is dropped.  An item that lost its name is named
+        after the first of its synonyms that it kept, in the order of the entry.
+        :param index:
+        :param synonyms: the synonyms of the entry, in order
+        :return:
+        """
+        terms = self._list[index]
+        if len(terms) == 0:
+            self._list[index] = None
+            self._name[index] = None
+            self._live -= 1
+        elif self._name[index] not in terms:
+            self._name[index] = next((t for t in synonyms if t in terms), None) or min(terms)
+
+    def _touch(self, index):
+        """
+        Report a change to an item's terms or name to the directory the SynList is attached to, if any
+        :param index:
+        :return:
+        """
+        if self._store is not None:
+            self._store.touch(index)
+
+    def _set_key(self, key, index):
+        """
+        Register a new key.  All additions to the dict of keys go through here so that the lexical indices stay current.
+        :param key: a sanitized term
+        :param index:
+        :return:
+        """
+        self._version += 1
+        self._touch(index)
+        if (self._lexicon is not None or self._fuzzy is not None) and key not in self._dict:
+            if self._lexicon is not None:
+                self._lexicon.add(key)
+            if self._fuzzy is not None:
+                self._fuzzy.add(key)
+        if self._filter is not None:
+            self._filter.add(key)
+        if self._prefixes is not None:
+            self._prefixes.add(key)  # ignores keys it already holds
+        self._dict[key] = index
+
+    def _drop_key(self, key, index):
+        """
+        Forget a key, the counterpart of _set_key.  The Bloom filter cannot forget: the key stays in it as a false
+        positive until the next compact().
+        :param key: a key held by the item
+        :param index:
+        :return:
+        """
+        self._version += 1
+        self._touch(index)
+        del self._dict[key]
+        if self._lexicon is not None:
+            self._lexicon.discard(key)
+        if self._fuzzy is not None:
+            self._fuzzy.discard(key)
+        if self._prefixes is not None:
+            self._prefixes.discard(key)
+
+    def _lookup(self, key):
+        """
+        Index of the item that a sanitized key belongs to.  Raises KeyError for unknown keys.
+        :param key:
+        :return:
+        """
+        if self._forest is None:
+            return self._dict[key]
+        return self._forest.find(self._dict[key])
+
     def _new_term(self, term, index):
         if term is None or term == '':
             return
+        self._version += 1
         key = self._sanitize(term)
         self._list[index].add(term)
+        self._touch(index)
+        if self._keyed:
+            self._keep_term(index, term)
         if key in self._dict:
-            if self._dict[key] == index:
+            if self._lookup(key) == index:
                 return  # nothing to do
             raise TermFound(term)
-        self._dict[key] = index
+        self._set_key(key, index)
         if self._name[index] is None:
             self._name[index] = term
 
@@ -113,7 +458,10 @@ class SynList(object):
             if term < len(self._list):
                 return term
             raise IndexError('Item index out of range')
-        return self._dict[self._sanitize(term)]
+        key = self._sanitize(term)
+        if self._filter is not None and key not in self._filter:
+            raise KeyError(term)
+        return self._lookup(key)
 
     def index(self, term):
         """
@@ -128,8 +476,10 @@ class SynList(object):
         dict keys of all terms known to the SynList
         :return:
         """
+        self._require_all()
         return self._dict.keys()
 
+    @cached_query
     def name(self, term):
         """
         returns the canonical name for a given term
@@ -201,12 +551,14 @@ class SynList(object):
         :param merge: [False] whether to merge matching keys or to shunt off to a new index
         :return:
         """
-        found = self.find_indices(it)
+        terms = list(it)
+        found = self.find_indices(terms)
 
         try:
-            unmatched = found.pop(None)
+            unknown = found.pop(None)
         except KeyError:
-            unmatched = set()
+            unknown = set()
+        unmatched = [t for t in terms if t in unknown]  # keep incoming order so the first term becomes the name
         if len(found) == 0 or merge is False:
             # no matching index found, or don't merge
             index = self._new_set(unmatched)
@@ -226,14 +578,53 @@ class SynList(object):
         :return: index of named item
         """
         index = self._get_index(name)
+        self._version += 1
+        self._touch(index)
         self._name[index] = name
         return index
 
     def _merge(self, merge, into):
+        """
+        Merge item 'merge' into item 'into'.  The term maps, counters and instruments are kept here; moving the terms
+        and keys is left to _merge_items, which is all that a different storage needs to replace.
+        :param merge:
+        :param into:
+        :return:
+        """
+        self._version += 1
+        self._touch(merge)
+        self._touch(into)
+        if self._keyed:
+            self._keyed.pop(merge, None)
+            if into in self._keyed:
+                for t in self._list[merge]:
+                    self._keep_term(into, t)
+        if self._instruments is not None:
+            self._instruments.count('merges')
+            if self._forest is None:
+                self._instruments.count('merge_rewrites', len(self._list[merge]))
+        self._merge_items(merge, into)
+        self._live -= 1
+
+    def _merge_items(self, merge, into):
+        """
+        Move the terms of item 'merge' to item 'into', point its keys there, and empty its slot
+        :param merge:
+        :param into:
+        :return:
+        """
         # print('Merging\n## %s \ninto synonym set containing\n## %s' % (self._list[merge], self._list[into]))
-        self._list[into] = self._list[into].union(self._list[merge])
-        for i in self._list[into]:
-            self._dict[self._sanitize(i)] = into
+        small = self._list[merge]
+        big = self._list[into]
+        if self._forest is None:
+            for i in small:
+                self._dict[self._sanitize(i)] = into
+        else:
+            self._forest.union(merge, into)
+        if len(small) > len(big):
+            small, big = big, small
+        big |= small
+        self._list[into] = big
         self._list[merge] = None
         self._name[merge] = None
 
@@ -246,9 +637,81 @@ class SynList(object):
         """
         merge_into = self._get_index(dominant)
         indices = set([self._get_index(term) for term in terms])
+        indices.discard(merge_into)
         for i in indices:
             self._merge(i, merge_into)
 
+    def _flatten(self):
+        """
+        Flatten the union-find forest: point every key directly at its item, so that lookups no longer traverse the
+        forest.  Called by serialize(); does nothing unless the SynList was created with union_find=True.
+        :return:
+        """
+        if self._forest is None or self._forest.flat:
+            return
+        find = self._forest.find
+        for k, v in self._dict.items():
+            self._dict[k] = find(v)
+        self._forest.reset()
+
+    def compact(self):
+        """
+        Reclaim the slots left behind by merged items: renumber the live items consecutively, in their current order,
+        and point every key at its item's new index, in one pass over the keys.  Also flattens the union-find forest.
+        Indices held elsewhere must be translated with the returned mapping; an index of a merged-away item maps to
+        None, and its item must be found again by term.
+        :return: a list giving the new index of each old index, or None for a slot that held no item
+        """
+        self._require_all()
+        self._flatten()
+        remap = []
+        n = 0
+        for terms in self._list:
+            if terms is None:
+                remap.append(None)
+            else:
+                remap.append(n)
+                n += 1
+        if n < len(self._list):
+            self._version += 1
+            self._renumber(remap, n)
+            if self._store is not None:
+                self._store.renumber(remap)
+        self._rebuild_filter()
+        return remap
+
+    def _rebuild_filter(self):
+        """
+        Start the Bloom filter again from the current keys, so that keys dropped since it was filled stop passing it.
+        For a lazily opened directory, the keys of the shards not yet loaded are read from its routing tables.
+        :return:
+        """
+        if self._filter is not None:
+            self._filter = BloomFilter(capacity=max(65536, len(self._dict)), error_rate=self._filter.error_rate)
+            self._filter.update(self._dict.keys())
+            if self._store is not None:
+                self._filter.update(self._store.routed_keys())
+
+    def _renumber(self, remap, n):
+        """
+        Move each live item to its new index and re-point the keys
+        :param remap: a list of new indices, None for dead slots
+        :param n: the number of live items
+        :return:
+        """
+        def keep(column):
+            return [x for x, i in zip(column, remap) if i is not None]
+        self._list = keep(self._list)
+        self._name = keep(self._name)
+        self._entity = keep(self._entity)
+        d = self._dict
+        for k, v in d.items():
+            d[k] = remap[v]
+        if self._forest is not None:
+            self._forest.reset(n)
+        if self._keyed:
+            self._keyed = dict((remap[i], keyed) for i, keyed in self._keyed.items())
+
     def add_synonym(self, index, term):
         """
         Add term to an item known by index
@@ -261,52 +724,231 @@ class SynList(object):
     def add_synonyms(self, *terms):
         return self.add_set(terms, merge=True)
 
-    def _matches(self, term):
+    def _term_key(self, term):
         """
-        internal function to support split_term: returns a set of all terms in an item that match the given key. If
-        ignore_case is False, the set will only contain one term; if ignore_case is True, the set will contain all
-        terms that are equal after .lower()
+        The key a term is registered under
         :param term:
         :return:
         """
-        ind = self._get_index(term)
-        key = self._sanitize(term)
-        matches = set()
-        for k in self.synonym_set(ind):
-            if self._sanitize(k) == key:
-                matches.add(k)
-        if self._name[ind] in matches:
+        return self._sanitize(term)
+
+    def _key_cas(self, key):
+        """
+        The CAS number a key stands for: always None for a plain SynList
+        :param key:
+        :return:
+        """
+        return None
+
+    def _item_cas(self, index):
+        """
+        The CAS number of an item: always None for a plain SynList
+        :param index:
+        :return:
+        """
+        return None
+
+    def _term_map(self, index):
+        """
+        The terms of an item grouped by key: {key: set of terms}.  The map is built the first time terms are moved out
+        of the item and is kept current from then on, so that moving terms costs time proportional to the number of
+        terms moved rather than to the size of the item.  (Where there is nowhere to keep it, it is built every time.)
+        :param index:
+        :return:
+        """
+        if self._keyed is not None and index in self._keyed:
+            return self._keyed[index]
+        keyed = dict()
+        for t in self._list[index]:
+            keyed.setdefault(self._term_key(t), set()).add(t)
+        if self._keyed is not None:
+            self._keyed[index] = keyed
+        return keyed
+
+    def _keep_term(self, index, term):
+        """
+        Record a term added to an item in the item's term map, if it has one
+        :param index:
+        :param term:
+        :return:
+        """
+        keyed = self._keyed.get(index)
+        if keyed is not None:
+            keyed.setdefault(self._term_key(term), set()).add(term)
+
+    def _movable(self, term):
+        """
+        Find the terms that move with a term: all terms registered under the same key.  The name of an item cannot be
+        moved (use set_name() to choose a different name first), and neither can the only key of an item.
+        :param term:
+        :return: index of the item holding the term, the key, and the set of terms
+        """
+        index = self._get_index(term)
+        key = self._term_key(term)
+        moved = self._term_map(index).get(key)
+        if not moved:
+            raise KeyError(term)
+        name = self._name[index]
+        if (name is not None and self._term_key(name) == key) or len(moved) == len(self._list[index]):
             raise CannotSplitName('Use set_name() to choose a different name for this item')
-        return matches
+        return index, key, moved
+
+    def _move_terms(self, key, moved, index, into):
+        """
+        Move the terms registered under a key from one item to another, and point the key at the new item
+        :param key:
+        :param moved: the terms registered under the key, from _movable()
+        :param index: the item they are in
+        :param into: the item to move them to
+        :return:
+        """
+        self._version += 1
+        self._touch(index)
+        self._touch(into)
+        source = self._list[index]
+        target = self._list[into]
+        for t in moved:
+            source.remove(t)
+            target.add(t)
+        if self._keyed is not None:
+            self._keyed.get(index, {}).pop(key, None)
+            for t in moved:
+                self._keep_term(into, t)
+        self._dict[key] = into
+
+    def detach(self, term):
+        """
+        Remove a term from the item it's currently in and make it into a new item, named by the term as it is held
+        (or, if it is not held in that spelling, by the first of the terms that go with it).  All terms that are
+        registered under the same key go with it: if ignore_case is true, every term that matches ignoring case, and
+        for Flowables, every spelling of a CAS number, which becomes the new item's CAS number.  The name of an item
+        cannot be detached (use set_name to choose a different name first), nor can its only key.
+        :param term:
+        :return: index of the new item
+        """
+        index, key, moved = self._movable(term)
+        new_ind = self.new_item()
+        self._name[new_ind] = term if term in moved else min(moved)
+        self._move_terms(key, moved, index, new_ind)
+        return new_ind
 
     def split_term(self, term):
         """
-        Remove an existing term from the set it's currently in and assign it to a new item.  If ignore_case is true,
-        the split will encompass all terms that match ignoring case.  If a split term currently is the name of an
-         item, the split will not be allowed (use set_name to choose a different name first)
+        Same as detach()
+        :param term:
+        :return:
+        """
+        return self.detach(term)
+
+    def move(self, term, new_term):
+        """
+        Move a term from the item it's currently in to the item that another term belongs to.  As with detach(), all
+        terms registered under the same key go with it, and the name of an item cannot be moved.  Nothing happens if
+        both terms are in the same item.
+        :param term: the term to move
+        :param new_term: a term of the item to move it to
+        :return: index of the item the term is now in
+        """
+        into = self._get_index(new_term)
+        index, key, moved = self._movable(term)
+        if index != into:
+            self._move_terms(key, moved, index, into)
+        return into
+
+    def remove_term(self, term):
+        """
+        Remove one spelling of a term from its item (for a class that drops a second spelling of a key, such as
+        Flowables: every spelling of its key).  The key goes once no spelling of it is left in the item, and the item
+        goes with its last term.  The name of an item, or the last spelling of its name's key, cannot be removed while
+        the item has other terms (use set_name to choose a different name first).
+        :param term: a term as it is held
+        :return: index of the item the term was removed from
+        """
+        index = self._get_index(term)
+        key = self._term_key(term)
+        keyed = self._term_map(index)
+        group = keyed.get(key, set())
+        if self._spellings:
+            if term not in group:
+                raise KeyError(term)
+            removed = {term}
+        else:
+            removed = set(group)
+        terms = self._list[index]
+        name = self._name[index]
+        if len(terms) > len(removed) and (name in removed or (self._term_key(name) == key and not group - removed)):
+            raise CannotSplitName('Use set_name() to choose a different name for this item')
+        self._version += 1
+        self._touch(index)
+        for t in removed:
+            terms.remove(t)
+        group -= removed
+        if len(group) == 0:
+            keyed.pop(key, None)
+            self._drop_key(key, index)
+        if len(terms) == 0:
+            self._list[index] = None
+            self._name[index] = None
+            self._entity[index] = None
+            self._live -= 1
+            if self._keyed is not None:
+                self._keyed.pop(index, None)
+        return index
 
-        TODO: work this into unittest
-        TODO: deal with CAS numbers
+    def diff(self, other):
+        """
+        The changes that turn this SynList into another version of it, as a patch for apply_patch() (see
+        synlist.patch).  Items are aligned through the keys they share, in time proportional to the number of terms.
+        :param other: a SynList of the same class, with the same ignore_case
+        :return: a list of JSON-serializable records
+        """
+        return diff(self, other)
+
+    def apply_patch(self, patch):
+        """
+        Replay a patch made by diff() on a copy of this SynList, to bring it up to date
+        :param patch:
+        :return: the number of changes applied
+        """
+        return apply_patch(self, patch)
+
+    def _find(self, term):
+        """
+        Index of the item a string term belongs to, or None: the lookup of _get_index, without raising on a miss
         :param term:
         :return:
         """
-        matches = self._matches(term)
-        old_ind = self._get_index(term)
-        for k in matches:
-            self._list[old_ind].remove(k)
-        new_ind = self._new_set(matches)
-        self.set_name(term)
-        return new_ind
+        bloom = self._filter
+        if bloom is None:
+            index = self._dict.get(self._sanitize(term))
+        elif term in bloom:
+            # most terms are queried as they are keyed, and keys are their own sanitized form
+            index = self._dict.get(term)
+            if index is None:
+                key = self._sanitize(term)
+                if key != term:
+                    index = self._dict.get(key)
+        else:
+            key = self._sanitize(term)
+            if key == term or key not in bloom:
+                return None
+            index = self._dict.get(key)
+        if index is None or self._forest is None:
+            return index
+        return self._forest.find(index)
 
     def _known(self, term):
         if term is None:
             return None
+        if isinstance(term, str):
+            return self._find(term)
         try:
             in1 = self._get_index(term)
         except KeyError:
             return None
         return in1
 
+    @cached_query
     def synonyms_for(self, term):
         inx = self._known(term)
         if inx is None:
@@ -317,17 +959,90 @@ class SynList(object):
         k1 = self._known(term1)
         return k1 == self._known(term2) and k1 is not None
 
+    @cached_query
     def search(self, term):
         """
-        This is gonna be slow because we don't keep any lexical index
+        Case-insensitive search for items having a term that matches a regular expression.  A term without regex
+        metacharacters is matched as a plain substring.  If the SynList has a lexical index, only keys containing the
+        literal text required by the expression are checked; otherwise every key is scanned.
+        :param term: a regular expression or literal string
+        :return: a set of indices
+        """
+        self._require_all()
+        if is_literal(term):
+            needle = term.lower()
+            fragments = [needle]
+
+            def _test(k):
+                return needle in k.lower()
+        else:
+            regex = re.compile(term, flags=re.IGNORECASE)
+            fragments = literal_fragments(term)
+
+            def _test(k):
+                return regex.search(k) is not None
+
+        keys = None
+        if self._lexicon is not None and fragments:
+            keys = self._lexicon.candidates(fragments)
+        if keys is None:
+            keys = self._dict.keys()
+        return set(self._lookup(k) for k in keys if _test(k))
+
+    def complete(self, prefix, limit=10):
+        """
+        Type-ahead: keys that start with the given text, ignoring case, in alphabetical order (ignoring case).  With a
+        prefix index only the keys returned are visited; otherwise every key is scanned.
+        :param prefix: the text typed so far; leading whitespace is ignored
+        :param limit: [10] the most completions to return; None for all of them
+        :return: a list of (key, index, name) tuples
+        """
+        self._require_all()
+        prefix = prefix.lstrip().lower()
+        if self._prefixes is not None:
+            keys = self._prefixes.keys(prefix)
+        else:
+            keys = iter(sorted((k for k in self._dict.keys() if k.lower().startswith(prefix)),
+                               key=lambda k: (k.lower(), k)))
+        found = []
+        for k in keys:
+            if limit is not None and len(found) >= limit:
+                break
+            index = self._lookup(k)
+            found.append((k, index, self._name[index]))
+        return found
+
+    def closest(self, term, max_distance=2, limit=10):
+        """
+        Approximate lookup: items having a key within the given edit distance of the term, for misspelled input.  With a
+        fuzzy index only a few candidate keys are checked; otherwise every key is.
         :param term:
-        :return:
+        :param max_distance: [2] the most single-character insertions, deletions and substitutions allowed.  With a
+         fuzzy index, at most the distance it was built for (2).
+        :param limit: [10] the most items to return; None for all of them
+        :return: a list of (key, index, name, distance) tuples, one per item (for its closest key), ordered by distance
+         and then by key
         """
-        results = set()
-        for k in self._dict.keys():
-            if bool(re.search(term, k, flags=re.IGNORECASE)):
-                results.add(self.index(k))
-        return results
+        self._require_all()
+        text = self._sanitize(term)
+        if self._fuzzy is not None:
+            if max_distance > self._fuzzy.max_distance:
+                raise ValueError('The fuzzy index only supports distances up to %d' % self._fuzzy.max_distance)
+            keys = self._fuzzy.candidates(text, max_distance)
+        else:
+            keys = self._dict.keys()
+        best = dict()
+        for k in keys:
+            d = edit_distance(text, k, max_distance)
+            if d is None:
+                continue
+            index = self._lookup(k)
+            if index not in best or (d, k) < best[index]:
+                best[index] = (d, k)
+        found = sorted((d, k, index) for index, (d, k) in best.items())
+        if limit is not None:
+            found = found[:limit]
+        return [(k, index, self._name[index], d) for d, k, index in found]
 
     def synonym_set(self, index):
         """
@@ -344,10 +1059,82 @@ class SynList(object):
         return {"name": self._name[index],
                 "synonyms": [k for k in self._list[index]]}
 
+    def _item_keys(self, index):
+        """
+        The sanitized keys that refer to an item
+        :param index:
+        :return:
+        """
+        return set(self._sanitize(t) for t in self._list[index])
+
+    def _serialize_sets(self):
+        self._require_all()
+        return (self._serialize_set(i) for i in range(len(self._list)) if self._list[i] is not None)
+
     def serialize(self):
+        self._flatten()
         json_string = self.__class__.__name__
         return {
             'ignore_case': self._ignore_case,
-            json_string: [self._serialize_set(i) for i in range(len(self._list))
-                          if self._list[i] is not None]
+            json_string: list(self._serialize_sets())
         }
+
+    def dump(self, fp, lines=False):
+        """
+        Write the SynList to a text file one entry at a time.  The JSON output has the same layout as serialize().
+        :param fp: a text file
+        :param lines: [False] write JSON Lines instead: a header line followed by one entry per line
+        :return: the number of entries written
+        """
+        self._flatten()
+        header = {'ignore_case': self._ignore_case}
+        if lines:
+            return write_json_lines(fp, header, self.__class__.__name__, self._serialize_sets())
+        return write_json(fp, header, self.__class__.__name__, self._serialize_sets())
+
+    def pack(self):
+        """
+        A read-only copy of the SynList in compact, array-backed storage (see synlist.packed)
+        :return: a PackedSynList
+        """
+        return PackedSynList.from_synlist(self)
+
+    def freeze(self):
+        """
+        An immutable snapshot of the SynList in which every known input variant is precomputed in one lookup table
+        (see synlist.frozen).  Item indices are kept.
+        :return: a FrozenSynList
+        """
+        return FrozenSynList.from_synlist(self)
+
+    def to_binary(self, path):
+        """
+        Write the SynList in a binary format that open_binary() can memory-map, so that many processes can share one
+        copy.  Entities are not saved.
+        :param path:
+        :return: the number of bytes written
+        """
+        return write_binary(self.pack(), path)
+
+    def to_directory(self, path):
+        """
+        Save the SynList as a directory of per-item files (see synlist.directory) and attach it to that directory, so
+        that later calls to save() only write what has changed.
+        :param path: a directory that does not exist or is empty
+        :return: the number of item files written
+        """
+        if os.path.isdir(path) and len(os.listdir(path)) > 0:
+            raise FileExistsError('Directory %s is not empty' % path)
+        self._require_all()
+        self._store = DirectoryStore(path)
+        self._store.touch(*range(len(self._list)))
+        return self._store.save(self)
+
+    def save(self):
+        """
+        Write the changes since the last load or save to the directory the SynList is attached to
+        :return: the number of item files written
+        """
+        if self._store is None:
+            raise AttributeError('SynList is not attached to a directory; use to_directory()')
+        return self._store.save(self)
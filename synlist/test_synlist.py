@@ -5,11 +5,26 @@ Things to test for:
  - all the problems I ran into when first creating the flowables, in unit form. this can actually be very constructive.
 """
 
-from synlist.synlist import SynList, InconsistentIndices
-from synlist.flowables import Flowables
+from synlist.synlist import SynList, InconsistentIndices, LoadConflicts, CannotSplitName
+from synlist.flowables import Flowables, ConflictingCas, NotACas, cas_number, format_cas, is_valid_cas
+from synlist.lexical import literal_fragments, edit_distance
+from synlist.streaming import JsonStreamReader
+from synlist.frozen import FrozenSynListError
+from synlist.concurrency import ConcurrentSynList
+from synlist.sqlite import SqliteSynList, SqliteFlowables
+from synlist.journal import Journal
+from synlist.bloom import BloomFilter
+from synlist.resolve import resolve, read_rows, write_rows
 
 import unittest
 import json
+import io
+import os
+import tempfile
+import pickle
+import subprocess
+import sys
+import threading
 
 
 synlist_json = '''\
@@ -163,6 +178,19 @@ class SynListTestCase(unittest.TestCase):
         self.assertEqual(self.synlist.synonym_set(set4), None)
         self.assertEqual(len(self.synlist), 4)
 
+    def test_merge_self(self):
+        self.synlist.merge('Zeke', 'your cousin')
+        self.assertEqual(len(self.synlist), 2)
+        self.assertEqual(self.synlist.name('your cousin'), 'Zeke')
+
+    def test_split_term(self):
+        new = self.synlist.split_term('your cousin')
+        self.assertEqual(self.synlist.index('your cousin'), new)
+        self.assertEqual(self.synlist.name('your cousin'), 'your cousin')
+        self.assertFalse(self.synlist.are_synonyms('your cousin', 'Zeke'))
+        self.assertTrue(self.synlist.are_synonyms('your cousin Zeke', 'Zeke'))
+        self.assertEqual(len(self.synlist), 3)
+
 
 class FlowablesBasicTest(SynListTestCase):
     """
@@ -182,5 +210,1327 @@ class FlowablesBasicTest(SynListTestCase):
         self.assertFalse(synlist.are_synonyms('i love you', 'i want you'))
 
 
+class CasIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.f = Flowables()
+        self.f.add_set(('carbon dioxide', '124-38-9'))
+        self.f.add_set(('CO2', 'carbonic anhydride'))
+        self.f.add_set(('water', '7732-18-5'))
+
+    def test_encoding(self):
+        self.assertEqual(cas_number('000124-38-9'), 124389)
+        self.assertIsNone(cas_number('124-389'))
+        self.assertEqual(format_cas(124389), '000124-38-9')
+        self.assertEqual(format_cas(124389, pad=False), '124-38-9')
+        self.assertTrue(is_valid_cas(cas_number('7732-18-5')))
+        self.assertFalse(is_valid_cas(cas_number('7732-18-4')))
+
+    def test_by_cas(self):
+        for cas in ('124-38-9', ' 000124-38-9', 124389):
+            self.assertEqual(self.f.by_cas(cas), 0)
+        self.assertIsNone(self.f.by_cas('64-17-5'))
+        with self.assertRaises(NotACas):
+            self.f.by_cas('water')
+        self.assertListEqual(self.f.cas_many(['CO2', 'Water']), [None, '007732-18-5'])
+
+    def test_merge(self):
+        for union_find in (False, True):
+            f = Flowables(union_find=union_find)
+            f.add_set(('carbon dioxide', '124-38-9'))
+            f.add_set(('CO2', 'carbonic anhydride'))
+            f.add_set(('dry ice', '64-17-5'))
+            f.add_set(('ice',))
+            f.merge('CO2', 'carbon dioxide')
+            self.assertEqual(f.by_cas('124-38-9'), 1)
+            f.merge('CO2', 'dry ice', multi_cas=True)
+            f.merge('ice', 'CO2')
+            self.assertEqual(f.by_cas('124-38-9'), 3)
+            self.assertEqual(f.by_cas('64-17-5'), 3)
+            if not union_find:
+                # merges keep the index current, demoted numbers included; by_cas only reads it
+                self.assertEqual(f._cas_index[cas_number('64-17-5')], 3)
+            self.assertEqual(f.cas('ice'), '000124-38-9')
+
+    def test_split(self):
+        self.f.add_synonyms('carbon dioxide', 'carbonic acid gas')
+        self.f.split_term('carbonic acid gas')
+        self.assertEqual(self.f.by_cas('124-38-9'), 0)
+
+    def test_check_digits(self):
+        self.f.add_set(('ethanol', '64-17-4'))
+        f = Flowables(check_digits=True)
+        f.add_set(('ethanol', '64-17-5'))
+        with self.assertRaises(NotACas):
+            f.add_set(('water', '7732-18-4'))
+
+    def test_bulk(self):
+        g = Flowables.from_json(self.f.serialize(), bulk=True)
+        self.assertDictEqual(g._cas_index, self.f._cas_index)
+        self.assertEqual(g.by_cas('7732-18-5'), 2)
+
+
+class ImportSetsTest(unittest.TestCase):
+    incoming = [('methane', '74-82-8'),  # new
+                ('Carbon Dioxide', 'CO2', 'dry ice'),  # extends
+                ('carbonic anhydride', 'ice', 'carbon dioxide'),  # spans
+                ('h2o', '7732-18-5', '64-17-5'),  # two CAS numbers
+                ('WATER', '124-38-9'),  # CAS of another item
+                ('0124-38-9', 'carbon dioxide gas'),  # known CAS, spelled differently
+                (None, ''),
+                ('CH4', 'marsh gas', 'METHANE')]  # extends an item added by this import
+
+    def setUp(self):
+        self.f = Flowables()
+        self.f.add_set(('carbon dioxide', '124-38-9'))
+        self.f.add_set(('water', '7732-18-5'))
+        self.f.add_set(('ice',))
+
+    def test_report(self):
+        report = self.f.import_sets(self.incoming)
+        self.assertDictEqual(report.counts, {'new': 1, 'extends': 3, 'spans': 1, 'cas': 2})
+        self.assertEqual(report.applied, 4)
+        self.assertListEqual([(c.position, c.kind, c.indices, c.index) for c in report.conflicts],
+                             [(2, 'spans', [2, 0], None), (3, 'cas', [1], None), (4, 'cas', [1, 0], None)])
+        self.assertEqual(self.f.index('marsh gas'), self.f.by_cas('74-82-8'))
+        self.assertSetEqual(self.f['co2'], {'carbon dioxide', '124-38-9', 'CO2', 'dry ice',
+                                            '0124-38-9', 'carbon dioxide gas'})
+        self.assertIsNone(self.f.index('h2o'))
+        self.assertIsNone(self.f.index('carbonic anhydride'))
+
+    def test_policies(self):
+        report = self.f.import_sets(self.incoming[2:3], policy='separate')
+        self.assertEqual(report.conflicts[0].index, 3)
+        self.assertSetEqual(self.f['carbonic anhydride'], {'carbonic anhydride'})
+        report = self.f.import_sets([('carbon dioxide', 'water', 'carbonic anhydride')], policy='merge')
+        self.assertEqual(report.applied, 0)  # water and carbon dioxide have different CAS numbers
+        self.f.import_sets([('carbon dioxide', 'carbonic anhydride', 'ice', 'dry ice')], policy='merge')
+        self.assertSetEqual(set(self.f.find_indices(('carbonic anhydride', 'ice', 'dry ice', '124-38-9'))), {0})
+        with self.assertRaises(ValueError):
+            self.f.import_sets([], policy='overwrite')
+
+    def test_check_digits(self):
+        f = Flowables(check_digits=True)
+        report = f.import_sets([('water', '7732-18-4'), ('ethanol', '64-17-5')])
+        self.assertListEqual([c.kind for c in report.conflicts], ['cas'])
+        self.assertEqual(f.by_cas('64-17-5'), 0)
+
+
+class SqliteTest(SynListTestCase):
+    """
+    The same tests, on a SynList stored in SQLite
+    """
+    def setUp(self):
+        j = json.loads(synlist_json)
+        j['SqliteSynList'] = j.pop('SynList')
+        self.synlist = SqliteSynList.from_json(j, path=':memory:')
+
+    def tearDown(self):
+        self.synlist.close()
+
+
+class SqliteFileTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, 'flowables.db')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_persistence(self):
+        with SqliteFlowables(self.path, cache_size=4) as f:
+            with f.transaction():
+                f.add_set(('carbon dioxide', '124-38-9'))
+                f.add_set(('CO2', 'carbonic anhydride'))
+                f.add_set(('water', '7732-18-5'))
+            self.assertEqual(f.index('co2'), 1)  # cached
+            f.merge('carbon dioxide', 'CO2')
+            self.assertEqual(f.index('co2'), 0)
+            self.assertEqual(f.by_cas(124389), 0)
+            with self.assertRaises(ConflictingCas):
+                with f.transaction():
+                    f.add_set(('ice', 'frozen water'))
+                    f.add_synonyms('water', '64-17-5')
+            self.assertIsNone(f.index('ice'))
+        with SqliteFlowables(self.path) as f:
+            self.assertEqual(len(f), 2)
+            self.assertEqual(f.cas('CARBONIC ANHYDRIDE'), '000124-38-9')
+            self.assertSetEqual(f.search('carbon'), {0})
+            self.assertSetEqual(f.search('^[0-9]+-18-'), {2})
+            self.assertEqual(f.new_item(), 3)
+            self.assertListEqual([i['name'] for i in f.serialize()['SqliteFlowables']], ['carbon dioxide', 'water'])
+            self.assertEqual(f.freeze().name('124-38-9'), 'carbon dioxide')
+        with self.assertRaises(ValueError):
+            SqliteSynList(self.path)
+
+    def test_bookkeeping(self):
+        with SqliteSynList(self.path, ignore_case=True) as s:
+            s.add_set(('carbon dioxide', 'CO2'))
+            s.add_set(('water', 'ice', 'Ice'))
+            s.set_entity('water', 'H2O')
+            s.move('ice', 'CO2')  # the term map of 'water' is kept from now on
+            s.add_set(('steam',))
+            s.merge('water', 'steam')
+            self.assertEqual(len(s), 2)
+            self.assertDictEqual(s._term_map(1), {'water': {'water'}, 'steam': {'steam'}})
+            with self.assertRaises(ValueError):
+                with s.transaction():
+                    s.set_entity('water', None)
+                    s.set_entity('CO2', 'carbonic')
+                    s.merge('water', 'CO2')
+                    raise ValueError
+            self.assertEqual(len(s), 2)
+            self.assertEqual(s.entity('steam'), 'H2O')
+            self.assertIsNone(s.entity('co2'))
+            self.assertDictEqual(s._term_map(0), {'carbon dioxide': {'carbon dioxide'}, 'co2': {'CO2'},
+                                                  'ice': {'ice', 'Ice'}})
+
+
+class SqliteFlowablesTest(FlowablesBasicTest):
+    def setUp(self):
+        j = json.loads(synlist_json)
+        j['SqliteFlowables'] = j.pop('SynList')
+        self.synlist = SqliteFlowables.from_json(j, path=':memory:')
+
+    def tearDown(self):
+        self.synlist.close()
+
+
+class UnionFindTest(SynListTestCase):
+    """
+    The same tests, resolving merges through the disjoint-set forest
+    """
+    def setUp(self):
+        self.synlist = SynList.from_json(json.loads(synlist_json), union_find=True)
+
+    def test_hub_merges(self):
+        rewrite = SynList.from_json(json.loads(synlist_json))
+        for s in (rewrite, self.synlist):
+            for i in range(200):
+                s.add_set(('term %d' % i, 'alias %d' % i))
+            for i in range(1, 200):
+                s.merge('term %d' % (i // 3), 'alias %d' % i)
+        for i in range(200):
+            self.assertEqual(self.synlist.index('alias %d' % i), rewrite.index('alias %d' % i))
+        self.synlist.compact()
+        self.assertTrue(self.synlist._forest.flat)
+        self.assertEqual(self.synlist.index('term 199'), 2)
+        self.assertDictEqual({i['name']: set(i['synonyms']) for i in self.synlist.serialize()['SynList']},
+                             {i['name']: set(i['synonyms']) for i in rewrite.serialize()['SynList']})
+
+
+class FlowablesUnionFindTest(FlowablesBasicTest):
+    def setUp(self):
+        j = json.loads(synlist_json)
+        j['Flowables'] = j.pop('SynList')
+        self.synlist = Flowables.from_json(j, union_find=True)
+
+    def test_merge_cas(self):
+        self.synlist.add_set(('carbon dioxide', '124-38-9'))
+        self.synlist.add_set(('CO2', 'carbonic anhydride'))
+        self.synlist.merge('CO2', 'carbon dioxide')
+        self.assertEqual(self.synlist.cas('000124-38-9'), '000124-38-9')
+        self.assertEqual(self.synlist.index('000124-38-9'), self.synlist.index('CO2'))
+
+
+class BulkLoadTest(SynListTestCase):
+    """
+    The same tests, on a SynList built by the bulk loader
+    """
+    def setUp(self):
+        self.synlist = SynList.from_json(json.loads(synlist_json), bulk=True)
+
+    def test_validate(self):
+        j = json.loads(synlist_json)
+        j['SynList'].append({'name': 'Bad', 'synonyms': ['zeke', 'Henry VII', 'Bad']})
+        j['SynList'].append({'name': 'Henry VII', 'synonyms': ['Arthur the Great']})
+        with self.assertRaises(LoadConflicts) as cm:
+            SynList.from_json(j, bulk=True, validate=True)
+        self.assertListEqual([(c.term, c.existing) for c in cm.exception.conflicts],
+                             [('zeke', 1), ('Henry VII', 0), ('Arthur the Great', 0), ('Henry VII', 0)])
+        s = cm.exception.synlist
+        self.assertEqual(len(s), 3)
+        self.assertSetEqual(s.synonyms_for('Bad'), {'Bad'})
+
+    def test_validate_renames(self):
+        j = json.loads(synlist_json)
+        j['SynList'].append({'name': 'zeke', 'synonyms': ['Zebedee', 'Zacharias', 'Zerubbabel', 'Zephaniah']})
+        with self.assertRaises(LoadConflicts) as cm:
+            SynList.from_json(j, bulk=True, validate=True)
+        self.assertEqual(cm.exception.synlist.name('Zephaniah'), 'Zebedee')  # the first term kept, as entered
+
+
+class FlowablesBulkLoadTest(FlowablesBasicTest):
+    def setUp(self):
+        j = json.loads(synlist_json)
+        j['Flowables'] = j.pop('SynList')
+        self.synlist = Flowables.from_json(j, bulk=True)
+
+    def test_round_trip(self):
+        f = Flowables()
+        f.add_set(('carbon dioxide', '124-38-9', 'CO2'))
+        f.add_set(('water', '7732-18-5'))
+        j = f.serialize()
+        g = Flowables.from_json(j, bulk=True, validate=True)
+        self.assertDictEqual(g._dict, f._dict)
+        self.assertListEqual(g._cas, f._cas)
+        self.assertEqual(g.name('000124-38-9'), 'carbon dioxide')
+
+    def test_validate_cas(self):
+        j = {'Flowables': [{'name': 'water', 'synonyms': ['7732-18-5']},
+                           {'name': 'ice', 'synonyms': ['007732-18-5', 'frozen water']},
+                           {'name': 'mixture', 'synonyms': ['64-17-5', '50-00-0']}]}
+        with self.assertRaises(LoadConflicts) as cm:
+            Flowables.from_json(j, bulk=True, validate=True)
+        self.assertListEqual([(c.kind, c.term, c.existing) for c in cm.exception.conflicts],
+                             [('cas', '007732-18-5', 0), ('cas', '50-00-0', 2)])
+        self.assertEqual(cm.exception.synlist.cas('mixture'), '000064-17-5')
+
+
+class StreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.synlist = SynList.from_json(json.loads(synlist_json))
+        self.synlist.add_set(('1,000 "quoted" terms', 'unicode \u00e9t\u00e9'))
+
+    def _names(self, s):
+        return {i['name']: set(i['synonyms']) for i in s.serialize()[s.__class__.__name__]}
+
+    def test_dump_layout(self):
+        fp = io.StringIO()
+        self.assertEqual(self.synlist.dump(fp), 3)
+        self.assertEqual(json.loads(fp.getvalue()), self.synlist.serialize())
+
+    def test_round_trip(self):
+        for lines in (False, True):
+            fp = io.StringIO()
+            self.synlist.dump(fp, lines=lines)
+            fp.seek(0)
+            s = SynList.load(fp, lines=lines)
+            self.assertDictEqual(self._names(s), self._names(self.synlist))
+
+    def test_small_chunks(self):
+        j = self.synlist.serialize()
+        fp = io.StringIO(json.dumps(j, indent=2))
+        reader = JsonStreamReader(fp, 'SynList', chunk_size=7)
+        self.assertDictEqual(reader.header, {'ignore_case': False})
+        self.assertListEqual(list(reader), j['SynList'])
+
+    def test_header_after_list(self):
+        text = json.dumps({'SynList': [], 'ignore_case': True}, sort_keys=True)
+        reader = JsonStreamReader(io.StringIO(text), 'SynList')
+        self.assertListEqual(list(reader), [])
+        self.assertDictEqual(reader.header, {'ignore_case': True})
+        text = json.dumps(self.synlist.serialize(), sort_keys=True)
+        with self.assertRaises(ValueError):
+            SynList.load(io.StringIO(text))
+        s = SynList.load(io.StringIO(text), ignore_case=False, bulk=True)
+        self.assertDictEqual(self._names(s), self._names(self.synlist))
+
+    def test_flowables(self):
+        f = Flowables()
+        f.add_set(('carbon dioxide', '124-38-9', 'CO2'))
+        fp = io.StringIO()
+        f.dump(fp, lines=True)
+        fp.seek(0)
+        g = Flowables.load(fp, lines=True, bulk=True)
+        self.assertEqual(g.cas('co2'), '000124-38-9')
+
+
+class DirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, 'syns')
+        self.synlist = SynList.from_json(json.loads(synlist_json))
+        self.synlist.add_set(('apple', 'Malus domestica'))
+        self.synlist.add_set(('pear', 'Pyrus'))
+        self.synlist.to_directory(self.path)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_layout(self):
+        self.assertSetEqual(set(os.listdir(self.path)), {'t', 'z', 'a', 'p', 'keys'})
+        self.assertEqual(len(os.listdir(os.path.join(self.path, 'a'))), 1)
+
+    def test_round_trip(self):
+        s = SynList.from_directory(self.path)
+        self.assertEqual(len(s), 4)
+        self.assertSetEqual(s.synonyms_for('Zeke'), self.synlist.synonyms_for('Zeke'))
+        self.assertEqual(s.name('Henry VII'), 'The Great Houdini')
+
+    def test_lazy(self):
+        s = SynList.from_directory(self.path, lazy=True)
+        self.assertEqual(s.name('Malus domestica'), 'apple')
+        self.assertSetEqual(s._store._loaded, {'a'})
+        self.assertIsNone(s.index('banana'))
+        self.assertTrue(s.are_synonyms('your cousin', 'zeke'))
+        self.assertSetEqual(s._store._loaded, {'a', 'z'})
+        self.assertEqual(len(s), 4)
+        listed = []
+        s._store._shards = lambda: listed.append(1) or []
+        for _ in range(10):
+            self.assertEqual(len(s), 4)
+        s.search('apple')
+        self.assertListEqual(listed, [])  # once everything is loaded, the directory is not listed again
+
+    def test_incremental_save(self):
+        s = SynList.from_directory(self.path, lazy=True)
+        s.add_synonyms('pear', 'Pyrus communis')
+        s.merge('apple', 'Henry VII')
+        self.assertSetEqual(s._store._loaded, {'a', 'p', 't'})
+        self.assertEqual(s.save(), 2)
+        self.assertEqual(s.save(), 0)
+        self.assertSetEqual(set(os.listdir(os.path.join(self.path, 't'))), set())
+        t = SynList.from_directory(self.path, lazy=True)
+        self.assertEqual(t.name('The Great Houdini'), 'apple')
+        self.assertEqual(t.name('Pyrus communis'), 'pear')
+        self.assertEqual(len(t), 3)
+
+    def test_save_changed_items(self):
+        self.synlist.new_item()
+        self.assertEqual(self.synlist.save(), 0)  # an empty item has no file
+        self.synlist.set_name('Malus domestica')
+        self.synlist.remove_term('Pyrus')
+        self.assertSetEqual(self.synlist._store._dirty, {self.synlist.index('apple'), self.synlist.index('pear')})
+        self.assertEqual(self.synlist.save(), 2)
+        self.assertSetEqual(self.synlist._store._dirty, set())
+        self.assertSetEqual(set(os.listdir(os.path.join(self.path, 'a'))), set())
+        self.synlist.new_item()
+        self.synlist.to_directory(os.path.join(self._tmp.name, 'copy'))
+        t = SynList.from_directory(os.path.join(self._tmp.name, 'copy'))
+        self.assertEqual(t.name('apple'), 'Malus domestica')
+        self.assertSetEqual(t.synonyms_for('pear'), {'pear'})
+
+    def test_lazy_flowables(self):
+        f = Flowables()
+        f.add_set(('carbon dioxide', '124-38-9'))
+        f.add_set(('water', '7732-18-5'))
+        path = os.path.join(self._tmp.name, 'flowables')
+        f.to_directory(path)
+        self.assertTrue(os.path.exists(os.path.join(path, 'ignoreCase')))
+        g = Flowables.from_directory(path, lazy=True)
+        self.assertEqual(g.name('000124-38-9'), 'carbon dioxide')
+        self.assertSetEqual(g._store._loaded, {'c'})
+
+
+class PackedTest(unittest.TestCase):
+    def setUp(self):
+        self.synlist = SynList.from_json(json.loads(synlist_json))
+        self.synlist.add_set(('caf\u00e9', 'coffee shop'))
+        self.synlist.merge('Zeke', 'coffee shop')
+        self.packed = self.synlist.pack()
+
+    def test_queries(self):
+        for term in ('Zeke', 'zeke', ' your cousin ', 'Henry VII', 'caf\u00e9', 'nobody', 2, None):
+            self.assertEqual(self.packed.index(term), self.synlist.index(term), term)
+            self.assertEqual(self.packed.synonyms_for(term), self.synlist.synonyms_for(term), term)
+        self.assertEqual(self.packed.name('coffee shop'), 'Zeke')
+        self.assertTrue(self.packed.are_synonyms('caf\u00e9', 'your cousin'))
+        self.assertEqual(len(self.packed), 2)
+        with self.assertRaises(KeyError):
+            self.packed.name('nobody')
+
+    def test_serialize(self):
+        self.assertDictEqual(self.packed.serialize(), self.synlist.serialize())
+        s = self.packed.to_synlist()
+        self.assertSetEqual(s.synonyms_for('coffee shop'), self.synlist.synonyms_for('Zeke'))
+
+    def test_flowables(self):
+        f = Flowables()
+        f.add_set(('carbon dioxide', '124-38-9', 'CO2'))
+        f.add_set(('Water', '7732-18-5'))
+        p = f.pack()
+        self.assertEqual(p.cas('co2'), '000124-38-9')
+        self.assertEqual(p.cas_name('WATER'), '7732-18-5')
+        self.assertEqual(p.index('000124-38-9'), f.index('000124-38-9'))
+        self.assertLess(p.nbytes(), 1000)
+
+
+class FrozenTest(unittest.TestCase):
+    def setUp(self):
+        self.synlist = SynList.from_json(json.loads(synlist_json))
+        self.synlist.add_set(('caf\u00e9', 'coffee shop'))
+        self.synlist.merge('Zeke', 'coffee shop')
+        self.frozen = self.synlist.freeze()
+
+    def _check(self, frozen):
+        for term in ('Zeke', 'zeke', ' your cousin ', 'Henry VII', 'caf\u00e9', 'nobody', 2, None):
+            self.assertEqual(frozen.index(term), self.synlist.index(term), term)
+            self.assertEqual(frozen.synonyms_for(term), self.synlist.synonyms_for(term), term)
+        self.assertEqual(frozen.name('coffee shop'), 'Zeke')
+        self.assertEqual(len(frozen), 2)
+        self.assertDictEqual(frozen.serialize(), self.synlist.serialize())
+
+    def test_queries(self):
+        self._check(self.frozen)
+        with self.assertRaises(KeyError):
+            self.frozen.name('nobody')
+
+    def test_read_only(self):
+        with self.assertRaises(FrozenSynListError):
+            self.frozen.add_set(('a', 'b'))
+        with self.assertRaises(FrozenSynListError):
+            self.frozen.merge('Zeke', 'Henry VII')
+        s = self.frozen.thaw()
+        s.add_set(('a', 'b'))
+        self.assertEqual(len(s), 3)
+
+    def test_pickle(self):
+        self._check(pickle.loads(pickle.dumps(self.frozen)))
+        self.assertListEqual(sorted(self.frozen.__dict__), sorted(pickle.loads(pickle.dumps(self.frozen)).__dict__))
+        self.synlist.add_set(('null\x00byte',))
+        frozen = self.synlist.freeze()
+        self.assertEqual(pickle.loads(pickle.dumps(frozen)).name('null\x00byte'), 'null\x00byte')
+
+    def test_flowables(self):
+        f = Flowables()
+        f.add_set(('Carbon Dioxide', '124-38-9', 'CO2'))
+        z = pickle.loads(pickle.dumps(f.freeze()))
+        self.assertEqual(z.cas('co2'), '000124-38-9')
+        self.assertEqual(z.cas_name('carbon dioxide'), '124-38-9')
+        self.assertEqual(z.index('000124-38-9'), 0)
+        self.assertEqual(z.index('CARBON DIOXIDE '), 0)
+
+
+class MappedTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.synlist = SynList.from_json(json.loads(synlist_json))
+        self.synlist.add_set(('caf\u00e9', 'coffee shop'))
+        self.synlist.merge('Zeke', 'coffee shop')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_queries(self):
+        path = os.path.join(self._tmp.name, 'syns.bin')
+        self.synlist.to_binary(path)
+        with SynList.open_binary(path) as m:
+            for term in ('Zeke', 'zeke', ' your cousin ', 'Henry VII', 'caf\u00e9', 'nobody', 2, None):
+                self.assertEqual(m.index(term), self.synlist.index(term), term)
+                self.assertEqual(m.synonyms_for(term), self.synlist.synonyms_for(term), term)
+            self.assertEqual(m.name('coffee shop'), 'Zeke')
+            self.assertTrue(m.are_synonyms('caf\u00e9', 'your cousin'))
+            self.assertEqual(len(m), 2)
+            self.assertDictEqual(m.serialize(), self.synlist.serialize())
+            with pickle.loads(pickle.dumps(m)) as n:
+                self.assertEqual(n.name('Henry VII'), 'The Great Houdini')
+
+    def test_flowables(self):
+        f = Flowables()
+        f.add_set(('Carbon Dioxide', '124-38-9', 'CO2'))
+        f.add_set(('water', '7732-18-5'))
+        path = os.path.join(self._tmp.name, 'flowables.bin')
+        f.to_binary(path)
+        with Flowables.open_binary(path) as m:
+            self.assertEqual(m.cas('co2'), '000124-38-9')
+            self.assertEqual(m.cas_name('carbon dioxide'), '124-38-9')
+            self.assertEqual(m.name('007732-18-5'), 'water')
+            self.assertIsNone(m.index('ice'))
+            self.assertListEqual(list(m.index_many(['CO2', 'ice', 'Water'])), [0, -1, 1])
+            self.assertListEqual(m.cas_many(['CO2', 'ice']), ['000124-38-9', None])
+
+
+class BatchLookupTest(unittest.TestCase):
+    terms = ('Zeke', 'nobody', 'Henry VII', 'zeke', None, 'nobody', ' your cousin ', 'Zeke')
+
+    def setUp(self):
+        self.synlist = SynList.from_json(json.loads(synlist_json))
+
+    def test_index_many(self):
+        for s in (self.synlist, self.synlist.freeze(), self.synlist.pack()):
+            self.assertListEqual(list(s.index_many(self.terms)), [1, -1, 0, 1, -1, -1, 1, 1])
+            self.assertListEqual(s.names_many(iter(self.terms)),
+                                 ['Zeke', None, 'The Great Houdini', 'Zeke', None, None, 'Zeke', 'Zeke'])
+
+    def test_cas_many(self):
+        f = Flowables()
+        f.add_set(('carbon dioxide', '124-38-9'))
+        f.add_set(('nitrogen', 'N2'))
+        terms = ['CARBON DIOXIDE', 'n2', 'argon', '000124-38-9']
+        for s in (f, f.freeze(), f.pack()):
+            self.assertListEqual(list(s.index_many(terms)), [0, 1, -1, 0])
+            self.assertListEqual(s.cas_many(terms), ['000124-38-9', None, None, '000124-38-9'])
+
+
+class ConcurrentTest(unittest.TestCase):
+    def setUp(self):
+        self.c = ConcurrentSynList(SynList.from_json(json.loads(synlist_json)))
+
+    def test_batch(self):
+        before = self.c.snapshot
+        with self.c.batch() as s:
+            s.merge('Zeke', 'Henry VII')
+            self.assertFalse(self.c.are_synonyms('Zeke', 'Henry VII'))  # not published yet
+        self.assertEqual(self.c.version, 1)
+        self.assertTrue(self.c.are_synonyms('Zeke', 'Henry VII'))
+        self.assertFalse(before.are_synonyms('Zeke', 'Henry VII'))
+        self.assertEqual(len(self.c), 1)
+        with self.assertRaises(FrozenSynListError):
+            self.c.merge('Zeke', 'The Great Houdini')
+
+    def test_rollback(self):
+        self.c._writer.set_entity('Zeke', 'cousin')
+        with self.c.batch():
+            pass
+        with self.assertRaises(KeyError):
+            with self.c.batch() as s:
+                s.add_set(('new term', 'another'))
+                s.merge('Zeke', 'nobody')
+        self.assertEqual(self.c.version, 1)
+        with self.c.batch() as s:
+            self.assertIsNone(s.index('new term'))
+            self.assertEqual(s.entity('your cousin'), 'cousin')
+        self.assertIsNone(self.c.index('new term'))
+
+    def test_rollback_multi_cas(self):
+        f = Flowables()
+        f.add_set(('carbon dioxide', '124-38-9'))
+        f.add_set(('ethanol', '64-17-5'))
+        c = ConcurrentSynList(f)
+        with c.batch() as s:
+            s.merge('ethanol', 'carbon dioxide', multi_cas=True)
+        with self.assertRaises(KeyError):
+            with c.batch() as s:
+                s.add_set(('water', '7732-18-5'))
+                s.set_cas('ethanol', '124-38-9')
+                s.merge('water', 'nobody')
+        with c.batch() as s:
+            self.assertIsNone(s.index('water'))
+            self.assertEqual(s.cas('ethanol'), '000064-17-5')
+            self.assertEqual(s.by_cas('124-38-9'), s.index('ethanol'))
+        self.assertEqual(c.version, 2)
+        self.assertIsNone(c.index('water'))
+
+    def test_readers(self):
+        errors = []
+        done = threading.Event()
+
+        def _read():
+            while not done.is_set():
+                snap = self.c.snapshot
+                for term in ('Zeke', 'Henry VII', 'term 5', 'alias 7'):
+                    i = snap.index(term)
+                    if i is not None and (snap.synonym_set(i) is None or snap.name(term) not in snap[term]):
+                        errors.append((self.c.version, term))
+
+        readers = [threading.Thread(target=_read) for _ in range(3)]
+        for r in readers:
+            r.start()
+        for n in range(20):
+            with self.c.batch() as s:
+                s.add_set(('term %d' % n, 'alias %d' % n))
+                if n > 0:
+                    s.merge('term %d' % n, 'term %d' % (n - 1))
+                if n % 5 == 4:
+                    s.split_term('alias %d' % (n - 2))
+        done.set()
+        for r in readers:
+            r.join()
+        self.assertListEqual(errors, [])
+        self.assertEqual(self.c.version, 20)
+        self.assertTrue(self.c.are_synonyms('term 0', 'alias 19'))
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, 'journal')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    @staticmethod
+    def _items(s):
+        return {i['name']: set(i['synonyms']) for i in s.serialize()[s.__class__.__name__]}
+
+    def _edit(self, j):
+        j.add_set(('Zeke', 'your cousin'))
+        j.add_set(('Henry VII', 'The Great Houdini'))
+        j.set_name('The Great Houdini')
+        j.add_synonym(j.index('Zeke'), 'Ezekiel')
+        j.merge(1, 'Zeke')
+        j.add_set(('Arthur', 'King'))
+        with self.assertRaises(InconsistentIndices):
+            j.add_synonyms('Arthur', 'Zeke', 'Lancelot')
+        j.split_term('Ezekiel')
+        j.set_entity('Arthur', {'ref': 1})
+
+    def test_replay(self):
+        with Journal(self.path, ignore_case=True) as j:
+            self._edit(j)
+            expected = self._items(j.synlist)
+        with Journal(self.path) as j:
+            self.assertDictEqual(self._items(j.synlist), expected)
+            self.assertEqual(j.entity('king'), {'ref': 1})
+            self.assertEqual(j.name('your cousin'), 'The Great Houdini')
+        with open(os.path.join(self.path, 'journal-000000.jsonl')) as fp:
+            records = [json.loads(line) for line in fp]
+        self.assertListEqual([r['op'] for r in records][-4:], ['add_set', 'add_synonyms', 'split_term', 'set_entity'])
+        self.assertEqual(records[-3]['error'], 'InconsistentIndices')
+        self.assertListEqual(records[4]['args'], ['The Great Houdini', 'Zeke'])
+
+    def test_checkpoint(self):
+        with Journal(self.path, checkpoint_every=4) as j:
+            self._edit(j)
+            expected = self._items(j.synlist)
+        self.assertListEqual(sorted(os.listdir(self.path)),
+                             ['checkpoint-000002.jsonl', 'journal-000000.jsonl', 'journal-000001.jsonl',
+                              'journal-000002.jsonl'])
+        with open(os.path.join(self.path, 'journal-000002.jsonl'), 'a') as fp:
+            fp.write('{"op": "add_set", "ar')  # interrupted write
+        with Journal(self.path, prune=True) as j:
+            self.assertDictEqual(self._items(j.synlist), expected)
+            self.assertEqual(j.entity('Arthur'), {'ref': 1})
+            j.checkpoint()
+            j.add_term('Guinevere')
+        self.assertListEqual(sorted(os.listdir(self.path)), ['checkpoint-000003.jsonl', 'journal-000000.jsonl',
+                                                             'journal-000001.jsonl', 'journal-000003.jsonl'])
+        with Journal(self.path) as j:
+            self.assertEqual(j.entity('Arthur'), {'ref': 1})
+            self.assertIsNotNone(j.index('Guinevere'))
+
+    def test_flowables(self):
+        with Journal(self.path, cls=Flowables) as j:
+            j.import_sets([('carbon dioxide', '124-38-9'), ('CO2', '124-38-9')])
+            j.add_set(('water', '7732-18-5'))
+            with self.assertRaises(ConflictingCas):
+                j.merge('water', 'co2')
+        with Journal(self.path, cls=Flowables) as j:
+            self.assertEqual(j.by_cas('124-38-9'), j.index('co2'))
+            self.assertFalse(j.are_synonyms('water', 'co2'))
+
+    def test_multi_cas_checkpoint(self):
+        with Journal(self.path, cls=Flowables) as j:
+            j.add_set(('carbon dioxide', '124-38-9'))
+            j.add_set(('ethanol', '64-17-5'))
+            j.add_set(('water', '7732-18-5'))
+            j.merge('ethanol', 'carbon dioxide', multi_cas=True)
+            j.set_cas('water', None)
+            j.checkpoint()
+        with Journal(self.path, cls=Flowables) as j:
+            self.assertEqual(j.cas('ethanol'), '000064-17-5')
+            self.assertEqual(j.by_cas('124-38-9'), j.index('ethanol'))
+            self.assertIsNone(j.cas('water'))
+            self.assertEqual(j.by_cas('7732-18-5'), j.index('water'))
+            j.set_cas('ethanol', '124-38-9')
+            j.checkpoint()
+        with Journal(self.path, cls=Flowables) as j:
+            self.assertEqual(j.cas('ethanol'), '000124-38-9')
+
+
+class CompleteTest(unittest.TestCase):
+    sets = (('Carbon dioxide', 'CO2', 'carbonic anhydride', '124-38-9'), ('carbon monoxide', 'CO'),
+            ('Carbon', 'graphite'), ('water', '7732-18-5'))
+
+    def _flowables(self, **kwargs):
+        f = Flowables(**kwargs)
+        for s in self.sets:
+            f.add_set(s)
+        return f
+
+    def test_agrees(self):
+        plain = self._flowables()
+        indexed = self._flowables(prefix_index=True)
+        for prefix in ('carbon', ' Carb', 'c', '000', '7', 'x', ''):
+            for limit in (1, 3, None):
+                self.assertListEqual(indexed.complete(prefix, limit=limit), plain.complete(prefix, limit=limit))
+        self.assertListEqual([k for k, _, _ in indexed.complete('carbon ')], ['carbon dioxide', 'carbon monoxide'])
+        self.assertTupleEqual(indexed.complete('co2')[0], ('co2', 0, 'Carbon dioxide'))
+
+    def test_updates(self):
+        f = self._flowables(prefix_index=True)
+        for i in range(100):
+            f.add_term('carbon %d' % i)
+        self.assertEqual(len(f.complete('carbon ', limit=None)), 102)
+        f.merge('carbon dioxide', 'carbon monoxide')
+        f.split_term('carbonic anhydride')
+        found = dict((k, (i, n)) for k, i, n in f.complete('carbon', limit=None))
+        self.assertTupleEqual(found['carbon monoxide'], (0, 'Carbon dioxide'))
+        self.assertEqual(found['carbonic anhydride'][1], 'carbonic anhydride')
+
+    def test_case_sensitive(self):
+        s = SynList(prefix_index=True)
+        s.add_set(('Zeke', 'zeke', 'your cousin'))
+        self.assertListEqual(s.complete('ZE'), [('Zeke', 0, 'Zeke'), ('zeke', 0, 'Zeke')])
+
+    def test_sqlite(self):
+        f = SqliteFlowables(':memory:')
+        for s in self.sets:
+            f.add_set(s)
+        self.assertListEqual(f.complete('carbon', limit=None), self._flowables().complete('carbon', limit=None))
+
+
+class ClosestTest(unittest.TestCase):
+    sets = (('Carbon dioxide', 'CO2', 'carbonic anhydride', '124-38-9'), ('carbon monoxide', 'CO'),
+            ('Carbon', 'graphite'), ('water', '7732-18-5'), ('sodium chloride', 'salt'))
+
+    def _flowables(self, **kwargs):
+        f = Flowables(**kwargs)
+        for s in self.sets:
+            f.add_set(s)
+        return f
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance('chloride', 'chlorine', 2), 1)
+        self.assertEqual(edit_distance('kitten', 'sitting', 3), 3)
+        self.assertIsNone(edit_distance('kitten', 'sitting', 2))
+        self.assertEqual(edit_distance('', 'ab', 2), 2)
+
+    def test_agrees(self):
+        plain = self._flowables()
+        indexed = self._flowables(fuzzy_index=True)
+        for term in ('carbon dioxde', 'Carbn monoxide', 'cabon', 'watr', 'sodium chlorid', 'co', 'xyz', '124-38-8'):
+            for d in (0, 1, 2):
+                self.assertListEqual(indexed.closest(term, max_distance=d), plain.closest(term, max_distance=d))
+        self.assertListEqual(indexed.closest('carbon dioxde', limit=1), [('carbon dioxide', 0, 'Carbon dioxide', 1)])
+        with self.assertRaises(ValueError):
+            indexed.closest('carbon', max_distance=3)
+
+    def test_one_per_item(self):
+        f = self._flowables(fuzzy_index=True)
+        f.merge('carbon', 'carbon dioxide')
+        found = f.closest('carbon dioxid', max_distance=2, limit=None)
+        self.assertListEqual([(i, d) for _, i, _, d in found], [(2, 1)])
+
+    def test_discard_and_pickle(self):
+        plain = self._flowables()
+        indexed = self._flowables(fuzzy_index=True)
+        for f in (plain, indexed):
+            f.remove_term('carbonic anhydride')
+        copy = pickle.loads(pickle.dumps(indexed))  # the index is rebuilt from its keys
+        self.assertEqual(len(copy._fuzzy), len(indexed._fuzzy))
+        for term in ('carbonic anhydrid', 'carbon dioxde', 'watr'):
+            self.assertListEqual(copy.closest(term), plain.closest(term))
+            self.assertListEqual(indexed.closest(term), plain.closest(term))
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_filter(self):
+        b = BloomFilter(capacity=1000, error_rate=0.01)
+        keys = ['term %d' % i for i in range(5000)]  # grows beyond its first layer
+        b.update(keys)
+        self.assertTrue(all(k in b for k in keys))
+        false_positives = sum(1 for i in range(10000) if 'other %d' % i in b)
+        self.assertLess(false_positives, 200)
+
+    def test_lookups(self):
+        for cls in (SynList, Flowables):
+            s = cls(bloom_filter=True)
+            plain = cls()
+            for synlist in (s, plain):
+                synlist.add_set(('Henry VII', 'Arthur the Great'))
+                synlist.add_set(('Zeke', 'zeke', 'your cousin'))
+            terms = ['Zeke', ' zeke ', 'ZEKE', 'Henry VII', 'Harry', None, 1, 'your cousin']
+            self.assertListEqual(s.index_many(terms[:5]).tolist(), plain.index_many(terms[:5]).tolist())
+            for t in terms:
+                self.assertEqual(s.index(t), plain.index(t), t)
+            s.add_set(('Harry', 'Houdini'))
+            self.assertEqual(s.index('Harry'), 2)
+
+    def test_compact(self):
+        s = SynList(bloom_filter=True)
+        s.add_set(('Zeke', 'your cousin'))
+        s.remove_term('your cousin')
+        self.assertIn('your cousin', s._filter)
+        s.compact()
+        self.assertNotIn('your cousin', s._filter)
+        self.assertEqual(s.index('Zeke'), 0)
+
+    def test_sqlite(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'f.db')
+            with SqliteFlowables(path) as f:
+                f.add_set(('carbon dioxide', '124-38-9'))
+            with SqliteFlowables(path, bloom_filter=True) as f:
+                self.assertEqual(f.index('000124-38-9'), 0)
+                self.assertIsNone(f.index('methane'))
+                f.add_set(('methane', 'CH4'))
+                self.assertEqual(f.index('ch4'), 1)
+
+    def test_pickle(self):
+        s = SynList(bloom_filter=True)
+        for i in range(2000):
+            s.add_set(('term %d' % i,))
+        data = pickle.dumps(s)
+        self.assertNotIsInstance(s.__getstate__()['_filter'], BloomFilter)
+        # string hashes differ between processes: unpickle in a fresh one, with another hash seed
+        script = ('import pickle, sys; s = pickle.loads(sys.stdin.buffer.read()); '
+                  'print(sum(1 for i in range(2000) if s.index("term %d" % i) is None))')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONHASHSEED='1', PYTHONPATH=root)
+        out = subprocess.run([sys.executable, '-c', script], input=data, stdout=subprocess.PIPE, env=env, check=True)
+        self.assertEqual(out.stdout.strip(), b'0')
+
+    def test_lazy_directory(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 's')
+            SynList.from_json(json.loads(synlist_json)).to_directory(path)
+            s = SynList.from_directory(path, lazy=True, bloom_filter=True)
+            self.assertIsNone(s.index('Harry'))
+            self.assertEqual(s.name('your cousin'), 'Zeke')
+
+
+class QueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.f = Flowables(query_cache=16)
+        self.f.add_set(('carbon dioxide', 'CO2', '124-38-9'))
+        self.f.add_set(('carbonic anhydride',))
+
+    def test_hits(self):
+        self.assertIsNone(Flowables().cache_stats())
+        for t in ('CO2', 'co2', ' Co2 '):
+            self.assertEqual(self.f.name(t), 'carbon dioxide')
+            self.assertEqual(self.f.cas_name(t), '124-38-9')
+        self.assertSetEqual(self.f.search('carbon'), {0, 1})
+        found = self.f.search('carbon')
+        found.add(5)
+        self.assertSetEqual(self.f.search('carbon'), {0, 1})
+        stats = self.f.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (6, 3, 3))
+
+    def test_invalidation(self):
+        self.assertSetEqual(self.f.search('dry ice'), set())
+        self.f.add_synonym(1, 'dry ice')
+        self.assertSetEqual(self.f.search('dry ice'), {1})
+        self.assertIsNone(self.f.cas('dry ice'))
+        self.f.merge('carbon dioxide', 'dry ice')
+        self.assertEqual(self.f.cas('dry ice'), '000124-38-9')
+        self.assertEqual(self.f.name('dry ice'), 'carbon dioxide')
+        self.f.set_name('CO2')
+        self.assertEqual(self.f.name('dry ice'), 'CO2')
+        self.assertIn('dry ice', self.f.synonyms_for('CO2'))
+        self.f.split_term('dry ice')
+        self.assertNotIn('dry ice', self.f.synonyms_for('CO2'))
+        self.assertEqual(self.f.name('dry ice'), 'dry ice')
+        self.assertEqual(self.f.cache_stats()['hits'], 0)
+
+    def test_sqlite_rollback(self):
+        f = SqliteSynList(':memory:', query_cache=16)
+        f.add_set(('Zeke', 'your cousin'))
+        f.commit()
+        with self.assertRaises(ValueError):
+            with f.transaction():
+                f.set_name('your cousin')
+                self.assertEqual(f.name('Zeke'), 'your cousin')
+                raise ValueError
+        self.assertEqual(f.name('Zeke'), 'Zeke')
+
+
+class InstrumentTest(unittest.TestCase):
+    def setUp(self):
+        self.f = Flowables()
+        self.f.add_set(('carbon dioxide', '124-38-9'))
+        self.f.add_set(('CO2', 'carbonic anhydride'))
+
+    def test_disabled(self):
+        self.assertIsNone(self.f.stats())
+        self.assertNotIn('_get_index', self.f.__dict__)
+
+    def test_counters(self):
+        calls = []
+        self.f.instrument(callback=lambda op, seconds: calls.append(op))
+        self.f.index('Carbon Dioxide')
+        self.f.index('CH4')
+        with self.assertRaises(KeyError):
+            self.f.name('methane')
+        counters = self.f.stats()['counters']
+        self.assertEqual((counters['hits'], counters['misses']), (1, 2))
+        self.f.merge('CO2', 'carbon dioxide')
+        self.f.add_set(('water', '7732-18-5'))
+        stats = self.f.stats(reset=True)
+        counters = stats['counters']
+        self.assertEqual(counters['merges'], 1)
+        self.assertEqual(counters['merge_rewrites'], 2)
+        self.assertEqual(counters['cas_parses'], 5)  # one in the merge; add_set parses each term to check, then to add
+        self.assertEqual(counters['hits'] + counters['misses'],
+                         stats['latency']['_get_index']['count'] + stats['latency']['_find']['count'])
+        self.assertEqual(stats['latency']['merge']['count'], 1)
+        self.assertIn('merge', calls)
+        self.assertEqual(self.f.stats()['counters']['hits'], 0)
+        self.f.uninstrument()
+        self.assertIsNone(self.f.stats())
+        self.assertEqual(self.f.index('water'), 2)
+        self.assertNotIn('merge', self.f.__dict__)
+
+    def test_set_name(self):
+        self.f.instrument()
+        self.f.set_name('000124-38-9')
+        self.assertEqual(self.f.name('carbon dioxide'), '000124-38-9')
+        counters = self.f.stats()['counters']
+        self.assertEqual((counters['hits'], counters['misses']), (2, 0))
+
+    def test_pickle(self):
+        self.f.instrument()
+        copy = pickle.loads(pickle.dumps(self.f))
+        self.assertIsNone(copy.stats())
+        self.assertEqual(copy.cas('carbon dioxide'), '000124-38-9')
+        self.assertEqual(self.f.freeze().index('co2'), 1)
+        self.assertIsNotNone(self.f.stats())
+
+
+class CompactTest(unittest.TestCase):
+    def _merged(self, cls, **kwargs):
+        s = cls(**kwargs)
+        for i in range(6):
+            s.add_set(('term %d' % i, 'alias %d' % i))
+        s.merge('term 0', 'term 2')
+        s.merge('term 5', 'alias 3')
+        return s
+
+    def test_compact(self):
+        for kwargs in ({}, {'union_find': True}):
+            s = self._merged(SynList, **kwargs)
+            s.set_entity('term 4', 'four')
+            self.assertEqual(len(s), 4)
+            names = dict((i, s.name('alias %d' % i)) for i in range(6))
+            self.assertListEqual(s.compact(), [0, 1, None, None, 2, 3])
+            self.assertEqual(len(s), 4)
+            self.assertEqual(len(s._list), 4)
+            for i in range(6):
+                self.assertEqual(s.name('alias %d' % i), names[i])
+            self.assertEqual(s.index('alias 3'), 3)
+            self.assertEqual(s.entity('term 4'), 'four')
+            self.assertListEqual(s.compact(), [0, 1, 2, 3])
+            self.assertEqual(s.new_item(), 4)
+            self.assertEqual(len(s), 5)
+
+    def test_flowables(self):
+        f = self._merged(Flowables)
+        f.add_set(('carbon dioxide', '124-38-9'))
+        f.add_set(('CO2',))
+        f.merge('carbon dioxide', 'CO2')
+        self.assertListEqual(f.compact(), [0, 1, None, None, 2, 3, 4, None])
+        self.assertEqual(f.by_cas('124-38-9'), 4)
+        self.assertEqual(f.cas('CO2'), '000124-38-9')
+        self.assertEqual(f.index('co2'), 4)
+
+    def test_sqlite(self):
+        for cls in (SqliteSynList, SqliteFlowables):
+            s = self._merged(cls, path=':memory:')
+            s.add_set(('carbon dioxide', '124-38-9'))
+            self.assertEqual(s.index('alias 5'), 5)
+            self.assertListEqual(s.compact(), [0, 1, None, None, 2, 3, 4])
+            self.assertEqual(len(s), 5)
+            self.assertEqual(s.index('alias 5'), 3)
+            self.assertEqual(s.index('alias 3'), 3)
+            self.assertSetEqual(s.synonym_set(3), {'term 5', 'alias 5', 'term 3', 'alias 3'})
+            self.assertEqual(s.name('124-38-9'), 'carbon dioxide')
+            self.assertEqual(s.new_item(), 5)
+            s.close()
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 's')
+            s = self._merged(SynList)
+            s.to_directory(path)
+            s = SynList.from_directory(path)
+            s.merge('term 1', 'term 4')
+            s.compact()
+            s.save()
+            t = SynList.from_directory(path)
+            self.assertEqual(len(t), 3)
+            self.assertEqual(t.name('alias 4'), 'term 1')
+            self.assertEqual(t.name('alias 2'), 'term 0')
+
+
+class MoveTest(unittest.TestCase):
+    def test_detach(self):
+        s = SynList(ignore_case=True)
+        s.add_set(['Zeke'] + ['alias %d' % i for i in range(100)] + ['your cousin', 'Your Cousin'])
+        new = s.detach('YOUR COUSIN')
+        self.assertEqual(s.name('your cousin'), 'Your Cousin')  # a term it holds, not the query
+        self.assertSetEqual(s.synonym_set(new), {'your cousin', 'Your Cousin'})
+        self.assertEqual(len(s.synonym_set(0)), 101)
+        s.add_synonym(0, 'Alias X')
+        s.add_synonym(0, 'alias x')
+        s.add_set(('houdini', 'Alias Y'))
+        s.merge('Zeke', 'houdini')
+        self.assertEqual(s.detach('ALIAS X'), 3)
+        self.assertSetEqual(s.synonym_set(3), {'Alias X', 'alias x'})
+        self.assertSetEqual(s.synonym_set(s.detach('alias y')), {'Alias Y'})
+        with self.assertRaises(CannotSplitName):
+            s.detach('zeke')
+        self.assertSetEqual(s._term_map(0)['houdini'], {'houdini'})
+
+    def test_detach_only_key(self):
+        for s, query in ((Flowables(), 'ice'), (SynList(), 'your cousin')):
+            s.add_set(['water', 'Ice'] if query == 'ice' else ['Zeke', ' your cousin '])
+            new = s.detach(query)
+            self.assertIn(s.name(new), s.synonym_set(new))
+            with self.assertRaises(CannotSplitName):
+                s.detach(query)
+            self.assertEqual(len(s), 2)
+            self.assertTrue(all(i['synonyms'] for i in s.serialize()[s.__class__.__name__]))
+
+    def test_move(self):
+        s = SynList()
+        s.add_set(('Zeke', 'your cousin', 'Ezekiel'))
+        s.add_set(('Henry VII', 'Harry'))
+        self.assertEqual(s.move('your cousin', 'Harry'), 1)
+        self.assertEqual(s.name('your cousin'), 'Henry VII')
+        self.assertSetEqual(s.synonym_set(0), {'Zeke', 'Ezekiel'})
+        self.assertEqual(s.move('your cousin', 'Harry'), 1)
+        with self.assertRaises(CannotSplitName):
+            s.move('Zeke', 'Harry')
+        with self.assertRaises(KeyError):
+            s.move('Ezekiel', 'nobody')
+        self.assertListEqual(s.compact(), [0, 1])
+        s.move('Ezekiel', 'Henry VII')
+        self.assertSetEqual(s.synonym_set(1), {'Henry VII', 'Harry', 'your cousin', 'Ezekiel'})
+
+    def test_flowables(self):
+        for f in (Flowables(), SqliteFlowables(':memory:')):
+            f.add_set(('carbon dioxide', '000124-38-9', 'CO2'))
+            f.add_set(('ethanol', '64-17-5'))
+            new = f.detach('124-38-9')
+            self.assertEqual(f.by_cas('124-38-9'), new)
+            self.assertEqual(f.cas('000124-38-9'), '000124-38-9')
+            self.assertIsNone(f.cas('CO2'))
+            self.assertSetEqual(f.synonym_set(new), {'000124-38-9', '124-38-9'})
+            self.assertSetEqual(f.synonym_set(0), {'carbon dioxide', 'CO2'})
+            with self.assertRaises(CannotSplitName):
+                f.move('124-38-9', 'co2')
+            f.add_synonym(new, 'dry ice')
+            with self.assertRaises(ConflictingCas):
+                f.move('124-38-9', 'ethanol')
+            f.move('124-38-9', 'co2')
+            self.assertEqual(f.cas('carbon dioxide'), '000124-38-9')
+            self.assertEqual(f.index('124-38-9'), 0)
+            f.move('co2', 'ethanol')
+            self.assertEqual(f.name('co2'), 'ethanol')
+
+
+class DiffPatchTest(unittest.TestCase):
+    @staticmethod
+    def _state(s):
+        return sorted((s.name(i), sorted(s.synonym_set(i)), s.cas(i) if isinstance(s, Flowables) else None)
+                      for i in range(len(s._list)) if s._list[i] is not None)
+
+    def _check(self, old, new, make):
+        copy = make()
+        copy.apply_patch(json.loads(json.dumps(old.diff(new))))
+        self.assertListEqual(self._state(copy), self._state(new))
+
+    def test_remove_term(self):
+        s = SynList(ignore_case=True, prefix_index=True, fuzzy_index=True)
+        s.add_set(('Zeke', 'your cousin', 'Your Cousin'))
+        s.add_set(('Henry VII', 'Harry'))
+        s.remove_term('Your Cousin')
+        self.assertEqual(s.index('your cousin'), 0)
+        s.remove_term('your cousin')
+        self.assertIsNone(s.index('your cousin'))
+        self.assertListEqual(s.complete('you'), [])
+        self.assertListEqual(s.closest('your cousn'), [])
+        with self.assertRaises(CannotSplitName):
+            s.remove_term('Henry VII')
+        with self.assertRaises(KeyError):
+            s.remove_term('YOUR COUSIN')
+        s.remove_term('Harry')
+        s.remove_term('Henry VII')
+        self.assertEqual(len(s), 1)
+        self.assertListEqual(s.compact(), [0, None])
+        s.add_set(['x', ' tau '])
+        s.set_name('tau')
+        with self.assertRaises(CannotSplitName):
+            s.remove_term(' tau ')  # the last spelling of the name's key
+
+    def test_remove_cas(self):
+        f = Flowables()
+        f.add_set(('carbon dioxide', '124-38-9', 'CO2'))
+        f.remove_term('000124-38-9')
+        self.assertIsNone(f.cas('carbon dioxide'))
+        self.assertIsNone(f.index('124-38-9'))
+        self.assertIsNone(f.by_cas('124-38-9'))
+        self.assertSetEqual(f.synonym_set(0), {'carbon dioxide', 'CO2'})
+
+    def test_set_cas(self):
+        f = Flowables()
+        f.add_set(('carbon dioxide', '124-38-9'))
+        f.add_set(('dry ice', '000124-38-9x'))
+        f.add_set(('ethanol', '64-17-5'))
+        f.merge('carbon dioxide', 'ethanol', multi_cas=True)
+        self.assertEqual(f.set_cas('ethanol', '64-17-5'), 0)
+        self.assertEqual(f.cas('carbon dioxide'), '000064-17-5')
+        with self.assertRaises(KeyError):
+            f.set_cas('carbon dioxide', '7732-18-5')
+        f.set_cas(0, None)
+        self.assertIsNone(f.cas('carbon dioxide'))
+
+    def test_synlist(self):
+        for ignore_case in (False, True):
+            old = SynList.from_json(dict(json.loads(synlist_json), ignore_case=ignore_case))
+            old.add_set(('Harry Houdini', 'Ehrich Weisz'))
+            old.add_set(('Bess', 'Wilhelmina Beatrice Rahner'))
+            new = SynList.from_json(dict(json.loads(synlist_json), ignore_case=ignore_case))
+            new.add_set(('Harry Houdini', 'Ehrich Weisz'))
+            new.merge('The Great Houdini', 'Harry Houdini')
+            new.detach('your cousin')
+            new.move('Henry VII', 'Zeke')
+            new.set_name('Ehrich Weisz')
+            new.add_synonyms('your cousin', 'Cousin Zeke', 'COUSIN ZEKE')
+            new.add_set(('Theo', 'Theodore Hardeen'))
+            new.remove_term('Arthur the Great')
+
+            def make():
+                s = SynList.from_json(dict(json.loads(synlist_json), ignore_case=ignore_case))
+                s.add_set(('Harry Houdini', 'Ehrich Weisz'))
+                s.add_set(('Bess', 'Wilhelmina Beatrice Rahner'))
+                return s
+            self._check(old, new, make)
+            self.assertListEqual(old.diff(old), [])
+
+    def test_flowables(self):
+        def make():
+            f = Flowables()
+            f.add_set(('carbon dioxide', '124-38-9', 'CO2'))
+            f.add_set(('dry ice', 'CO2 (solid)'))
+            f.add_set(('ethanol', '64-17-5'))
+            f.add_set(('water', '7732-18-5'))
+            return f
+        old = make()
+        new = make()
+        new.merge('dry ice', 'carbon dioxide', multi_cas=True)
+        new.detach('64-17-5')
+        new.merge('water', '64-17-5', multi_cas=True)
+        new.set_cas('water', '64-17-5')
+        new.add_synonyms('ethanol', '50-00-0')
+        new.add_set(('methane', '74-82-8'))
+        self._check(old, new, make)
+
+    def test_journal(self):
+        old = SynList()
+        old.add_set(('The Great Houdini', 'Henry VII', 'Arthur the Great'))
+        old.add_set(('Zeke', 'zeke', 'your cousin'))
+        new = SynList.from_json(old.serialize())
+        new.merge('Zeke', 'Henry VII')
+        new.remove_term('your cousin')
+        with tempfile.TemporaryDirectory() as d:
+            with Journal(d) as j:
+                j.add_set(('The Great Houdini', 'Henry VII', 'Arthur the Great'))
+                j.add_set(('Zeke', 'zeke', 'your cousin'))
+                j.apply_patch(old.diff(new))
+            with Journal(d) as j:
+                self.assertListEqual(self._state(j.synlist), self._state(new))
+
+
+class ResolveTest(unittest.TestCase):
+    terms = ['CO2', 'water', 'argon', '124-38-9', 'co2', '', 'Water', 'CO2', None, 'dry ice']
+
+    def setUp(self):
+        self.flowables = Flowables()
+        self.flowables.add_set(('carbon dioxide', '124-38-9', 'CO2', 'dry ice'))
+        self.flowables.add_set(('water', '7732-18-5'))
+        self.expected = [(self.flowables.name(t), self.flowables.cas(t)) if self.flowables.index(t) is not None
+                         else (None, None) for t in self.terms]
+
+    def _rows(self):
+        return ({'id': n, 'flowable': t} for n, t in enumerate(self.terms))
+
+    def test_serial(self):
+        for chunk_size in (1, 3, 100):
+            for cache_size in (0, 2):
+                rows = list(resolve(self._rows(), self.flowables, 'flowable', chunk_size=chunk_size,
+                                    cache_size=cache_size))
+                self.assertListEqual([r['id'] for r in rows], list(range(len(self.terms))))
+                self.assertListEqual([(r['name'], r['cas']) for r in rows], self.expected)
+
+    def test_bounded(self):
+        read = []
+
+        def rows():
+            for n in range(1000):
+                read.append(n)
+                yield {'flowable': self.terms[n % len(self.terms)]}
+        for kwargs, most in (({}, 10), ({'workers': 2, 'in_flight': 3}, 30)):
+            del read[:]
+            stream = resolve(rows(), self.flowables, 'flowable', chunk_size=10, **kwargs)
+            self.assertEqual(next(stream)['name'], 'carbon dioxide')
+            self.assertLessEqual(len(read), most)
+            self.assertEqual(sum(1 for _ in stream), 999)
+            stream.close()
+
+    def test_fields(self):
+        rows = resolve(([n, t] for n, t in enumerate(self.terms)), self.flowables, 1, fields={'cas_name': 'cas_name'})
+        self.assertListEqual(next(rows), [0, 'CO2', '124-38-9'])
+        self.assertListEqual(next(rows), [1, 'water', '7732-18-5'])
+        self.assertListEqual(next(rows), [2, 'argon', None])
+        s = SynList.from_json(json.loads(synlist_json))
+        self.assertListEqual(list(resolve([{'who': 'zeke'}, {}], s, 'who')), [{'who': 'zeke', 'name': 'Zeke'},
+                                                                               {'name': None}])
+
+    def test_cache_sees_changes(self):
+        rows = resolve(({'flowable': 'ice'} for _ in range(4)), self.flowables, 'flowable', chunk_size=1)
+        self.assertIsNone(next(rows)['name'])
+        self.flowables.add_synonym(1, 'ice')
+        self.assertEqual(next(rows)['name'], 'water')
+
+    def test_workers(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'flowables.bin')
+            self.flowables.to_binary(path)
+            with Flowables.open_binary(path) as m:
+                for lookup in (self.flowables, m):
+                    rows = list(resolve(self._rows(), lookup, 'flowable', chunk_size=2, workers=2, in_flight=2))
+                    self.assertListEqual([(r['name'], r['cas']) for r in rows], self.expected)
+
+    def test_files(self):
+        for fmt in ('csv', 'jsonl'):
+            source = io.StringIO(newline='')
+            write_rows(source, ({'id': r['id'], 'flowable': r['flowable'] or ''} for r in self._rows()), fmt=fmt)
+            source.seek(0)
+            out = io.StringIO(newline='')
+            self.assertEqual(write_rows(out, resolve(read_rows(source, fmt=fmt), self.flowables, 'flowable'), fmt=fmt),
+                             len(self.terms))
+            out.seek(0)
+            rows = list(read_rows(out, fmt=fmt))
+            self.assertEqual(rows[3]['cas'], '000124-38-9')
+            self.assertEqual(rows[6]['name'], 'water')
+            self.assertIn(rows[2]['name'], ('', None))
+        with self.assertRaises(ValueError):
+            read_rows(io.StringIO(), fmt='xml')
+
+
+class LexicalIndexTest(unittest.TestCase):
+    """
+    search() with a lexical index must return exactly what a full scan returns
+    """
+    patterns = ('houdini', 'Great', 'the', 'your cousin z', 'ze', 'gr.at', '^the', 'ri+ble', 'h(enry|arry)',
+                'zeke|houdini', 'bad$', 'very-?bad', r'\bcousin\b', 'x{0,2}eke', r'\x41pple', r'App\x6ce', r'\101pple',
+                'nothing like this')
+
+    def setUp(self):
+        self.plain = SynList.from_json(json.loads(synlist_json))
+        self.indexed = SynList.from_json(json.loads(synlist_json), lexical_index=True)
+
+    def test_literal_fragments(self):
+        self.assertListEqual(literal_fragments('abc*def'), ['ab', 'def'])
+        self.assertListEqual(literal_fragments('ab+c'), ['ab', 'c'])
+        self.assertListEqual(literal_fragments(r'a\.b(cde)?f'), ['a.b', 'f'])
+        self.assertListEqual(literal_fragments('[xyz]abc{2}d'), ['abc', 'd'])
+        self.assertIsNone(literal_fragments('abc|def'))
+        self.assertListEqual(literal_fragments(r'\x41pple'), ['pple'])
+        self.assertListEqual(literal_fragments(r'(a)\1pple'), ['pple'])
+
+    def test_search_agrees(self):
+        for s in (self.plain, self.indexed):
+            s.add_set(('Apple', 'Pomme'))
+        for p in self.patterns:
+            self.assertSetEqual(self.indexed.search(p), self.plain.search(p), p)
+
+    def test_search_after_merge(self):
+        for s in (self.plain, self.indexed):
+            s.add_set(('Harry Houdini', 'Ehrich Weisz'))
+            s.merge('Zeke', 'Harry Houdini')
+        self.assertSetEqual(self.indexed.search('weisz'), {1})
+        self.assertSetEqual(self.indexed.search('h(enry|arry)'), self.plain.search('h(enry|arry)'))
+
+    def test_flowables_search(self):
+        f = Flowables(lexical_index=True)
+        f.add_set(('Carbon dioxide', 'CO2', '124-38-9'))
+        self.assertSetEqual(f.search('dioxide'), {0})
+        self.assertSetEqual(f.search('124-38'), {0})
+        self.assertSetEqual(f.search('co2'), {0})
+
+
 if __name__ == '__main__':
     unittest.main()